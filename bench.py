@@ -0,0 +1,1853 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+main.py 的性能基准（仅依赖标准库）
+
+用法：
+  python bench.py            运行全部基准
+  python bench.py startup    只运行指定基准（import 耗时与 CLI 进程冷启动）
+  python bench.py config_read   大型/非 UTF-8 配置文件上的 read_current_index_url
+  python bench.py config_write  write_pip_config 吞吐量（有变化 / 无变化 / fsync）
+  python bench.py batch      write_configs_parallel / --batch 的摘要（有变化、内容相同不重写、写入失败）
+  python bench.py config_roundtrip  多镜像配置（主源 + extra-index-url）写入后读回的一致性检查
+  python bench.py language   detect_language() 与 t() 的单次调用开销
+  python bench.py mirrors    本地桩服务器上并发校验并连通注册表中的全部镜像
+  python bench.py registry   临时 JSON 注册表文件：按 id / URL 覆盖、停用、地区与标签过滤、无法解析的条目
+  python bench.py benchmark  benchmark_mirrors 在本地替身镜像（快 / 注入延迟 / 超时 / 503 / 拒绝连接）上的排名与故障处理
+  python bench.py parser     流式索引解析 vs 整页解析（合成的 50k 文件项目页）
+  python bench.py freshness  check_freshness 在内容不同的本地假索引上的缺失文件、固定版本、同步延迟与连接数检查
+  python bench.py prefetch   并行预取 vs 单连接下载（限速的本地假镜像），并验证续传与哈希校验
+  python bench.py pip_cache  合成的 20 万文件 pip 缓存上的扫描（含模拟网络盘上的串行/并行对比）、统计与 LRU 淘汰
+  python bench.py replay     从合成 pip 日志解析请求序列，在快/限速两个本地镜像上以 1/8/32 并发回放
+  python bench.py fleet      8 个进程同时写入 SQLite 与 JSON Lines 两种集群存储，验证无丢失、无损坏
+  python bench.py proxy      --serve 缓存代理在本地假上游上的离线检查（ETag 重新验证、流式转发、LRU 淘汰、上游下线）
+  python bench.py watch      --watch 的切换决策（余量、连续轮数、回落与不可达时重新计数），按脚本给出探测结果
+  python bench.py failover   多上游故障转移：未同步（404）/ 503 镜像的转移与熔断、慢镜像上的对冲请求
+  python bench.py pool       共享连接池 vs 每次新建连接（本地 TLS 桩服务器上的握手次数与延迟；需要 openssl）
+  python bench.py metrics    一次 HTTPS 请求后的 /metrics 文本与 --metrics-json 快照（各阶段的指标名与次数；需要 openssl）
+
+选项：
+  --json              以 JSON 输出全部结果
+  --save=FILE         把结果保存为基线
+  --compare=FILE      与基线比较，耗时类指标（*_ms / *_us / *_kib）变慢超过容忍度即失败
+  --tolerance=PCT     比较时的容忍度（默认 50%，微基准在共享机器上波动较大）
+
+任一基准的断言失败或出现回归时以非零状态退出。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+# 无界面冷启动预算（毫秒），可用环境变量 BENCH_STARTUP_BUDGET_MS 覆盖
+STARTUP_BUDGET_MS = float(os.environ.get("BENCH_STARTUP_BUDGET_MS", "250"))
+STARTUP_RUNS = 5
+COMPARE_TOLERANCE = 50.0   # 与基线比较时允许的变慢百分比
+
+# ================== 冷启动 ==================
+def _importtime(code):
+    """
+    以 -X importtime 运行一段代码，返回 ({模块名: 累计微秒}, 墙钟毫秒)
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        try:
+            modules[parts[2]] = int(parts[1])
+        except (IndexError, ValueError):
+            continue
+    return modules, wall_ms
+
+def bench_startup():
+    """
+    命令行路径的冷启动：导入 main 并调用一次 t()，
+    不得导入 tkinter（PipMirrorGUI 仍是普通的类，创建窗口时才导入），
+    main 的累计导入耗时（取多次最小值）不得超过预算
+    """
+    code = "import main; assert isinstance(main.PipMirrorGUI, type); main.t('cli.title')"
+    best_ms, wall = None, None
+    for _ in range(STARTUP_RUNS):
+        modules, wall_ms = _importtime(code)
+        tk_modules = sorted(m for m in modules if m.split(".")[0] in ("tkinter", "_tkinter"))
+        assert not tk_modules, "headless start imported {0}".format(", ".join(tk_modules))
+        ms = modules.get("main", 0) / 1000.0
+        if best_ms is None or ms < best_ms:
+            best_ms, wall = ms, wall_ms
+    assert best_ms <= STARTUP_BUDGET_MS, \
+        "import main took {0:.1f} ms (budget {1:.0f} ms)".format(best_ms, STARTUP_BUDGET_MS)
+    # 完整的 CLI 进程：解释器启动 + 导入 + 读取注册表并输出（临时 HOME，不读用户配置）
+    home = tempfile.mkdtemp(prefix="bench-home-")
+    env = dict(os.environ, HOME=home, APPDATA=home)
+    cli_runs = []
+    try:
+        for _ in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(HERE, "main.py"), "--list-mirrors", "--json"],
+                           cwd=HERE, env=env, stdout=subprocess.PIPE, check=True)
+            cli_runs.append((time.perf_counter() - start) * 1000)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return {"import_main_ms": round(best_ms, 2), "process_wall_ms": round(wall, 2),
+            "cli_list_mirrors_ms": round(min(cli_runs), 2)}
+
+# ================== 配置读写 ==================
+CONFIG_FILLER_SECTIONS = 2000    # 大型配置：[global] 之前的无关小节数
+
+def _per_call_us(func, min_time=0.2, repeat=3):
+    """单次调用耗时（微秒）：自动确定循环次数，取多轮中的最小值"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def make_config_text(filler=CONFIG_FILLER_SECTIONS, index_url="https://mirrors.example.com/pypi/simple/"):
+    """大型 pip 配置：大量无关小节与注释，末尾才是 [global]，含非 ASCII 注释"""
+    rows = []
+    for i in range(filler):
+        rows.append("# 第 {0} 节：内部工具设置 ünïcödé".format(i))
+        rows.append("[tool{0}]".format(i))
+        rows.append("option-{0} = value {0}".format(i))
+    rows += ["[global]", "index-url = " + index_url, "timeout = 30", ""]
+    return "\n".join(rows)
+
+def bench_config_read():
+    """
+    read_current_index_url 在小型、大型 UTF-8、带 BOM、GBK 编码（需回退解码）的配置上的单次耗时；
+    *_us 每次先丢弃解析缓存（首次读取），*_cached_us 为文件未变化时的重复读取
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-config-")
+    url = "https://mirrors.example.com/pypi/simple/"
+    small = "[global]\nindex-url = {0}\n".format(url)
+    variants = (("small_utf8", small.encode("utf-8")),
+                ("large_utf8", make_config_text().encode("utf-8")),
+                ("large_utf8_bom", b"\xef\xbb\xbf" + make_config_text().encode("utf-8")),
+                ("large_gbk", make_config_text().encode("gbk", "replace")),
+                ("missing", None))
+    results = {}
+    try:
+        for name, data in variants:
+            path = os.path.join(tmp, name + ".conf")
+            if data is not None:
+                with open(path, "wb") as f:
+                    f.write(data)
+                assert main.read_current_index_url(path) == url, name
+            def cold():
+                main.forget_config_file(path)
+                return main.read_current_index_url(path)
+            results[name + "_us"] = round(_per_call_us(cold), 1)
+            if name in ("small_utf8", "large_utf8"):
+                results[name + "_cached_us"] = round(_per_call_us(lambda: main.read_current_index_url(path)), 1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+CONFIG_WRITE_FILES = 500
+
+def bench_config_write():
+    """
+    write_pip_config 的吞吐量：新文件、内容不变（应跳过写盘）、带 fsync；
+    大文件（UTF-8 与 GBK）上反复切换，切回原镜像后文件逐字节还原
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-write-")
+    paths = [os.path.join(tmp, "h{0}".format(i), "pip.conf") for i in range(CONFIG_WRITE_FILES)]
+    results = {"files": CONFIG_WRITE_FILES}
+    try:
+        for label, url, fsync in (("new", "https://a.example/simple/", False),
+                                  ("unchanged", "https://a.example/simple/", False),
+                                  ("changed_fsync", "https://b.example/simple/", True)):
+            start = time.perf_counter()
+            changed = sum(1 for p in paths if main.write_pip_config(p, url, fsync=fsync))
+            elapsed = time.perf_counter() - start
+            assert changed == (0 if label == "unchanged" else len(paths)), (label, changed)
+            results[label + "_per_file_us"] = round(elapsed / len(paths) * 1e6, 1)
+        urls = ["https://a.example/simple/", "https://b.example/simple/"]
+        for label, enc in (("large_merge_us", "utf-8"), ("large_gbk_merge_us", "gbk")):
+            large = os.path.join(tmp, "large-{0}.conf".format(enc))
+            original = make_config_text().encode(enc, "replace")
+            with open(large, "wb") as f:
+                f.write(original)
+            state = {"i": 0}
+            def flip():
+                state["i"] += 1
+                main.write_pip_config(large, urls[state["i"] % 2], fsync=False)
+            results[label] = round(_per_call_us(flip), 1)
+            main.write_pip_config(large, "https://mirrors.example.com/pypi/simple/", fsync=False)
+            with open(large, "rb") as f:
+                assert f.read() == original, label
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+BATCH_TARGETS = 100   # 每类目标的数量：已是目标配置 / 需要修改 / 新建
+BATCH_FAILED = 5
+BATCH_URL = "https://a.example/simple/"
+BATCH_EXTRAS = ["https://b.example/simple/"]
+
+def _make_batch_targets(main, tmp):
+    """
+    unchanged：已是目标配置（mtime 调回一小时前，用来确认没有重写）；changed：指向其他镜像或尚不存在；
+    failed：父路径是普通文件，无法创建目录。返回 {类别: [目标]}，目标为配置文件或主目录
+    """
+    targets = {"unchanged": [], "changed": [], "failed": []}
+    old = time.time() - 3600
+    for i in range(BATCH_TARGETS):
+        path = os.path.join(tmp, "same{0}".format(i), "pip.conf")
+        main.write_pip_config(path, BATCH_URL, BATCH_EXTRAS, fsync=False)
+        os.utime(path, (old, old))
+        targets["unchanged"].append(path)
+        path = os.path.join(tmp, "other{0}".format(i), "pip.conf")
+        main.write_pip_config(path, "https://c.example/simple/", fsync=False)
+        targets["changed"].append(path)
+        # 主目录形式的目标，按 linux 布局解析为 HOME/.config/pip/pip.conf
+        targets["changed"].append(os.path.join(tmp, "home{0}".format(i)))
+    for i in range(BATCH_FAILED):
+        blocker = os.path.join(tmp, "blocker{0}".format(i))
+        with open(blocker, "w") as f:
+            f.write("not a directory\n")
+        targets["failed"].append(os.path.join(blocker, "pip.conf"))
+    return targets
+
+def bench_batch():
+    """
+    write_configs_parallel / --batch 在已是目标配置、需要修改与无法写入的目标上的摘要：
+    相同内容的文件不重写（mtime 不变），失败的目标带错误信息，重复目标只写一次；
+    再以子进程运行 --batch --targets-file 检查 JSON 摘要与退出码
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-batch-")
+    settings = {"index_url": BATCH_URL, "extra_index_urls": BATCH_EXTRAS}
+    results = {"targets": BATCH_TARGETS * 3 + BATCH_FAILED}
+    try:
+        targets = _make_batch_targets(main, os.path.join(tmp, "direct"))
+        expected = {k: [str(main.resolve_batch_target(x, "linux")) for x in v] for k, v in targets.items()}
+        paths = [main.resolve_batch_target(x, "linux") for x in sum(targets.values(), [])]
+        mtimes = {p: os.stat(p).st_mtime_ns for p in expected["unchanged"]}
+        start = time.perf_counter()
+        summary = main.write_configs_parallel(paths + paths[:10], settings, fsync=False)
+        results["parallel_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        assert sorted(summary["changed"]) == sorted(expected["changed"]), len(summary["changed"])
+        assert sorted(summary["unchanged"]) == sorted(expected["unchanged"]), len(summary["unchanged"])
+        assert sorted(f["path"] for f in summary["failed"]) == sorted(expected["failed"]), summary["failed"]
+        assert all(f["error"] for f in summary["failed"]), summary["failed"]
+        assert all(os.stat(p).st_mtime_ns == mtimes[p] for p in expected["unchanged"])
+        for path in expected["changed"]:
+            main.forget_config_file(path)
+            info = main.read_pip_index_config(path)
+            assert info["index_url"] == BATCH_URL and info["extra_index_urls"] == BATCH_EXTRAS, (path, info)
+
+        # 第二遍：全部已是目标配置
+        start = time.perf_counter()
+        again = main.write_configs_parallel(paths, settings, fsync=False)
+        results["rerun_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        assert not again["changed"] and len(again["unchanged"]) == BATCH_TARGETS * 3, again["changed"]
+
+        targets = _make_batch_targets(main, os.path.join(tmp, "cli"))
+        targets_file = os.path.join(tmp, "targets.txt")
+        with open(targets_file, "w", encoding="utf-8") as f:
+            f.write("# 注释与空行会被跳过\n\n" + "\n".join(sum(targets.values(), [])) + "\n")
+        proc = subprocess.run([sys.executable, os.path.join(HERE, "main.py"), "--batch", "--url=" + BATCH_URL,
+                               "--extra=" + ",".join(BATCH_EXTRAS), "--targets-file=" + targets_file,
+                               "--layout=linux", "--no-fsync"],
+                              stdout=subprocess.PIPE, universal_newlines=True, timeout=120)
+        assert proc.returncode == 1, proc.returncode
+        cli = json.loads(proc.stdout)
+        assert cli["counts"] == {"changed": BATCH_TARGETS * 2, "unchanged": BATCH_TARGETS,
+                                 "failed": BATCH_FAILED}, cli["counts"]
+        assert sorted(cli["unchanged"]) == sorted(targets["unchanged"]), cli["unchanged"][:3]
+        assert sorted(f["path"] for f in cli["failed"]) == sorted(targets["failed"]), cli["failed"]
+        assert isinstance(cli["elapsed"], float), cli
+        results["cli_elapsed_ms"] = round(cli["elapsed"] * 1000, 1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+ROUNDTRIP_BASE = """# 团队共享的 pip 配置
+[global]
+index_url = http://old.example/simple/
+trusted-host = old.example internal.example
+timeout = 15
+# 下面这行不属于下载源设置
+no-cache-dir = false
+
+[install]
+user = true
+"""
+
+def _check_cli_keeps_fallbacks(main, home):
+    """在独立的 HOME 中运行 --cli：依次选择第 2 个镜像并恢复官方源，extra-index-url 与 timeout 不变"""
+    env = dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, ".config"), APPDATA=home)
+    env.pop("PIP_CONFIG_FILE", None)
+    cfg_path = subprocess.check_output(
+        [sys.executable, "-c", "import main; print(main.get_user_pip_config_path())"],
+        cwd=HERE, env=env, universal_newlines=True).strip()
+    fallbacks = ["https://b.example/simple/", "http://a.example/simple/"]
+    main.write_pip_config(cfg_path, "https://c.example/simple/", fallbacks, timeout=7, retries=2)
+    expected_urls = [main.get_registry()[1].url, main.DEFAULT_URL]
+    for choice, url in zip(("2", "r"), expected_urls):
+        subprocess.run([sys.executable, os.path.join(HERE, "main.py"), "--cli"], input=choice + "\nq\n",
+                       cwd=HERE, env=env, universal_newlines=True, stdout=subprocess.DEVNULL, timeout=60,
+                       check=True)
+        main.forget_config_file(cfg_path)
+        info = main.read_pip_index_config(cfg_path)
+        assert info["index_url"] == url, (choice, info)
+        assert info["extra_index_urls"] == fallbacks and (info["timeout"], info["retries"]) == (7, 2), (choice, info)
+
+def bench_config_roundtrip():
+    """
+    多镜像配置的往返检查：按测速评分（而非列表顺序）生成主源 + extra-index-url，写入后经
+    read_pip_index_config / read_current_index_url 读回必须一致；http 主机都加入 trusted-host，
+    旧镜像的主机移除，注释与其他节原样保留，重复写入不改动文件，手写的多行/空白分隔写法也能读取；
+    交互式命令行切换镜像时保留备用源；
+    带 BOM 的 UTF-8 / UTF-16 与 GBK 文件按原编码写回，除改动的行外逐字节不变
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-roundtrip-")
+    path = os.path.join(tmp, "pip.conf")
+    # 列表顺序与评分顺序相反；d 不可达
+    measured = [
+        {"url": "http://a.example/simple/", "ok": True, "ttfb": 0.30, "project_time": 1.2, "score": 2.0},
+        {"url": "https://b.example/simple/", "ok": True, "ttfb": 0.10, "project_time": 0.5, "score": 1.0},
+        {"url": "http://c.example:8080/simple/", "ok": True, "ttfb": 0.05, "project_time": 0.2, "score": 0.4},
+        {"url": "https://d.example/simple/", "ok": False, "ttfb": None, "project_time": None,
+         "score": float("inf")},
+    ]
+    ranked = sorted(measured, key=lambda r: r["score"])
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(ROUNDTRIP_BASE)
+        plan = main.plan_fallback_config(ranked, 2)
+        assert plan["index_url"] == "http://c.example:8080/simple/", plan
+        assert plan["extra_index_urls"] == ["https://b.example/simple/", "http://a.example/simple/"], plan
+
+        start = time.perf_counter()
+        assert main.write_pip_config(path, **plan)
+        info = main.read_pip_index_config(path)
+        elapsed = time.perf_counter() - start
+        assert main.read_current_index_url(path) == plan["index_url"]
+        assert info["extra_index_urls"] == plan["extra_index_urls"], info
+        assert (info["timeout"], info["retries"]) == (plan["timeout"], plan["retries"]), info
+        assert sorted(info["trusted_hosts"]) == ["a.example", "c.example", "internal.example"], info
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        for line in ("# 团队共享的 pip 配置", "# 下面这行不属于下载源设置", "no-cache-dir = false",
+                     "[install]", "user = true"):
+            assert line in text, line
+        assert "index_url" not in text, text
+        assert sum(1 for line in text.splitlines() if line.startswith("index-url")) == 1, text
+        assert not main.write_pip_config(path, **plan), "unchanged config was rewritten"
+
+        # 只切换主源时保留 extra-index-url 与 timeout/retries
+        main.switch_index_url(path, "https://b.example/simple/")
+        info = main.read_pip_index_config(path)
+        assert info["index_url"] == "https://b.example/simple/", info
+        assert info["extra_index_urls"] == ["http://a.example/simple/"], info
+        assert info["timeout"] == plan["timeout"], info
+
+        # 交互式命令行选镜像、恢复官方源时同样保留备用源
+        _check_cli_keeps_fallbacks(main, os.path.join(tmp, "home"))
+
+        # 不带备用源写入时删除 extra-index-url 及其 trusted-host
+        main.write_pip_config(path, "https://b.example/simple/")
+        info = main.read_pip_index_config(path)
+        assert info["extra_index_urls"] == [] and info["trusted_hosts"] == ["internal.example"], info
+
+        # 手写的多值写法：续行与空白分隔混用
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[global]\nindex-url = https://b.example/simple/\nextra-index-url =\n"
+                    "    https://e.example/simple/ https://f.example/simple/\n    http://g.example/simple/\n")
+        main.forget_config_file(path)
+        info = main.read_pip_index_config(path)
+        assert info["extra_index_urls"] == ["https://e.example/simple/", "https://f.example/simple/",
+                                            "http://g.example/simple/"], info
+
+        # 小数 timeout 原样读回，整数 timeout 写回时不会变成 "6.0"
+        main.write_pip_config(path, "https://b.example/simple/", timeout=0.5)
+        assert main.read_pip_index_config(path)["timeout"] == 0.5
+        main.write_pip_config(path, "https://b.example/simple/", timeout=6)
+        assert main.read_pip_index_config(path)["timeout"] == 6 and "timeout = 6\n" in open(path).read()
+
+        # 编码：按原文件的编码（含 BOM）写回，未改动的行逐字节保持不变
+        comment = "# 团队共享的 pip 配置\n"
+        for label, bom, enc in (("utf8_bom", b"\xef\xbb\xbf", "utf-8"), ("utf16le", b"\xff\xfe", "utf-16-le"),
+                                ("utf16be", b"\xfe\xff", "utf-16-be")):
+            with open(path, "wb") as f:
+                f.write(bom + (comment + "[global]\nindex-url = https://old.example/simple/\n").encode(enc))
+            assert main.write_pip_config(path, "https://b.example/simple/"), label
+            with open(path, "rb") as f:
+                data = f.read()
+            assert data.startswith(bom + comment.encode(enc)), (label, data[:40])
+            assert "index-url = https://b.example/simple/" in data[len(bom):].decode(enc), label
+            main.forget_config_file(path)
+            assert main.read_current_index_url(path) == "https://b.example/simple/", label
+        # GBK：系统编码能解码时按 GBK、否则按 latin-1 兜底写回，两种情况下结果都逐字节一致
+        original = (comment + "[global]\nindex-url = https://old.example/simple/\n").encode("gbk")
+        with open(path, "wb") as f:
+            f.write(original)
+        assert main.write_pip_config(path, "https://b.example/simple/")
+        with open(path, "rb") as f:
+            assert f.read() == original.replace(b"old.example", b"b.example")
+        main.forget_config_file(path)
+        assert main.read_current_index_url(path) == "https://b.example/simple/"
+        assert main.write_pip_config(path, "https://old.example/simple/")
+        with open(path, "rb") as f:
+            assert f.read() == original
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"write_read_us": round(elapsed * 1e6, 1)}
+
+# ================== 语言与翻译 ==================
+def bench_language():
+    """detect_language() 每次都重新检测；t() 走缓存的合并字典"""
+    import main
+    main.get_lang()
+    return {
+        "detect_language_us": round(_per_call_us(main.detect_language), 2),
+        "t_plain_us": round(_per_call_us(lambda: main.t("app.title")), 3),
+        "t_format_us": round(_per_call_us(lambda: main.t("status.current_index", url="https://x/simple/")), 3),
+        "t_missing_us": round(_per_call_us(lambda: main.t("no.such.key")), 3),
+    }
+
+# ================== 镜像校验与连通 ==================
+MIRROR_STUBS = 60              # 模拟约 60 个区域/内部镜像
+MIRROR_STUB_DELAY = 0.02       # 每个桩服务器的响应延迟（秒）
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = b"<html><body></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def bench_mirrors():
+    """
+    注册表中的内置镜像加上若干桩镜像，全部指向本地桩服务器：
+    URL 校验、TCP 预选（preselect_mirrors）与 GUI 后台探测（BackgroundProber）各自的总耗时
+    """
+    import main
+    registry = main.builtin_registry()
+    for i in range(MIRROR_STUBS - len(registry)):
+        registry.add(main.Mirror("stub{0}".format(i), "https://stub{0}.example/simple/".format(i)))
+    servers = []
+    urls = []
+    try:
+        for mirror in registry:
+            server = _ThreadingServer(("127.0.0.1", 0), _StubHandler)
+            server.delay = MIRROR_STUB_DELAY
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            # 保留原 URL 的路径，主机换成本地桩
+            path = main.urlparse(mirror.url).path
+            urls.append("http://127.0.0.1:{0}{1}".format(server.server_address[1], path))
+        results = {"mirrors": len(urls)}
+
+        start = time.perf_counter()
+        assert all(main.is_valid_url(m.url) for m in registry)
+        assert all(registry.find(m.url) is m for m in registry)
+        results["validate_us"] = round((time.perf_counter() - start) * 1e6, 1)
+
+        start = time.perf_counter()
+        pre = main.preselect_mirrors(urls)
+        results["preselect_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        assert all(r["ok"] for r in pre), [r["error"] for r in pre if not r["ok"]]
+
+        prober = main.BackgroundProber()
+        start = time.perf_counter()
+        for idx, url in enumerate(urls):
+            prober.submit(idx, url)
+        done = []
+        while len(done) < len(urls):
+            done += prober.drain()
+            time.sleep(0.005)
+        results["probe_all_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        prober.cancel()
+        assert all(r["ok"] for _, r in done), [r["error"] for _, r in done if not r["ok"]]
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    return results
+
+# ================== 镜像注册表文件 ==================
+REGISTRY_ENTRIES = 500   # 大型注册表文件的条目数（计时用）
+
+REGISTRY_FILE = {"mirrors": [
+    # 按 id 覆盖：替换 URL 与标签，位置与未写出的字段保持不变
+    {"id": "tuna", "url": "https://mirrors.example.edu/pypi/simple/", "tags": ["edu", "internal"]},
+    # 按 URL 覆盖（不带结尾斜杠）：id 与地区保持不变，能力与内置值合并
+    {"url": "https://mirrors.aliyun.com/pypi/simple", "name": "Aliyun (corp)", "capabilities": {"range": True}},
+    # 按 id / URL 停用；停用不存在的镜像不算错误
+    {"id": "zju", "disabled": True},
+    {"url": "https://mirrors.bfsu.edu.cn/pypi/web/simple/", "disabled": True},
+    {"id": "nowhere", "disabled": True},
+    # 新增：没有 id 时以规范化后的 URL 作为 id
+    {"id": "corp", "url": "https://pypi.corp.example/simple/", "region": "internal", "tags": ["corp", "cloud"]},
+    {"url": "https://pypi.lab.example/simple/", "region": "internal"},
+    # 无法解析的条目：记入 errors 后跳过
+    {"id": "bad", "url": "not a url"},
+    "oops",
+]}
+
+def _write_registry(tmp, name, data):
+    path = os.path.join(tmp, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    return path
+
+def _check_registry(main, registry):
+    builtin = main.builtin_registry()
+    assert len(registry.errors) == 2, registry.errors
+    assert "bad" not in [m.id for m in registry] and registry.get("nowhere") is None
+
+    tuna = registry.get("tuna")
+    assert registry.index("https://mirrors.example.edu/pypi/simple") == builtin.index(builtin.get("tuna").url) == 1
+    assert tuna.tags == ("edu", "internal") and tuna.region == "cn", tuna.to_dict()
+    assert registry.find(builtin.get("tuna").url) is None
+
+    aliyun = registry.find("https://mirrors.aliyun.com/pypi/simple/")
+    assert aliyun is registry.get("aliyun") and aliyun.name == "Aliyun (corp)", aliyun.to_dict()
+    assert aliyun.region == "cn" and aliyun.tags == ("cloud",) and aliyun.capabilities["range"] is True
+
+    assert registry.get("zju") is None and registry.get("bfsu") is None
+    assert registry.find("https://mirrors.bfsu.edu.cn/pypi/web/simple/") is None
+    assert len(registry) == len(builtin) - 2 + 2
+    lab = registry.get("https://pypi.lab.example/simple")
+    assert lab is not None and lab.url == "https://pypi.lab.example/simple/"
+    assert [m.id for m in registry][-2:] == ["corp", lab.id]
+
+    assert [m.id for m in registry.filter(tag="cloud")] == ["aliyun", "huawei", "tencent", "corp"]
+    assert [m.id for m in registry.filter(region="internal")] == ["corp", lab.id]
+    assert [m.id for m in registry.filter(region="internal", tag="corp")] == ["corp"]
+    assert "corp" not in [m.id for m in registry.filter(region="cn")]
+    assert [m.id for m in registry.filter(region="cn", tag="internal")] == ["tuna"]
+
+def bench_registry():
+    """
+    MirrorRegistry.load_file 读取临时 JSON 注册表：按 id / URL 覆盖内置镜像、"disabled": true、
+    新增镜像、地区与标签过滤、无法解析的条目与文件；再经 --list-mirrors --registry 在子进程中读取同一文件。
+    计时：加载 500 个条目的注册表文件
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-registry-")
+    try:
+        path = _write_registry(tmp, "registry.json", REGISTRY_FILE)
+        registry = main.builtin_registry()
+        registry.load_file(path)
+        _check_registry(main, registry)
+
+        # 也接受直接是列表的文件
+        listed = main.builtin_registry()
+        listed.load_file(_write_registry(tmp, "list.json", REGISTRY_FILE["mirrors"]))
+        assert [m.to_dict() for m in listed] == [m.to_dict() for m in registry] and len(listed.errors) == 2
+
+        # 缺失的文件静默忽略，无法解析的文件记一条错误，注册表保持内置值
+        builtin_urls = main.builtin_registry().urls()
+        for name, data, errors in (("missing.json", None, 0), ("broken.json", '{"mirrors": [', 1)):
+            other = main.builtin_registry()
+            other.load_file(_write_registry(tmp, name, data) if data else os.path.join(tmp, name))
+            assert other.urls() == builtin_urls and len(other.errors) == errors, (name, other.errors)
+
+        env = dict(os.environ, HOME=tmp, XDG_CONFIG_HOME=os.path.join(tmp, ".config"))
+        out = subprocess.run([sys.executable, os.path.join(HERE, "main.py"), "--list-mirrors", "--json",
+                              "--registry=" + path, "--region=internal"],
+                             check=True, env=env, stdout=subprocess.PIPE, timeout=60).stdout
+        listing = json.loads(out.decode("utf-8"))
+        assert listing["registry"] == path and len(listing["errors"]) == 2, listing
+        assert [m["id"] for m in listing["mirrors"]] == ["corp", "https://pypi.lab.example/simple"], listing
+
+        large = _write_registry(tmp, "large.json", {"mirrors": [
+            {"id": "m{0}".format(i), "url": "https://m{0}.example/simple/".format(i), "region": "r{0}".format(i % 7),
+             "tags": ["t{0}".format(i % 5)]} for i in range(REGISTRY_ENTRIES)]})
+
+        def load():
+            main.builtin_registry().load_file(large)
+        load_us = _per_call_us(load, min_time=0.1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"entries": REGISTRY_ENTRIES, "load_ms": round(load_us / 1000, 2)}
+
+# ================== 索引页解析 ==================
+PARSER_FILES = 50000
+PARSER_FILES_PER_VERSION = 5
+
+def make_index_page(files=PARSER_FILES, per_version=PARSER_FILES_PER_VERSION):
+    """合成的大型 PEP 503 项目页：按版本升序，每个版本若干 wheel + 一个 sdist"""
+    rows = ["<!DOCTYPE html><html><body><h1>Links for bigproj</h1>"]
+    for i in range(files):
+        version = "1.{0}".format(i // per_version)
+        if i % per_version == per_version - 1:
+            name = "bigproj-{0}.tar.gz".format(version)
+        else:
+            name = "bigproj-{0}-cp3{1}-cp3{1}-manylinux_2_17_x86_64.whl".format(version, i % per_version)
+        rows.append('<a href="../../packages/ab/cd/{0}#sha256={1:064x}" '
+                    'data-requires-python="&gt;=3.8">{0}</a><br/>'.format(name, i))
+    rows.append("</body></html>")
+    return "\n".join(rows).encode("utf-8")
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.page
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端提前停止读取
+
+def _serve_page(page):
+    server = HTTPServer(("127.0.0.1", 0), _PageHandler)
+    server.page = page
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _measure(func):
+    """
+    返回 (结果, 耗时毫秒, 峰值内存 KiB)；tracemalloc 开销很大，
+    耗时与内存分两次运行测量
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = (time.perf_counter() - start) * 1000
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 1024.0
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def bench_parser():
+    """
+    同一页面分别用整页读取后解析、流式解析、流式解析并在目标版本后提前停止三种方式处理，
+    流式方式的峰值内存必须低于整页方式
+    """
+    import main
+    page = make_index_page()
+    server = _serve_page(page)
+    url = "http://127.0.0.1:{0}/simple/bigproj/".format(server.server_address[1])
+    target = "1.{0}".format(PARSER_FILES // PARSER_FILES_PER_VERSION // 2)
+
+    def whole():
+        with main.open_url(url) as resp:
+            body = resp.read()
+        parser = main._StreamingIndexParser(url)
+        parser.feed(body.decode("utf-8"))
+        parser.close()
+        return len(parser.pending)
+
+    def streaming():
+        with main.open_url(url) as resp:
+            return sum(1 for _ in main.iter_index_entries(resp, url, "text/html"))
+
+    def early_stop():
+        return len(list(main.iter_index_files(url.rsplit("/bigproj/", 1)[0], "bigproj", target)))
+
+    try:
+        results = {"page_bytes": len(page)}
+        for name, func in (("whole", whole), ("streaming", streaming), ("early_stop", early_stop)):
+            count, ms, peak = _measure(func)
+            results[name] = {"files": count, "ms": round(ms, 1), "peak_kib": round(peak, 1)}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert results["whole"]["files"] == results["streaming"]["files"] == PARSER_FILES
+    assert results["early_stop"]["files"] == PARSER_FILES_PER_VERSION
+    assert results["streaming"]["peak_kib"] < results["whole"]["peak_kib"], \
+        "streaming peak {0} KiB >= whole-page peak {1} KiB".format(
+            results["streaming"]["peak_kib"], results["whole"]["peak_kib"])
+    return results
+
+# ================== 镜像同步新鲜度 ==================
+FRESHNESS_FILLER = 8          # 各镜像内容一致的项目数，用于检查每主机连接数与长连接复用
+FRESHNESS_NOW = 1700000000    # 固定的“当前时间”，上传时间都相对它给出
+
+def _iso(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+class _FakeIndexHandler(BaseHTTPRequestHandler):
+    """假索引：server.projects = {项目: [(文件名, 上传时间)]}；server.json 为真时返回 PEP 691 JSON"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        if server.fail:
+            body, status, content_type = b"", 503, "text/plain"
+        else:
+            project = self.path.strip("/").rsplit("/", 1)[-1]
+            files = server.projects.get(project)
+            if files is None:
+                body, status, content_type = b"", 404, "text/plain"
+            elif server.json:
+                body = json.dumps({"meta": {"api-version": "1.0"}, "name": project, "files": [
+                    {"filename": name, "url": "../../files/" + name, "hashes": {}, "upload-time": _iso(ts)}
+                    for name, ts in files]}).encode("utf-8")
+                status, content_type = 200, "application/vnd.pypi.simple.v1+json"
+            else:
+                body = "<html><body>{0}</body></html>".format("".join(
+                    '<a href="../../files/{0}">{0}</a>'.format(name) for name, _ in files)).encode("utf-8")
+                status, content_type = 200, "text/html"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def _serve_index(projects, json_api=False, fail=False):
+    server = _ThreadingServer(("127.0.0.1", 0), _FakeIndexHandler)
+    server.projects, server.json, server.fail = projects, json_api, fail
+    server.connections, server.lock = 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{0}/simple/".format(server.server_address[1])
+
+def bench_freshness():
+    """
+    check_freshness 在内容不同的本地假索引上：参考索引（PEP 691 JSON，带上传时间）与已同步、
+    落后两小时（缺固定版本）、缺整个项目、返回 503 的镜像比较，检查缺失文件数、缺失的固定版本、
+    同步延迟与错误计数；每个镜像的连接数不超过 per_host；结果写入健康缓存后，落后的镜像即使更快也排在后面
+    """
+    import main
+    hour, day = 3600, 86400
+    reference = {
+        "alpha": [("alpha-1.0-py3-none-any.whl", FRESHNESS_NOW - 10 * day),
+                  ("alpha-1.1-py3-none-any.whl", FRESHNESS_NOW - 2 * hour),
+                  ("alpha-1.2-py3-none-any.whl", FRESHNESS_NOW - hour / 2)],
+        "beta": [("beta-2.0.tar.gz", FRESHNESS_NOW - 5 * day)],
+    }
+    for i in range(FRESHNESS_FILLER):
+        reference["filler{0}".format(i)] = [("filler{0}-1.0-py3-none-any.whl".format(i), FRESHNESS_NOW - 90 * day)]
+    lagging = dict(reference, alpha=reference["alpha"][:1])
+    partial = dict((k, v) for k, v in reference.items() if k != "beta")
+    servers = {"reference": _serve_index(reference, json_api=True), "synced": _serve_index(reference),
+               "lagging": _serve_index(lagging), "partial": _serve_index(partial),
+               "down": _serve_index(reference, fail=True)}
+    urls = dict((label, url) for label, (_, url) in servers.items())
+    requirements = [("alpha", "1.2"), ("beta", None)] + [(name, None) for name in sorted(reference)
+                                                         if name.startswith("filler")]
+    tmp = tempfile.mkdtemp(prefix="bench-freshness-")
+    try:
+        main.get_http_pool().close()
+        start = time.perf_counter()
+        reports = main.check_freshness([urls[k] for k in ("synced", "lagging", "partial", "down")], requirements,
+                                       reference=urls["reference"], now=FRESHNESS_NOW,
+                                       per_host=main.FRESHNESS_PER_HOST)
+        elapsed = time.perf_counter() - start
+        by_label = dict((label, r) for r in reports for label, url in urls.items() if url == r["url"])
+        assert (by_label["synced"]["missing_files"], by_label["synced"]["sync_lag"]) == (0, 0), by_label["synced"]
+        lag = by_label["lagging"]
+        assert lag["missing_files"] == 2 and lag["missing_pins"] == ["alpha==1.2"], lag
+        assert lag["sync_lag"] == 2 * hour, lag
+        part = by_label["partial"]
+        assert part["missing_files"] == 1 and part["sync_lag"] == 5 * day and not part["missing_pins"], part
+        down = by_label["down"]
+        assert down["errors"] == len(requirements) and down["checked"] == 0 and down["sync_lag"] is None, down
+        for label, (server, _) in servers.items():
+            assert server.connections <= main.FRESHNESS_PER_HOST, (label, server.connections)
+
+        # 接入镜像选择：落后的镜像测速更快，但排在已同步的镜像之后
+        health = main.MirrorHealthCache(os.path.join(tmp, "health.json"))
+        health.record({"url": urls["lagging"], "ok": True, "score": 0.1})
+        health.record({"url": urls["synced"], "ok": True, "score": 0.5})
+        for report in reports:
+            health.record_freshness(report)
+        assert [e["url"] for e in health.ranking([urls["lagging"], urls["synced"]])] == \
+            [urls["synced"], urls["lagging"]]
+    finally:
+        for server, _ in servers.values():
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"mirrors": len(reports), "projects": len(requirements), "check_ms": round(elapsed * 1000, 1)}
+
+# ================== 并行预取 ==================
+PREFETCH_PROJECTS = 12
+PREFETCH_WHEEL_BYTES = 512 * 1024
+PREFETCH_RATE = 4 * 1024 * 1024   # 每条连接的限速（字节/秒）
+
+def make_wheelhouse(count=PREFETCH_PROJECTS, size=PREFETCH_WHEEL_BYTES):
+    """生成 {文件名: 内容}，每个项目一个纯 Python wheel"""
+    return {"pkg{0}-1.0-py3-none-any.whl".format(i): os.urandom(size) for i in range(count)}
+
+class _MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True   # 避免头部与正文分开写时的 40ms 延迟确认
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.delay)
+        if server.fail:
+            self._send(503, b"", "text/plain")
+            return
+        server.hits.append(self.path)
+        if self.path.startswith("/simple/"):
+            project = self.path[len("/simple/"):].strip("/")
+            if project in server.missing:
+                self._send(404, b"", "text/plain")
+                return
+            links = ['<a href="../../files/{0}#sha256={1}">{0}</a>'.format(
+                name, hashlib.sha256(data).hexdigest())
+                for name, data in server.files.items() if name.startswith(project + "-")]
+            body = "<html><body>{0}</body></html>".format("".join(links)).encode("utf-8")
+            etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(200, body, "text/html", {"ETag": etag})
+            return
+        name = self.path.rsplit("/", 1)[-1]
+        data = server.files.get(name)
+        if data is None:
+            self._send(404, b"", "text/plain")
+            return
+        if server.corrupt:
+            data = bytes(reversed(data))
+        offset = 0
+        rng = self.headers.get("Range", "")
+        if rng.startswith("bytes="):
+            offset = int(rng[len("bytes="):].split("-", 1)[0])
+            server.ranges.append(name)
+        body = data[offset:]
+        self.send_response(206 if offset else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # 按连接限速，模拟镜像带宽；server.link 存在时所有连接共享同一条限速链路
+        chunk = 64 * 1024
+        try:
+            for i in range(0, len(body), chunk):
+                self.wfile.write(body[i:i + chunk])
+                if server.link is not None:
+                    server.link.consume(len(body[i:i + chunk]))
+                else:
+                    time.sleep(chunk / float(server.rate))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, status, body, content_type, headers=None):
+        # 客户端超时后才响应时（注入延迟），连接可能已被关闭
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128   # 负载回放时几十个客户端同时建连
+
+class _SharedLink(object):
+    """所有连接共享的限速链路：每个数据块按顺序占用 size / rate 秒"""
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._free_at = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        with self._lock:
+            self._free_at = max(self._free_at, time.perf_counter()) + size / self.rate
+            done = self._free_at
+        time.sleep(max(0.0, done - time.perf_counter()))
+
+def _serve_mirror(files, rate=PREFETCH_RATE, corrupt=False, shared_rate=None, delay=0, fail=False, missing=()):
+    """missing 中的项目页返回 404（模拟尚未同步该项目的镜像）"""
+    server = _ThreadingServer(("127.0.0.1", 0), _MirrorHandler)
+    server.files, server.rate, server.corrupt, server.ranges = files, rate, corrupt, []
+    server.missing = set(missing)
+    server.delay, server.fail, server.hits, server.not_modified = delay, fail, [], 0
+    server.link = _SharedLink(shared_rate) if shared_rate else None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{0}/simple/".format(server.server_address[1])
+
+def bench_prefetch():
+    """
+    在限速的本地假镜像上比较单镜像单连接与多镜像并行预取的耗时；
+    并验证 .part 续传只下载剩余部分、坏镜像的文件因哈希不符改由其他镜像下载，
+    以及版本选择遵守 Requires-Python、固定版本按规范化后的版本号匹配
+    """
+    import main
+    files = make_wheelhouse()
+    servers = [_serve_mirror(files), _serve_mirror(files), _serve_mirror(files, corrupt=True)]
+    (fast, fast_url), (second, second_url), (bad, bad_url) = servers
+    requirements = [("pkg{0}".format(i), None) for i in range(PREFETCH_PROJECTS)]
+    tmp = tempfile.mkdtemp(prefix="bench-prefetch-")
+    results = {"files": len(files), "mib": round(len(files) * PREFETCH_WHEEL_BYTES / 1024.0 ** 2, 1)}
+
+    def check(dest, report):
+        assert all(f["status"] in ("downloaded", "cached") for f in report["files"]), report["files"]
+        for name, data in files.items():
+            with open(os.path.join(dest, name), "rb") as f:
+                assert f.read() == data, "{0} differs".format(name)
+
+    try:
+        for label, mirrors, per_host in (("serial", [fast_url], 1),
+                                         ("parallel", [fast_url, second_url], 4)):
+            dest = os.path.join(tmp, label)
+            start = time.perf_counter()
+            report = main.prefetch(requirements, mirrors, dest, per_host=per_host)
+            results[label + "_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            check(dest, report)
+
+        # 续传：留下半个 .part，只应以 Range 请求下载剩余部分
+        dest = os.path.join(tmp, "parallel")
+        name = sorted(files)[0]
+        os.unlink(os.path.join(dest, name))
+        with open(os.path.join(dest, name + ".part"), "wb") as f:
+            f.write(files[name][:PREFETCH_WHEEL_BYTES // 2])
+        report = main.prefetch(requirements, [fast_url], dest)
+        check(dest, report)
+        resumed = [f for f in report["files"] if f["status"] == "downloaded"]
+        assert len(resumed) == 1 and resumed[0]["bytes"] == PREFETCH_WHEEL_BYTES // 2, resumed
+        assert fast.ranges == [name], fast.ranges
+        results["resumed_bytes"] = resumed[0]["bytes"]
+
+        # 坏镜像：哈希校验失败的文件改由正常镜像下载
+        dest = os.path.join(tmp, "corrupt")
+        report = main.prefetch(requirements, [bad_url, second_url], dest)
+        check(dest, report)
+        results["hash_rerouted"] = sum(1 for f in report["files"] if f["mirror"] == second_url)
+    finally:
+        for server, _ in servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    assert results["parallel_ms"] < results["serial_ms"], \
+        "parallel {0} ms >= serial {1} ms".format(results["parallel_ms"], results["serial_ms"])
+    assert results["hash_rerouted"] == len(files)
+    check_choose_distribution(main)
+    return results
+
+def check_choose_distribution(main):
+    """版本选择：跳过 Requires-Python 不接受当前解释器的版本，固定版本按规范化后的版本号匹配"""
+    too_new = "&gt;={0}.{1}".format(sys.version_info[0], sys.version_info[1] + 1)
+    page = "".join('<a href="{0}" data-requires-python="{1}">{0}</a>'.format(name, spec) for name, spec in [
+        ("pkg-1.0.0-py3-none-any.whl", ""), ("pkg-1.1-py3-none-any.whl", "&gt;=3"),
+        ("pkg-2.0-py3-none-any.whl", too_new), ("pkg-2.0.tar.gz", too_new)])
+    parser = main._StreamingIndexParser("http://mirror/simple/pkg/")
+    parser.feed(page)
+    entries = parser.pending
+    pick = lambda pin=None: (main.choose_distribution(entries, pin) or {}).get("filename")
+    assert pick() == "pkg-1.1-py3-none-any.whl", pick()
+    for pin in ("1.0", "1.0.0", "V1.0", "1"):
+        assert pick(pin) == "pkg-1.0.0-py3-none-any.whl", (pin, pick(pin))
+    assert pick("2.0") is None, pick("2.0")
+
+# ================== 本地缓存代理 ==================
+PROXY_WHEELS = 3
+PROXY_WHEEL_BYTES = 1024 * 1024
+PROXY_UPSTREAM_RATE = 2 * 1024 * 1024   # 上游限速，用于验证代理边下载边转发
+
+def _proxy_get(url):
+    """返回 (状态码, 正文, 首字节耗时, 总耗时)"""
+    import urllib.error
+    import urllib.request
+    start = time.perf_counter()
+    try:
+        resp = urllib.request.urlopen(url, timeout=30)
+    except urllib.error.HTTPError as e:
+        return e.code, b"", None, time.perf_counter() - start
+    with resp:
+        first = resp.read(1)
+        ttfb = time.perf_counter() - start
+        body = first + resp.read()
+    return resp.getcode(), body, ttfb, time.perf_counter() - start
+
+def bench_proxy():
+    """
+    --serve 缓存代理在本地假上游上完全离线验证：项目页链接改写并缓存、过期后用 ETag 重新验证（304）、
+    分发文件边下载边转发并命中磁盘缓存、超出容量时按 LRU 淘汰、上游下线后继续提供缓存的页面与文件
+    """
+    import re
+    import main
+    files = make_wheelhouse(PROXY_WHEELS, PROXY_WHEEL_BYTES)
+    upstream, upstream_url = _serve_mirror(files, rate=PROXY_UPSTREAM_RATE)
+    tmp = tempfile.mkdtemp(prefix="bench-proxy-")
+    # 容量放得下两个文件，第三个写入时淘汰最久未用的那个
+    cache = main.ProxyCache(tmp, budget=int(PROXY_WHEEL_BYTES * 2.5))
+    proxy = main.CachingIndexProxy(("127.0.0.1", 0), upstream_url, cache)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:{0}".format(proxy.server_address[1])
+    max_age = main.INDEX_MAX_AGE
+    results = {}
+    try:
+        links = {}
+        for i in range(PROXY_WHEELS):
+            status, page, _, _ = _proxy_get(base + "/simple/pkg{0}/".format(i))
+            assert status == 200, status
+            for href in re.findall(r'href="([^"]+)"', page.decode("utf-8")):
+                assert href.startswith("/files/http/127.0.0.1"), href
+                links[href.split("#")[0].rsplit("/", 1)[-1]] = base + href.split("#")[0]
+        assert sorted(links) == sorted(files), links
+
+        # 缓存期内的项目页不访问上游
+        before = len(upstream.hits)
+        _proxy_get(base + "/simple/pkg0/")
+        assert len(upstream.hits) == before, upstream.hits[before:]
+        # 过期后带 If-None-Match 重新验证，上游返回 304
+        main.INDEX_MAX_AGE = 0
+        status, page, _, _ = _proxy_get(base + "/simple/pkg0/")
+        assert status == 200 and b"pkg0-1.0" in page and upstream.not_modified == 1, upstream.not_modified
+
+        # 未命中：边下载边转发，首字节远早于整个文件（上游限速约 0.5 秒）
+        name0, name1, name2 = sorted(files)
+        status, body, ttfb, total = _proxy_get(links[name0])
+        assert status == 200 and body == files[name0]
+        assert ttfb < total / 4, (ttfb, total)
+        results["miss_ttfb_ms"], results["miss_total_ms"] = round(ttfb * 1000, 1), round(total * 1000, 1)
+        # 命中：不访问上游
+        before = len(upstream.hits)
+        status, body, _, total = _proxy_get(links[name0])
+        assert status == 200 and body == files[name0] and len(upstream.hits) == before
+        results["hit_total_ms"] = round(total * 1000, 1)
+
+        # LRU：再下载两个文件后超出容量，最久未用的 name0 被淘汰
+        for name in (name1, name2):
+            assert _proxy_get(links[name])[1] == files[name]
+        # 代理在客户端收完最后一个字节后才提交缓存文件
+        evicted = main.ProxyCache.file_key(main.urljoin(upstream_url, "../files/" + name0))
+        deadline = time.time() + 5
+        while (evicted in cache._lru or len(cache._lru) != 2) and time.time() < deadline:
+            time.sleep(0.01)
+        assert evicted not in cache._lru and len(cache._lru) == 2, cache._lru
+        assert cache._total <= cache.budget and not os.path.exists(os.path.join(tmp, "files", evicted))
+
+        # 上游下线：过期的项目页以缓存提供，已缓存的文件照常提供，被淘汰的文件返回 502
+        upstream.shutdown()
+        upstream.server_close()
+        main.get_http_pool().close()   # 已建立的长连接仍由桩服务器的处理线程服务，一并断开
+        status, page, _, _ = _proxy_get(base + "/simple/pkg2/")
+        assert status == 200 and name2.encode("utf-8") in page, status
+        status, body, _, _ = _proxy_get(links[name2])
+        assert status == 200 and body == files[name2]
+        assert _proxy_get(links[name0])[0] == 502
+    finally:
+        main.INDEX_MAX_AGE = max_age
+        proxy.shutdown()
+        proxy.server_close()
+        upstream.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+# ================== 后台守护 ==================
+WATCH_A = "https://a.example/simple/"
+WATCH_B = "https://b.example/simple/"
+WATCH_C = "https://c.example/simple/"
+
+def _scripted_watcher(main, cfg_path, script):
+    """按脚本返回每轮探测结果的 MirrorWatcher（不访问网络）"""
+    class Watcher(main.MirrorWatcher):
+        def candidates(self, current):
+            return [WATCH_A, WATCH_B, WATCH_C]
+
+        def probe(self, urls):
+            ttfbs = script.pop(0)
+            return [{"url": u, "ok": ttfbs.get(u) is not None, "ttfb": ttfbs.get(u),
+                     "error": "" if ttfbs.get(u) is not None else "timeout"} for u in urls]
+    return Watcher(cfg_path, margin=0.2, rounds=3)
+
+def bench_watch():
+    """
+    MirrorWatcher 的切换决策：按脚本给出每轮探测结果，逐轮检查 keep / pending / switch / hold：
+    挑战者要快过余量（20%）且连续 3 轮才切换；中途回落、全部不可达或配置被外部修改时重新计数；
+    切换后以新镜像为基准，并保留 extra-index-url
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-watch-")
+    cfg_path = os.path.join(tmp, "pip.conf")
+    main.write_pip_config(cfg_path, WATCH_A, ["https://extra.example/simple/"])
+    # (本轮探测结果, 期望的决定, 期望的连胜轮数)
+    script = [
+        ({WATCH_A: 0.100, WATCH_B: 0.070}, "pending", 1),
+        ({WATCH_A: 0.100, WATCH_B: 0.075}, "pending", 2),
+        ({WATCH_A: 0.100, WATCH_B: 0.085}, "keep", 0),       # 回落到余量以内：重新计数
+        ({WATCH_A: 0.100, WATCH_B: 0.070}, "pending", 1),
+        ({WATCH_A: 0.100, WATCH_B: 0.070}, "pending", 2),
+        ({}, "hold", 0),                                      # 全部不可达：保持并重新计数
+        ({WATCH_A: 0.100, WATCH_B: 0.070}, "pending", 1),
+        ({WATCH_A: 0.100, WATCH_B: 0.070}, "pending", 2),
+        ({WATCH_A: 0.100, WATCH_B: 0.070, WATCH_C: 0.090}, "switch", 3),
+        ({WATCH_A: 0.060, WATCH_B: 0.070}, "keep", 0),       # 新基准是 B：A 未快过 20%
+        ({WATCH_A: None, WATCH_B: None, WATCH_C: 0.500}, "pending", 1),  # 当前不可达：任何可达镜像都算
+        ("external", None, None),
+        ({WATCH_A: 0.100, WATCH_B: None, WATCH_C: 0.050}, "pending", 1),  # 配置被外部改为 A：重新计数
+    ]
+    watcher = _scripted_watcher(main, cfg_path, [s for s, _, _ in script if s != "external"])
+    try:
+        for i, (_, action, streak) in enumerate(script):
+            if action is None:
+                main.switch_index_url(cfg_path, WATCH_A)
+                continue
+            decision = watcher.run_round()
+            assert (decision["action"], decision["streak"]) == (action, streak), (i, decision)
+            if action == "switch":
+                info = main.read_pip_index_config(cfg_path)
+                assert decision["challenger"] == WATCH_B and info["index_url"] == WATCH_B, info
+                assert info["extra_index_urls"] == ["https://extra.example/simple/"], info
+        assert main.read_current_index_url(cfg_path) == WATCH_A
+
+        results = [{"url": u, "ok": True, "ttfb": 0.1 + i / 1000.0, "error": ""} for i, u in enumerate(
+            "https://m{0}.example/simple/".format(i) for i in range(60))]
+        results[30]["ttfb"] = 0.01
+        decide = main.MirrorWatcher(cfg_path)
+        evaluate_us = _per_call_us(lambda: decide.evaluate(results[0]["url"], results))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"rounds": len(script) - 1, "evaluate_60_us": round(evaluate_us, 1)}
+
+# ================== 多上游故障转移 ==================
+FAILOVER_SLOW_DELAY = 1.5     # 慢镜像的响应延迟，超过样本不足时的对冲阈值（1 秒）
+
+def bench_failover():
+    """
+    FailoverUpstream 在本地替身镜像上的故障转移：尚未同步（项目页 404）与返回 503 的镜像
+    改由下一个镜像提供并在连续失败后熔断，熔断后不再收到请求；所有镜像都 404 时原样返回 404
+    且不计失败；慢镜像超过对冲阈值后向次优镜像发出对冲请求，由后者胜出
+    """
+    import urllib.error
+    import main
+    files = make_wheelhouse(2, 1024)
+    servers = {"good": _serve_mirror(files), "unsynced": _serve_mirror(files, missing={"pkg0", "pkg1"}),
+               "unsynced2": _serve_mirror(files, missing={"pkg1"}), "broken": _serve_mirror(files, fail=True),
+               "slow": _serve_mirror(files, delay=FAILOVER_SLOW_DELAY)}
+    urls = {label: url for label, (_, url) in servers.items()}
+    results = {}
+
+    def counters(upstream, label):
+        return next(s for s in upstream.stats() if s["url"] == main.normalize_url(urls[label]) + "/")
+
+    try:
+        # 404 / 503 的镜像排在前面（评分相同时按列表顺序）：转由 good 提供，失败计数后评分变差，
+        # 之后的请求直接发给 good
+        for bad in ("unsynced", "broken"):
+            upstream = main.FailoverUpstream([urls[bad], urls["good"]])
+            resp, page_url = upstream.open("pkg0/", {})
+            assert page_url.startswith(urls["good"]) and b"pkg0-1.0" in resp.read(), (bad, page_url)
+            stats = counters(upstream, bad)
+            assert stats["failures"] == 1 and stats["stale"] == (1 if bad == "unsynced" else 0), (bad, stats)
+            before = len(servers[bad][0].hits)
+            upstream.open("pkg0/", {})
+            assert len(servers[bad][0].hits) == before, (bad, "demoted mirror still tried first")
+            assert counters(upstream, "good")["won"] == 2
+
+        # 熔断：两个镜像都返回 503，连续失败 FAILOVER_TRIP_AFTER 次后都熔断
+        broken2, broken2_url = _serve_mirror(files, fail=True)
+        servers["broken2"] = (broken2, broken2_url)
+        upstream = main.FailoverUpstream([urls["broken"], broken2_url])
+        for _ in range(main.FAILOVER_TRIP_AFTER):
+            try:
+                upstream.open("pkg0/", {})
+            except urllib.error.HTTPError as e:
+                assert e.code == 503, e.code
+            else:
+                raise AssertionError("503 from every mirror was not reported")
+        assert all(s["open"] and s["tripped"] == 1 and s["failures"] == main.FAILOVER_TRIP_AFTER
+                   for s in upstream.stats()), upstream.stats()
+
+        # 所有镜像都没有该项目：返回 404，不计失败
+        upstream = main.FailoverUpstream([urls["unsynced"], urls["unsynced2"]])
+        try:
+            upstream.open("pkg1/", {})
+        except urllib.error.HTTPError as e:
+            assert e.code == 404, e.code
+        else:
+            raise AssertionError("missing project did not return 404")
+        assert all(s["failures"] == 0 and s["stale"] == 0 and not s["open"] for s in upstream.stats())
+
+        # 对冲：慢镜像超过阈值仍未返回，good 胜出
+        upstream = main.FailoverUpstream([urls["slow"], urls["good"]])
+        start = time.perf_counter()
+        resp, page_url = upstream.open("pkg0/", {})
+        elapsed = time.perf_counter() - start
+        assert page_url.startswith(urls["good"]), page_url
+        assert main.FAILOVER_HEDGE_DEFAULT <= elapsed < FAILOVER_SLOW_DELAY, elapsed
+        assert counters(upstream, "slow")["hedged"] == 1 and counters(upstream, "good")["won"] == 1
+        results["hedged_ms"] = round(elapsed * 1000, 1)
+        # 慢镜像的请求完成后评分变差，之后 good 排第一，不再对冲
+        deadline = time.time() + 5
+        while counters(upstream, "slow")["score"] is None and time.time() < deadline:
+            time.sleep(0.05)
+        start = time.perf_counter()
+        resp, page_url = upstream.open("pkg0/", {})
+        results["after_hedge_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        assert page_url.startswith(urls["good"]) and counters(upstream, "slow")["hedged"] == 1
+    finally:
+        for server, _ in servers.values():
+            server.shutdown()
+            server.server_close()
+    return results
+
+# ================== 镜像测速 ==================
+BENCHMARK_WHEEL_BYTES = 256 * 1024
+BENCHMARK_TIMEOUT = 1.0       # 测速超时；“卡住”的镜像在此之后才响应
+BENCHMARK_SLOW_DELAY = 0.15   # 慢镜像每个请求注入的延迟（秒）
+
+def _closed_port_url():
+    """一个没有服务监听的本地端口（连接被拒绝）"""
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return "http://127.0.0.1:{0}/simple/".format(port)
+
+def bench_benchmark():
+    """
+    benchmark_mirrors 在本地替身镜像上的排名与故障处理：快镜像排在注入延迟的慢镜像之前，
+    超时、返回 503 与拒绝连接的镜像 ok=False 且排在最后；所有镜像并发测速，卡住的镜像不拖慢整体
+    """
+    import main
+    files = make_wheelhouse(1, BENCHMARK_WHEEL_BYTES)
+    servers = {"fast": _serve_mirror(files, rate=64 * 1024 * 1024),
+               "slow": _serve_mirror(files, rate=2 * 1024 * 1024, delay=BENCHMARK_SLOW_DELAY),
+               "hung": _serve_mirror(files, delay=BENCHMARK_TIMEOUT * 3),
+               "broken": _serve_mirror(files, fail=True)}
+    urls = dict((label, url) for label, (_, url) in servers.items())
+    urls["refused"] = _closed_port_url()
+    labels = dict((url, label) for label, url in urls.items())
+    try:
+        start = time.perf_counter()
+        ranked = main.benchmark_mirrors(list(urls.values()), project="pkg0", timeout=BENCHMARK_TIMEOUT,
+                                        sample_bytes=BENCHMARK_WHEEL_BYTES)
+        elapsed = time.perf_counter() - start
+    finally:
+        for server, _ in servers.values():
+            server.shutdown()
+            server.server_close()
+    by_label = dict((labels[r["url"]], r) for r in ranked)
+    order = [labels[r["url"]] for r in ranked]
+    assert order[:2] == ["fast", "slow"], order
+    assert sorted(order[2:]) == ["broken", "hung", "refused"], order
+    for label in ("fast", "slow"):
+        r = by_label[label]
+        assert r["ok"] and r["throughput"] and r["project_time"] is not None, r
+    for label in ("hung", "broken", "refused"):
+        r = by_label[label]
+        assert not r["ok"] and r["error"] and r["score"] == float("inf"), r
+    assert "timed out" in by_label["hung"]["error"], by_label["hung"]["error"]
+    assert "503" in by_label["broken"]["error"], by_label["broken"]["error"]
+    # 并发测速：总耗时取决于最慢的单个镜像（超时），而不是各镜像之和
+    assert elapsed < BENCHMARK_TIMEOUT * 2.5, elapsed
+    return {"mirrors": len(urls), "total_ms": round(elapsed * 1000, 1),
+            "fast_score_ms": round(by_label["fast"]["score"] * 1000, 1),
+            "slow_score_ms": round(by_label["slow"]["score"] * 1000, 1)}
+
+# ================== 共享连接池 ==================
+POOL_STUBS = 9          # 与内置镜像数量相当的本地 TLS 桩服务器
+POOL_ROUNDS = 5         # 每个桩服务器探测的轮数（GUI 定时探测、--watch 每轮都会重复）
+POOL_WORKERS = 4        # 与 BackgroundProber 的并发数一致
+
+class _TLSStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 头部与响应体分两次写出，长连接上不关 Nagle 会被客户端的延迟确认拖慢 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        # 握手放在处理线程里完成，并统计完整握手与会话恢复的次数
+        self.request.do_handshake()
+        with self.server.lock:
+            self.server.handshakes += 1
+            self.server.resumed += 1 if self.request.session_reused else 0
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        body = b"<html><body></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _TLSStubServer(_ThreadingServer):
+    def __init__(self, context):
+        _ThreadingServer.__init__(self, ("127.0.0.1", 0), _TLSStubHandler)
+        self.context = context
+        self.lock = threading.Lock()
+        self.handshakes = self.resumed = 0
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), addr
+
+def _make_tls_cert(tmp):
+    """用 openssl 生成 localhost / 127.0.0.1 的自签名证书；找不到 openssl（可用 OPENSSL 指定）时返回 None"""
+    openssl = os.environ.get("OPENSSL") or shutil.which("openssl")
+    if not openssl:
+        return None
+    cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+    subprocess.run([openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                    "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+def bench_pool():
+    """
+    本地 TLS 桩服务器上多轮并发探测（与 GUI 后台探测相同的访问模式），比较：
+      urllib   每个请求新建连接并完整握手（连接池之前 open_url 的做法）
+      fresh    连接池但不保留空闲连接：每次新建连接，TLS 会话恢复 + DNS 缓存
+      pooled   连接池长连接：每个主机只握手一次
+    统计服务器端的握手与会话恢复次数、总耗时与单请求延迟中位数
+    """
+    import ssl
+    import urllib.request
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-pool-")
+    servers = []
+    try:
+        pair = _make_tls_cert(tmp)
+        if pair is None:
+            return {"skipped": "openssl not found (set OPENSSL=/path/to/openssl)"}
+        server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_ctx.load_cert_chain(*pair)
+        client_ctx = ssl.create_default_context(cafile=pair[0])
+        for _ in range(POOL_STUBS):
+            server = _TLSStubServer(server_ctx)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+        urls = ["https://127.0.0.1:{0}/simple/".format(s.server_address[1]) for s in servers]
+
+        def run(fetch):
+            before = [(s.handshakes, s.resumed) for s in servers]
+            latencies = []
+
+            def one(url):
+                start = time.perf_counter()
+                with fetch(url) as resp:
+                    resp.read()
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with main.ThreadPoolExecutor(max_workers=POOL_WORKERS) as executor:
+                for _ in range(POOL_ROUNDS):
+                    latencies += list(executor.map(one, urls))
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            return {"ms": round(elapsed * 1000, 1),
+                    "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+                    "handshakes": sum(s.handshakes - b[0] for s, b in zip(servers, before)),
+                    "resumed": sum(s.resumed - b[1] for s, b in zip(servers, before))}
+
+        fresh = main.HTTPPool(max_idle=0, context=client_ctx)
+        pooled = main.HTTPPool(context=client_ctx)
+        results = {"requests": POOL_STUBS * POOL_ROUNDS,
+                   "urllib": run(lambda url: urllib.request.urlopen(url, timeout=10, context=client_ctx)),
+                   "fresh": run(lambda url: fresh.open(url)),
+                   "pooled": run(lambda url: pooled.open(url))}
+        results["pooled"]["reused"] = pooled.stats()["reused"]
+        pooled.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    requests = results["requests"]
+    assert results["urllib"]["handshakes"] == requests and not results["urllib"]["resumed"], results["urllib"]
+    # 每个主机第一次是完整握手，之后的新连接都应恢复会话
+    assert results["fresh"]["handshakes"] == requests, results["fresh"]
+    assert results["fresh"]["resumed"] >= requests - POOL_STUBS, results["fresh"]
+    assert results["pooled"]["handshakes"] <= POOL_STUBS, results["pooled"]
+    assert results["pooled"]["reused"] >= requests - POOL_STUBS, results["pooled"]
+    assert results["pooled"]["ms"] < results["urllib"]["ms"], \
+        "pooled {0} ms >= urllib {1} ms".format(results["pooled"]["ms"], results["urllib"]["ms"])
+    return results
+
+# ================== 指标 ==================
+METRICS_PHASES = ("dns", "connect", "tls", "ttfb", "transfer")
+
+def _histogram_counts(snapshot, host="127.0.0.1"):
+    """{指标名: 次数}，只看某个主机"""
+    return {h["name"]: h["count"] for h in snapshot["histograms"] if h["labels"].get("host") == host}
+
+def _check_metrics_json(main, tmp, url):
+    """
+    main.py --list-mirrors --probe --metrics-json=FILE 对本地桩镜像探测能力（项目页 + Range 请求），
+    退出时写出的快照里各阶段的次数应与请求数、新建连接数一致
+    """
+    registry = os.path.join(tmp, "registry.json")
+    with open(registry, "w", encoding="utf-8") as f:
+        json.dump({"mirrors": [{"id": "stub", "url": url, "tags": ["bench-metrics"]}]}, f)
+    out = os.path.join(tmp, "metrics.json")
+    env = dict(os.environ, HOME=tmp, XDG_CONFIG_HOME=os.path.join(tmp, ".config"), no_proxy="*")
+    subprocess.run([sys.executable, os.path.join(HERE, "main.py"), "--list-mirrors", "--probe", "--json",
+                    "--tag=bench-metrics", "--registry=" + registry, "--metrics-json=" + out],
+                   check=True, env=env, stdout=subprocess.DEVNULL, timeout=60)
+    with open(out, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    counts = _histogram_counts(snapshot)
+    counters = {(c["name"], c["labels"].get("code") or c["labels"].get("connection")): c["value"]
+                for c in snapshot["counters"] if c["labels"].get("host") == "127.0.0.1"}
+    # 桩镜像对 bytes=0-0 返回完整文件（200）
+    assert counters.get(("pip_mirror_responses_total", "200")) == 2, counters
+    assert counts.get("pip_mirror_ttfb_seconds") == 2, counts
+    new = counters.get(("pip_mirror_pool_requests_total", "new"), 0)
+    assert new + counters.get(("pip_mirror_pool_requests_total", "reused"), 0) == 2, counters
+    assert counts.get("pip_mirror_dns_seconds") == counts.get("pip_mirror_connect_seconds") == new, counts
+    assert "pip_mirror_tls_seconds" not in counts, counts
+    for h in snapshot["histograms"]:
+        assert sum(h["buckets"].values()) == h["count"] and h["mean"] * h["count"] <= h["sum"] + 1e-5, h
+    return counts
+
+def bench_metrics():
+    """
+    一次 HTTPS 请求（本地 TLS 桩服务器，经共享连接池）后检查 /metrics 的 Prometheus 文本：
+    DNS / 连接 / TLS / 首字节 / 传输各记录一次，响应与连接计数各为 1；
+    再以子进程运行 --list-mirrors --probe --metrics-json 检查退出时写出的 JSON 快照
+    """
+    import ssl
+    import urllib.request
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-metrics-")
+    saved = main._metrics
+    main._metrics = main.MetricsRegistry()
+    servers = []
+    try:
+        pair = _make_tls_cert(tmp)
+        if pair is None:
+            return {"skipped": "openssl not found (set OPENSSL=/path/to/openssl)"}
+        server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_ctx.load_cert_chain(*pair)
+        stub = _TLSStubServer(server_ctx)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        servers.append(stub)
+        pool = main.HTTPPool(context=ssl.create_default_context(cafile=pair[0]), proxies={})
+        start = time.perf_counter()
+        with pool.open("https://127.0.0.1:{0}/simple/".format(stub.server_address[1])) as resp:
+            resp.read()
+        request_ms = (time.perf_counter() - start) * 1000
+        pool.close()
+
+        endpoint = main.serve_metrics(0)
+        servers.append(endpoint)
+        with urllib.request.urlopen("http://127.0.0.1:{0}/metrics".format(endpoint.server_address[1]),
+                                    timeout=10) as resp:
+            content_type = resp.headers.get("Content-Type")
+            text = resp.read().decode("utf-8")
+        assert content_type == main.METRICS_CONTENT_TYPE, content_type
+        lines = set(text.splitlines())
+        for phase in METRICS_PHASES:
+            name = "pip_mirror_{0}_seconds".format(phase)
+            assert "# TYPE {0} histogram".format(name) in lines, name
+            assert '{0}_count{{host="127.0.0.1"}} 1'.format(name) in lines, name
+            assert '{0}_bucket{{host="127.0.0.1",le="+Inf"}} 1'.format(name) in lines, name
+        assert "# TYPE pip_mirror_responses_total counter" in lines, text
+        assert 'pip_mirror_responses_total{code="200",host="127.0.0.1"} 1' in lines, text
+        assert 'pip_mirror_pool_requests_total{connection="new",host="127.0.0.1"} 1' in lines, text
+        snapshot = main._metrics.snapshot()
+        assert _histogram_counts(snapshot) == {"pip_mirror_{0}_seconds".format(p): 1 for p in METRICS_PHASES}
+
+        mirror, url = _serve_mirror({"pip-24.0-py3-none-any.whl": b"x" * 1024})
+        servers.append(mirror)
+        json_counts = _check_metrics_json(main, tmp, url)
+    finally:
+        main._metrics = saved
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"request_ms": round(request_ms, 1), "prometheus_lines": len(lines),
+            "json_ttfb": json_counts["pip_mirror_ttfb_seconds"]}
+
+# ================== 负载回放 ==================
+REPLAY_PROJECTS = 8
+REPLAY_WHEEL_BYTES = 64 * 1024
+REPLAY_LEVELS = (1, 8, 32)
+REPLAY_FAST_RATE = 256 * 1024 * 1024      # 快镜像：每条连接的限速，基本不受限
+REPLAY_THROTTLED_RATE = 8 * 1024 * 1024   # 慢镜像：所有连接共享的出口带宽
+
+def make_pip_log(projects=REPLAY_PROJECTS):
+    """
+    合成的 pip install -v 日志，按 pip 24 的真实输出格式：-v 不记录项目页 URL，只有 "Collecting" 行；
+    files.pythonhosted.org 上的文件只显示文件名，并夹杂依赖来源、进度条与无关行
+    """
+    lines = ["Using pip 24.0 from /usr/lib/python3/site-packages/pip (python 3.11)",
+             "Looking in indexes: https://pypi.org/simple",
+             "Requirement already satisfied: setuptools in /usr/lib/python3/site-packages (69.0.3)"]
+    for i in range(projects):
+        source = " (from pkg0)" if i else ""
+        lines += ["Collecting pkg{0}{1}".format(i, ">=1.0" + source if i else ""),
+                  "  Downloading pkg{0}-1.0-py3-none-any.whl (64 kB)".format(i),
+                  "     ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━ 64.0/64.0 kB 9.1 MB/s eta 0:00:00"]
+    lines.append("Installing collected packages: " + ", ".join("pkg{0}".format(i) for i in range(projects)))
+    lines.append("Successfully installed " + " ".join("pkg{0}-1.0".format(i) for i in range(projects)))
+    return lines
+
+def bench_replay():
+    """
+    从合成的 pip -v 日志解析请求序列，用 asyncio 负载生成器在快慢两个本地镜像上逐级提高并发回放；
+    慢镜像所有连接共享一条限速链路，并发越高延迟越大
+    """
+    import main
+    trace = main.parse_pip_log(make_pip_log())
+    assert trace[:2] == [{"kind": "index", "project": "pkg0"},
+                         {"kind": "file", "filename": "pkg0-1.0-py3-none-any.whl"}], trace
+    assert len(trace) == 2 * REPLAY_PROJECTS, trace
+    files = make_wheelhouse(REPLAY_PROJECTS, REPLAY_WHEEL_BYTES)
+    servers = [_serve_mirror(files, rate=REPLAY_FAST_RATE),
+               _serve_mirror(files, shared_rate=REPLAY_THROTTLED_RATE)]
+    results = {"trace": len(trace)}
+    try:
+        reports = main.replay_mirrors(trace, [url for _, url in servers], REPLAY_LEVELS, timeout=30)
+    finally:
+        for server, _ in servers:
+            server.shutdown()
+            server.server_close()
+    for label, report in zip(("fast", "throttled"), reports):
+        assert report["missing"] == 0, report
+        for level in report["levels"]:
+            c = level["concurrency"]
+            assert level["requests"] == c * len(trace) and level["errors"] == 0, level
+            assert level["p50"] <= level["p95"] <= level["p99"], level
+            results["{0}_c{1}_p95_ms".format(label, c)] = round(level["p95"] * 1000, 1)
+            results["{0}_c{1}_rps".format(label, c)] = round(level["rps"], 1)
+    top = REPLAY_LEVELS[-1]
+    assert results["throttled_c{0}_p95_ms".format(top)] > results["fast_c{0}_p95_ms".format(top)], results
+    return results
+
+# ================== 集群共享测速结果 ==================
+FLEET_WRITERS = 8       # 同时写入的进程数；每两个进程使用同一主机名（同一个 JSONL 文件）
+FLEET_BATCHES = 50      # 每个进程写入的批次数（相当于 50 次 --benchmark）
+FLEET_BATCH_ROWS = 20   # 每批的测量条数（约为内置镜像数的两倍）
+
+_FLEET_WRITER = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import main
+store, writer = main.open_fleet_store(sys.argv[2]), int(sys.argv[3])
+location = ("host{{0}}".format(writer // 2), "10.0.0.0/24", "bench")
+for batch in range({batches}):
+    results = [{{"url": "https://m{{0}}.example/simple/".format(writer), "ok": True, "ttfb": 0.05,
+                "throughput": 1e6, "score": 0.1 + writer / 100.0 + i / 1e4}} for i in range({rows})]
+    store.append(main.fleet_rows(results, location))
+""".format(batches=FLEET_BATCHES, rows=FLEET_BATCH_ROWS)
+
+def bench_fleet():
+    """
+    多个进程同时向 SQLite 文件与 JSON Lines 目录两种集群存储追加测量：
+    写完后条数必须一条不少、每条都能解析，汇总推荐必须是评分最低的写入者；记录写入与查询耗时。
+    另检查同一私有网段的不同站点分开汇总、--fleet --export 不重复导出、--auto 能查到本站点的推荐
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-fleet-")
+    expected = FLEET_WRITERS * FLEET_BATCHES * FLEET_BATCH_ROWS
+    results = {"writers": FLEET_WRITERS, "rows": expected}
+    try:
+        for label, name in (("jsonl", "fleet"), ("sqlite", "fleet.db")):
+            path = os.path.join(tmp, name)
+            start = time.perf_counter()
+            procs = [subprocess.Popen([sys.executable, "-c", _FLEET_WRITER, HERE, path, str(w)])
+                     for w in range(FLEET_WRITERS)]
+            codes = [p.wait() for p in procs]
+            results[label + "_write_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            assert codes == [0] * FLEET_WRITERS, codes
+
+            start = time.perf_counter()
+            rows = list(main.open_fleet_store(path).rows())
+            rec = main.fleet_recommendation(path, location=("new-host", "10.0.0.0/24", "bench"))
+            results[label + "_query_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            assert len(rows) == expected, (label, len(rows), expected)
+            per_writer = {}
+            for row in rows:
+                per_writer[row["url"]] = per_writer.get(row["url"], 0) + 1
+            assert sorted(per_writer.values()) == [FLEET_BATCHES * FLEET_BATCH_ROWS] * FLEET_WRITERS, per_writer
+            assert rec and rec["url"] == "https://m0.example/simple/", rec
+        check_fleet_sites(main, os.path.join(tmp, "sites"))
+        check_fleet_auto(main, os.path.join(tmp, "auto"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+def check_fleet_auto(main, path):
+    """
+    新网络上的 --auto 必须用与导出时相同的站点键查到集群推荐：
+    显式站点名（PIP_MIRROR_FLEET_SITE）与自动推断的网段 + 网关两种情况
+    """
+    saved = {k: os.environ.get(k) for k in (main.FLEET_STORE_ENV, main.FLEET_SITE_ENV)}
+    cfg_path = os.path.join(path, "pip.conf")
+    try:
+        for site, fast in (("lab", "https://m0.example/simple/"), (None, "https://m1.example/simple/")):
+            store = os.path.join(path, "store-{0}".format(site or "auto"))
+            os.environ[main.FLEET_STORE_ENV] = store
+            if site:
+                os.environ[main.FLEET_SITE_ENV] = site
+            else:
+                os.environ.pop(main.FLEET_SITE_ENV, None)
+            results = [{"url": url, "ok": True, "score": 0.1 if url == fast else 0.5}
+                       for url in ("https://m0.example/simple/", "https://m1.example/simple/")]
+            assert main.export_to_fleet(results) == 2
+            health = main.MirrorHealthCache(os.path.join(path, "health-{0}.json".format(site or "auto")))
+            report = main.auto_select_mirror(cfg_path, health)
+            assert report["fleet"] and report["url"] == fast, (site, report)
+            assert not report["preselect"] and not report["results"], report
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def check_fleet_sites(main, path):
+    """
+    同一私有网段、不同网关的两个站点各自得到自己的推荐；
+    健康缓存只导出上次导出后有更新的条目，重复写入的记录在汇总时只计一次
+    """
+    store = main.open_fleet_store(path)
+    office = ("a1", "192.168.1.0/24@02:00:00:00:00:0a", "fa")
+    home = ("b1", "192.168.1.0/24@02:00:00:00:00:0b", "fb")
+    for location, fast in ((office, "https://m0.example/simple/"), (home, "https://m1.example/simple/")):
+        results = [{"url": url, "ok": True, "score": 0.1 if url == fast else 0.5, "updated": 1000.0}
+                   for url in ("https://m0.example/simple/", "https://m1.example/simple/")]
+        store.append(main.fleet_rows(results, location))
+        store.append(main.fleet_rows(results, location))   # 重复导出
+    for location, fast in ((office, "https://m0.example/simple/"), (home, "https://m1.example/simple/")):
+        rec = main.fleet_recommendation(path, location=("new-host",) + location[1:], now=2000.0)
+        assert rec and rec["url"] == fast and rec["samples"] == 1, (location, rec)
+
+    health = main.MirrorHealthCache(os.path.join(path, "health.json"))
+    health.record_all([{"url": "https://m0.example/simple/", "ok": True, "score": 0.1},
+                       {"url": "https://m1.example/simple/", "ok": False, "error": "timeout"}])
+    assert len(health.unexported()) == 2
+    health.mark_exported(e["url"] for e in health.unexported())
+    assert health.unexported() == []
+    health.record({"url": "https://m1.example/simple/", "ok": True, "score": 0.2}, now=time.time() + 1)
+    assert [e["url"] for e in health.unexported()] == ["https://m1.example/simple/"], health.unexported()
+
+# ================== pip 缓存目录 ==================
+# 合成缓存的文件数，可用环境变量 BENCH_PIP_CACHE_FILES 调整
+PIP_CACHE_FILES = int(os.environ.get("BENCH_PIP_CACHE_FILES", "200000"))
+PIP_CACHE_SLOW_FILES = 1500     # 模拟网络盘时的缓存规模（每次读目录都有往返延迟，规模大了太慢）
+PIP_CACHE_SLOW_LATENCY = 0.002  # 模拟的每次目录读取延迟（秒），约为局域网 NFS 的一次往返
+PIP_CACHE_SLOW_WORKERS = 16
+PIP_CACHE_WHEEL_SHARE = 10    # 每 N 个条目中有一个是 wheels 条目，其余为 http-v2 的头部 + .body 两个文件
+
+def make_pip_cache(root, files=PIP_CACHE_FILES):
+    """
+    按 pip 的目录布局生成合成缓存：http-v2/a/b/c/d/e/<哈希>(.body)、wheels/ab/cd/ef/<哈希>/x.whl。
+    第 i 个条目的 mtime 为基准时间减 i 分钟（越靠后越旧），每 3 个条目中有一个在写入后被读取过。
+    返回 (条目数, 文件数, 总字节数)
+    """
+    base = time.time()
+    entries = total = written = 0
+    while written < files:
+        digest = hashlib.sha224(str(entries).encode("ascii")).hexdigest()
+        if entries % PIP_CACHE_WHEEL_SHARE == 0:
+            folder = os.path.join(root, "wheels", digest[:2], digest[2:4], digest[4:6], digest[6:])
+            parts = (("pkg-1.0-py3-none-any.whl", 1024),)
+        else:
+            folder = os.path.join(root, "http-v2", *list(digest[:5]))
+            parts = ((digest, 64), (digest + ".body", 512))
+        os.makedirs(folder, exist_ok=True)
+        mtime = base - 60 * entries
+        atime = mtime + 30 if entries % 3 == 0 else mtime
+        for name, size in parts:
+            path = os.path.join(folder, name)
+            with open(path, "wb") as f:
+                f.write(b"\0" * size)
+            os.utime(path, (atime, mtime))
+            total += size
+            written += 1
+        entries += 1
+    return entries, written, total
+
+def _scan_slow_disk(main, root):
+    """
+    模拟网络盘：每次打开目录先等待 PIP_CACHE_SLOW_LATENCY 秒（sleep 与网络 I/O 一样释放 GIL），
+    比较串行与 PIP_CACHE_SLOW_WORKERS 个线程并行扫描；并行必须明显更快且结果相同
+    """
+    make_pip_cache(root, PIP_CACHE_SLOW_FILES)
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        time.sleep(PIP_CACHE_SLOW_LATENCY)
+        return scandir(path)
+
+    results = {}
+    os.scandir = slow_scandir
+    try:
+        found = {}
+        for label, workers in (("scan_slow_serial_ms", 1), ("scan_slow_parallel_ms", PIP_CACHE_SLOW_WORKERS)):
+            start = time.perf_counter()
+            found[label] = sorted(main.walk_files(root, workers))
+            results[label] = round((time.perf_counter() - start) * 1000, 1)
+    finally:
+        os.scandir = scandir
+    assert found["scan_slow_serial_ms"] == found["scan_slow_parallel_ms"]
+    assert results["scan_slow_parallel_ms"] * 3 < results["scan_slow_serial_ms"], results
+    return results
+
+def bench_pip_cache():
+    """
+    合成的大型 pip 缓存（默认 20 万个文件）上：串行与并行扫描的耗时、大小与命中率统计是否正确，
+    模拟高延迟网络盘时并行扫描的加速，
+    以及按 LRU 淘汰到一半容量的耗时与正确性（被删的必须是最旧的条目）
+    """
+    import main
+    tmp = tempfile.mkdtemp(prefix="bench-pipcache-")
+    try:
+        start = time.perf_counter()
+        entries, files, total = make_pip_cache(tmp)
+        results = {"files": files, "entries": entries, "mib": round(total / 1024.0 ** 2, 1),
+                   "generate_s": round(time.perf_counter() - start, 1)}
+        start = time.perf_counter()
+        scanned = main.pip_cache_entries(tmp)
+        results["scan_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        start = time.perf_counter()
+        parallel = main.pip_cache_entries(tmp, PIP_CACHE_SLOW_WORKERS)
+        results["scan_parallel_local_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        assert len(parallel) == len(scanned)
+        stats = main.pip_cache_stats(tmp, scanned)
+        assert stats["files"] == files and stats["bytes"] == total, stats
+        assert len(scanned) == entries, len(scanned)
+        results["hit_rate"] = stats["hit_rate"]
+        assert abs(stats["hit_rate"] - 1 / 3.0) < 0.01, stats["hit_rate"]
+
+        budget = total // 2
+        start = time.perf_counter()
+        pruned = main.prune_pip_cache(tmp, budget, entries=scanned)
+        results["prune_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        results["pruned_entries"] = pruned["removed_entries"]
+        assert pruned["after"] <= budget and not pruned["errors"], pruned
+        remaining = main.pip_cache_entries(tmp)
+        assert sum(e["size"] for e in remaining) == pruned["after"]
+        # LRU：留下的每个条目都比删掉的任何条目更新
+        removed = sorted(scanned, key=lambda e: e["last_used"])[:pruned["removed_entries"]]
+        assert min(e["last_used"] for e in remaining) >= max(e["last_used"] for e in removed)
+        results.update(_scan_slow_disk(main, os.path.join(tmp, "slow")))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "config_read": bench_config_read,
+    "config_write": bench_config_write,
+    "batch": bench_batch,
+    "config_roundtrip": bench_config_roundtrip,
+    "language": bench_language,
+    "mirrors": bench_mirrors,
+    "registry": bench_registry,
+    "benchmark": bench_benchmark,
+    "parser": bench_parser,
+    "freshness": bench_freshness,
+    "prefetch": bench_prefetch,
+    "proxy": bench_proxy,
+    "failover": bench_failover,
+    "watch": bench_watch,
+    "pool": bench_pool,
+    "metrics": bench_metrics,
+    "replay": bench_replay,
+    "fleet": bench_fleet,
+    "pip_cache": bench_pip_cache,
+}
+
+# ================== 输出与基线比较 ==================
+_LOWER_IS_BETTER = ("_ms", "_us", "_kib")
+
+def compare_results(baseline, results, tolerance=COMPARE_TOLERANCE):
+    """
+    逐项比较耗时类指标，返回 [(基准.指标, 基线值, 当前值, 变化百分比, 是否回归)]；
+    基线中没有的基准或指标跳过
+    """
+    rows = []
+    for name, metrics in sorted(results.items()):
+        old_metrics = baseline.get(name) or {}
+        for key, value in sorted(metrics.items()):
+            old = old_metrics.get(key)
+            if not key.endswith(_LOWER_IS_BETTER) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / float(old) * 100
+            rows.append(("{0}.{1}".format(name, key), old, value, round(change, 1), change > tolerance))
+    return rows
+
+def _option(name, default=None):
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+def main():
+    names = [a for a in sys.argv[1:] if not a.startswith("--")] or list(BENCHMARKS)
+    as_json = "--json" in sys.argv
+    results, failures = {}, {}
+    for name in names:
+        try:
+            results[name] = BENCHMARKS[name]()
+            if not as_json:
+                print("{0}: ok {1}".format(name, results[name]))
+        except AssertionError as e:
+            failures[name] = str(e)
+            if not as_json:
+                print("{0}: FAILED {1}".format(name, e))
+    report = {"python": sys.version.split()[0], "platform": sys.platform,
+              "results": results, "failures": failures}
+    if _option("--save"):
+        with open(_option("--save"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    regressions = []
+    if _option("--compare"):
+        with open(_option("--compare"), "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        rows = compare_results(baseline, results, float(_option("--tolerance", COMPARE_TOLERANCE)))
+        regressions = [r for r in rows if r[4]]
+        report["comparison"] = [{"metric": m, "baseline": old, "current": new, "change_pct": pct,
+                                 "regression": bad} for m, old, new, pct, bad in rows]
+        if not as_json:
+            print()
+            for metric, old, new, pct, bad in rows:
+                print("{0:<40} {1:>12} {2:>12} {3:>+8.1f}%{4}".format(
+                    metric, old, new, pct, "  REGRESSION" if bad else ""))
+    if as_json:
+        print(json.dumps(report, indent=1, sort_keys=True))
+    sys.exit(1 if failures or regressions else 0)
+
+if __name__ == "__main__":
+    main()
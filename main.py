@@ -4,13 +4,37 @@
 import sys
 import os
 import locale
+import math
 import subprocess
+import threading
+import time
+import queue
+import random
 from pathlib import Path
-import tkinter as tk
-from tkinter import ttk, messagebox
 
+import atexit
+import base64
+import bisect
+import calendar
+import codecs
 import configparser
-from urllib.parse import urlparse
+import hashlib
+import http.client
+import io
+import json
+import re
+import shutil
+import socket
+import socketserver
+import sysconfig
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from html import escape as html_escape, unescape as html_unescape
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, urljoin, unquote
 
 # ================== 语言检测（避免使用已弃用的 getdefaultlocale） ==================
 def detect_language():
@@ -71,7 +95,14 @@ def detect_language():
     return "en"
 
 
-LANG = detect_language()
+_lang = None
+
+def get_lang():
+    """首次调用时才检测语言，命令行/脚本场景不在导入时做 locale 工作"""
+    global _lang
+    if _lang is None:
+        _lang = detect_language()
+    return _lang
 
 # 你可在此自定义英文应用名称
 EN_APP_NAME = "Pip Mirror Manager"
@@ -107,6 +138,7 @@ TRANSLATIONS = {
         "loaded": "(Loaded)",
         "cli.title": "Pip Mirror Manager (CLI)",
         "cli.menu": "Choose a mirror (number) or 0 for custom URL, R to restore official, Q to quit:",
+        "cli.menu_fleet": "Choose a mirror (number) or 0 for custom URL, F for the fleet recommendation, R to restore official, Q to quit:",
         "cli.prompt": "Your choice: ",
         "cli.enter_custom": "Enter custom URL (http/https): ",
         "cli.invalid": "Invalid input. Try again.",
@@ -114,6 +146,62 @@ TRANSLATIONS = {
         "cli.restored": "Restored to official source.",
         "cli.invalid_url": "Invalid URL.",
         "cli.enter_to_exit": "Press Enter to exit...",
+        "btn.benchmark": "Benchmark",
+        "status.benchmarking": "Benchmarking {count} mirrors...",
+        "status.benchmark_done": "Fastest: {name} ({ms} ms)",
+        "status.benchmark_failed": "Benchmark failed: no mirror reachable.",
+        "bench.title": "Mirror benchmark (project page: {project})",
+        "bench.header": "#   Mirror                      TTFB    Page     MB/s    Score",
+        "bench.failed": "unreachable: {err}",
+        "bench.applied": "Fastest mirror written to {path}\nindex-url = {url}",
+        "bench.none": "No mirror is reachable; config left unchanged.",
+        "cache.ranking": "Cached ranking: {items}",
+        "cache.refreshing": "Refreshing {count} stale mirror results in the background...",
+        "serve.started": "Serving cached index on {url} (upstream: {upstream}, cache: {cache})",
+        "serve.applied": "pip now points at the local proxy: {path}",
+        "serve.stopped": "Proxy stopped.",
+        "serve.failed": "Cannot start proxy: {err}",
+        "metrics.serving": "Metrics: {url}",
+        "watch.started": "Watching {count} mirrors every ~{interval}s (switch when {margin}% faster for {rounds} rounds); current: {url}",
+        "watch.keep": "keep {current} ({current_ms} ms)",
+        "watch.pending": "{challenger} ({challenger_ms} ms) beats {current} ({current_ms} ms): {streak}/{rounds}",
+        "watch.switch": "switched to {challenger} ({challenger_ms} ms), was {current} ({current_ms} ms)",
+        "watch.hold": "no mirror reachable; keeping {current}",
+        "watch.error": "cannot switch to {challenger}: {err}",
+        "watch.stopped": "Watch stopped.",
+        "auto.cached": "Known network {network}: using cached winner {name}",
+        "auto.new_network": "New network {network}: preselecting mirrors by TCP connect RTT",
+        "auto.elapsed": "Done in {ms} ms",
+        "registry.title": "Mirror registry ({count} mirrors; file: {path})",
+        "registry.error": "Skipped registry entry: {err}",
+        "status.effective_override": "Note: pip actually uses {url} (set by {source})",
+        "effective.title": "Effective pip configuration (later entries override earlier ones):",
+        "effective.values": "[global] values pip will use:",
+        "effective.none": "(none; pip defaults apply)",
+        "prefetch.done": "{downloaded} downloaded, {cached} already present, {failed} failed in {seconds}s -> {dest}",
+        "pipcache.set": "cache-dir = {dir} written to {path}",
+        "fleet.no_store": "No fleet store configured; pass --fleet-store=PATH (a .db/.sqlite file or a directory) or set PIP_MIRROR_FLEET_STORE",
+        "fleet.exported": "Exported {count} measurements to {path}",
+        "fleet.group": "{group}: {hosts} hosts, {samples} measurements",
+        "fleet.header": "  Mirror                       Hosts    OK  Median  Trimmed",
+        "fleet.none": "No usable fleet data for {group} in the last {days} days",
+        "fleet.recommend": "Fleet recommendation for {group}: {name} ({hosts} hosts, median {ms} ms)",
+        "fleet.apply": "Apply fleet recommendation",
+        "auto.fleet": "New network {network}: using fleet recommendation {name} ({hosts} hosts), no probing",
+        "replay.no_trace": "No requests found; pass --trace=FILE with the output of pip install -v (or - for stdin)",
+        "replay.need_trace": "--trace=FILE is required: the output of pip install -v, or - to read a piped log from stdin",
+        "replay.title": "Replaying {count} requests ({index} index pages, {files} files) at concurrency {levels}",
+        "replay.mirror": "{name}: {url}",
+        "replay.missing": "  {count} files of the trace are not on this mirror (counted as errors)",
+        "pipcache.summary": "pip cache: {dir} — {mb:.1f} MB in {files} files, hit rate {rate}",
+        "pipcache.kind": "  {kind:<7} {entries:>8} entries {mb:>10.1f} MB  reused {reused} ({rate})",
+        "pipcache.missing": "pip cache directory does not exist: {dir}",
+        "pipcache.pruned": "Pruned {entries} entries ({mb:.1f} MB): {before:.1f} MB -> {after:.1f} MB, {errors} errors",
+        "metrics.failed": "Cannot start metrics endpoint: {err}",
+        "failover.header": "Mirror                        Won  Hedged Tripped Failed",
+        "fresh.title": "Mirror freshness for {count} projects (reference: {reference})",
+        "fresh.header": "Mirror                      Missing     Pins      Lag Errors",
+        "fresh.no_packages": "Give --requirements=FILE or --packages=a,b==1.0",
         # Mirrors
         "mirror.official": "Official PyPI",
         "mirror.tuna": "Tsinghua TUNA",
@@ -155,6 +243,7 @@ TRANSLATIONS = {
         "loaded": "（已加载）",
         "cli.title": "pip下载加速配置（命令行）",
         "cli.menu": "选择镜像（输入序号），或输入 0 使用自定义 URL，输入 R 恢复官方源，输入 Q 退出：",
+        "cli.menu_fleet": "选择镜像（输入序号），或输入 0 使用自定义 URL，输入 F 使用集群推荐，输入 R 恢复官方源，输入 Q 退出：",
         "cli.prompt": "请输入：",
         "cli.enter_custom": "请输入自定义 URL（http/https）：",
         "cli.invalid": "输入无效，请重试。",
@@ -162,6 +251,62 @@ TRANSLATIONS = {
         "cli.restored": "已恢复为官方源。",
         "cli.invalid_url": "URL 无效。",
         "cli.enter_to_exit": "按回车键退出……",
+        "btn.benchmark": "测速",
+        "status.benchmarking": "正在测速 {count} 个镜像……",
+        "status.benchmark_done": "最快：{name}（{ms} ms）",
+        "status.benchmark_failed": "测速失败：没有可访问的镜像。",
+        "bench.title": "镜像测速（项目页：{project}）",
+        "bench.header": "#   镜像                        首字节  项目页   MB/s    评分",
+        "bench.failed": "无法访问：{err}",
+        "bench.applied": "已将最快镜像写入 {path}\nindex-url = {url}",
+        "bench.none": "没有可访问的镜像，配置未修改。",
+        "cache.ranking": "缓存的测速排名：{items}",
+        "cache.refreshing": "正在后台刷新 {count} 个过期的测速结果……",
+        "serve.started": "本地缓存索引已启动：{url}（上游：{upstream}，缓存：{cache}）",
+        "serve.applied": "pip 已指向本地代理：{path}",
+        "serve.stopped": "代理已停止。",
+        "serve.failed": "无法启动代理：{err}",
+        "metrics.serving": "指标：{url}",
+        "watch.started": "正在监视 {count} 个镜像，约每 {interval} 秒一轮（连续 {rounds} 轮快 {margin}% 以上时切换）；当前：{url}",
+        "watch.keep": "保持 {current}（{current_ms} ms）",
+        "watch.pending": "{challenger}（{challenger_ms} ms）快于 {current}（{current_ms} ms）：{streak}/{rounds}",
+        "watch.switch": "已切换到 {challenger}（{challenger_ms} ms），原为 {current}（{current_ms} ms）",
+        "watch.hold": "没有可访问的镜像，保持 {current}",
+        "watch.error": "无法切换到 {challenger}：{err}",
+        "watch.stopped": "监视已停止。",
+        "auto.cached": "已知网络 {network}：使用缓存的最快镜像 {name}",
+        "auto.new_network": "新网络 {network}：按 TCP 连接 RTT 预选镜像",
+        "auto.elapsed": "耗时 {ms} ms",
+        "registry.title": "镜像注册表（{count} 个镜像；文件：{path}）",
+        "registry.error": "已跳过注册表条目：{err}",
+        "status.effective_override": "注意：pip 实际使用的是 {url}（来自 {source}）",
+        "effective.title": "pip 实际生效的配置（后列出的覆盖先列出的）：",
+        "effective.values": "pip 将使用的 [global] 设置：",
+        "effective.none": "（无；使用 pip 默认值）",
+        "prefetch.done": "下载 {downloaded} 个，已存在 {cached} 个，失败 {failed} 个，耗时 {seconds} 秒 -> {dest}",
+        "pipcache.set": "已将 cache-dir = {dir} 写入 {path}",
+        "fleet.no_store": "未配置集群存储；请用 --fleet-store=PATH（.db/.sqlite 文件或目录）或环境变量 PIP_MIRROR_FLEET_STORE 指定",
+        "fleet.exported": "已导出 {count} 条测量到 {path}",
+        "fleet.group": "{group}：{hosts} 台主机，{samples} 条测量",
+        "fleet.header": "  镜像                         主机数  成功率  中位数  截尾均值",
+        "fleet.none": "{group} 最近 {days} 天没有可用的集群数据",
+        "fleet.recommend": "集群推荐（{group}）：{name}（{hosts} 台主机，中位数 {ms} ms）",
+        "fleet.apply": "使用集群推荐",
+        "auto.fleet": "新网络 {network}：使用集群推荐的 {name}（{hosts} 台主机），无需探测",
+        "replay.no_trace": "未找到任何请求；请用 --trace=FILE 指定 pip install -v 的输出（- 表示标准输入）",
+        "replay.need_trace": "必须指定 --trace=FILE：pip install -v 的输出，或用 - 从管道读取日志",
+        "replay.title": "回放 {count} 个请求（项目页 {index} 个，文件 {files} 个），并发级别 {levels}",
+        "replay.mirror": "{name}：{url}",
+        "replay.missing": "  轨迹中有 {count} 个文件在该镜像上不存在（计为错误）",
+        "pipcache.summary": "pip 缓存：{dir} — {files} 个文件，共 {mb:.1f} MB，命中率 {rate}",
+        "pipcache.kind": "  {kind:<7} {entries:>8} 个条目 {mb:>10.1f} MB  被复用 {reused}（{rate}）",
+        "pipcache.missing": "pip 缓存目录不存在：{dir}",
+        "pipcache.pruned": "已淘汰 {entries} 个条目（{mb:.1f} MB）：{before:.1f} MB -> {after:.1f} MB，失败 {errors} 个",
+        "metrics.failed": "无法启动指标端点：{err}",
+        "failover.header": "镜像                         胜出    对冲   熔断   失败",
+        "fresh.title": "{count} 个项目的镜像同步情况（参考：{reference}）",
+        "fresh.header": "镜像                         缺失文件 缺失固定版本 延迟   错误",
+        "fresh.no_packages": "请指定 --requirements=FILE 或 --packages=a,b==1.0",
         # Mirrors
         "mirror.official": "官方 PyPI",
         "mirror.tuna": "清华大学 TUNA",
@@ -203,6 +348,7 @@ TRANSLATIONS = {
         "loaded": "（已載入）",
         "cli.title": "pip下載加速配置（命令列）",
         "cli.menu": "選擇鏡像（輸入序號），或輸入 0 使用自訂 URL，輸入 R 恢復官方來源，輸入 Q 離開：",
+        "cli.menu_fleet": "選擇鏡像（輸入序號），或輸入 0 使用自訂 URL，輸入 F 使用叢集推薦，輸入 R 恢復官方來源，輸入 Q 離開：",
         "cli.prompt": "請輸入：",
         "cli.enter_custom": "請輸入自訂 URL（http/https）：",
         "cli.invalid": "輸入無效，請重試。",
@@ -210,6 +356,62 @@ TRANSLATIONS = {
         "cli.restored": "已恢復為官方來源。",
         "cli.invalid_url": "URL 無效。",
         "cli.enter_to_exit": "按下 Enter 鍵離開……",
+        "btn.benchmark": "測速",
+        "status.benchmarking": "正在測速 {count} 個鏡像……",
+        "status.benchmark_done": "最快：{name}（{ms} ms）",
+        "status.benchmark_failed": "測速失敗：沒有可存取的鏡像。",
+        "bench.title": "鏡像測速（專案頁：{project}）",
+        "bench.header": "#   鏡像                        首位元組 專案頁   MB/s    評分",
+        "bench.failed": "無法存取：{err}",
+        "bench.applied": "已將最快鏡像寫入 {path}\nindex-url = {url}",
+        "bench.none": "沒有可存取的鏡像，設定未修改。",
+        "cache.ranking": "快取的測速排名：{items}",
+        "cache.refreshing": "正在背景重新整理 {count} 個過期的測速結果……",
+        "serve.started": "本機快取索引已啟動：{url}（上游：{upstream}，快取：{cache}）",
+        "serve.applied": "pip 已指向本機代理：{path}",
+        "serve.stopped": "代理已停止。",
+        "serve.failed": "無法啟動代理：{err}",
+        "metrics.serving": "指標：{url}",
+        "watch.started": "正在監視 {count} 個鏡像，約每 {interval} 秒一輪（連續 {rounds} 輪快 {margin}% 以上時切換）；目前：{url}",
+        "watch.keep": "保持 {current}（{current_ms} ms）",
+        "watch.pending": "{challenger}（{challenger_ms} ms）快於 {current}（{current_ms} ms）：{streak}/{rounds}",
+        "watch.switch": "已切換到 {challenger}（{challenger_ms} ms），原為 {current}（{current_ms} ms）",
+        "watch.hold": "沒有可存取的鏡像，保持 {current}",
+        "watch.error": "無法切換到 {challenger}：{err}",
+        "watch.stopped": "監視已停止。",
+        "auto.cached": "已知網路 {network}：使用快取的最快鏡像 {name}",
+        "auto.new_network": "新網路 {network}：依 TCP 連線 RTT 預選鏡像",
+        "auto.elapsed": "耗時 {ms} ms",
+        "registry.title": "鏡像註冊表（{count} 個鏡像；檔案：{path}）",
+        "registry.error": "已略過註冊表條目：{err}",
+        "status.effective_override": "注意：pip 實際使用的是 {url}（來自 {source}）",
+        "effective.title": "pip 實際生效的設定（後列出的覆蓋先列出的）：",
+        "effective.values": "pip 將使用的 [global] 設定：",
+        "effective.none": "（無；使用 pip 預設值）",
+        "prefetch.done": "下載 {downloaded} 個，已存在 {cached} 個，失敗 {failed} 個，耗時 {seconds} 秒 -> {dest}",
+        "pipcache.set": "已將 cache-dir = {dir} 寫入 {path}",
+        "fleet.no_store": "未設定叢集儲存；請用 --fleet-store=PATH（.db/.sqlite 檔案或目錄）或環境變數 PIP_MIRROR_FLEET_STORE 指定",
+        "fleet.exported": "已匯出 {count} 筆量測到 {path}",
+        "fleet.group": "{group}：{hosts} 台主機，{samples} 筆量測",
+        "fleet.header": "  鏡像                         主機數  成功率  中位數  截尾平均",
+        "fleet.none": "{group} 最近 {days} 天沒有可用的叢集資料",
+        "fleet.recommend": "叢集推薦（{group}）：{name}（{hosts} 台主機，中位數 {ms} ms）",
+        "fleet.apply": "使用叢集推薦",
+        "auto.fleet": "新網路 {network}：使用叢集推薦的 {name}（{hosts} 台主機），無需探測",
+        "replay.no_trace": "未找到任何請求；請用 --trace=FILE 指定 pip install -v 的輸出（- 表示標準輸入）",
+        "replay.need_trace": "必須指定 --trace=FILE：pip install -v 的輸出，或用 - 從管線讀取日誌",
+        "replay.title": "重播 {count} 個請求（專案頁 {index} 個，檔案 {files} 個），並行級別 {levels}",
+        "replay.mirror": "{name}：{url}",
+        "replay.missing": "  軌跡中有 {count} 個檔案在該鏡像上不存在（計為錯誤）",
+        "pipcache.summary": "pip 快取：{dir} — {files} 個檔案，共 {mb:.1f} MB，命中率 {rate}",
+        "pipcache.kind": "  {kind:<7} {entries:>8} 個條目 {mb:>10.1f} MB  被重用 {reused}（{rate}）",
+        "pipcache.missing": "pip 快取目錄不存在：{dir}",
+        "pipcache.pruned": "已淘汰 {entries} 個條目（{mb:.1f} MB）：{before:.1f} MB -> {after:.1f} MB，失敗 {errors} 個",
+        "metrics.failed": "無法啟動指標端點：{err}",
+        "failover.header": "鏡像                         勝出    對沖   熔斷   失敗",
+        "fresh.title": "{count} 個專案的鏡像同步情況（參考：{reference}）",
+        "fresh.header": "鏡像                         缺失檔案 缺失固定版本 延遲   錯誤",
+        "fresh.no_packages": "請指定 --requirements=FILE 或 --packages=a,b==1.0",
         # Mirrors
         "mirror.official": "官方 PyPI",
         "mirror.tuna": "清華大學 TUNA",
@@ -224,10 +426,19 @@ TRANSLATIONS = {
     },
 }
 
+_merged_translations = None
+
+def _translations():
+    """当前语言与英文合并后的字典（英文兜底），只构建一次"""
+    global _merged_translations
+    if _merged_translations is None:
+        merged = dict(TRANSLATIONS["en"])
+        merged.update(TRANSLATIONS.get(get_lang(), {}))
+        _merged_translations = merged
+    return _merged_translations
+
 def t(key, **kwargs):
-    base = TRANSLATIONS.get("en", {})
-    data = TRANSLATIONS.get(LANG, base)
-    text = data.get(key, base.get(key, key))
+    text = _translations().get(key, key)
     if kwargs:
         try:
             return text.format(**kwargs)
@@ -235,22 +446,172 @@ def t(key, **kwargs):
             return text
     return text
 
-# ================== 镜像源（尽量使用 https） ==================
-MIRROR_DEFS = [
-    ("official", "https://pypi.org/simple/"),
-    ("tuna",     "https://pypi.tuna.tsinghua.edu.cn/simple/"),
-    ("bfsu",     "https://mirrors.bfsu.edu.cn/pypi/web/simple/"),
-    ("sjtu",     "https://mirror.sjtu.edu.cn/pypi/web/simple/"),
-    ("ustc",     "https://mirrors.ustc.edu.cn/pypi/web/simple/"),
-    ("zju",      "https://mirrors.zju.edu.cn/pypi/web/simple/"),
-    ("aliyun",   "https://mirrors.aliyun.com/pypi/simple/"),
-    ("huawei",   "https://mirrors.huaweicloud.com/repository/pypi/simple/"),
-    ("tencent",  "https://mirrors.cloud.tencent.com/pypi/simple/"),
+# ================== 镜像源注册表（内置 + 文件，尽量使用 https） ==================
+# (id, URL, 区域, 标签, 已知能力)；显示名称来自翻译键 mirror.<id>
+BUILTIN_MIRRORS = [
+    ("official", "https://pypi.org/simple/", "global", ("official",),
+     {"json_api": True, "http2": True, "range": True}),
+    ("tuna",     "https://pypi.tuna.tsinghua.edu.cn/simple/", "cn", ("edu",), {}),
+    ("bfsu",     "https://mirrors.bfsu.edu.cn/pypi/web/simple/", "cn", ("edu",), {}),
+    ("sjtu",     "https://mirror.sjtu.edu.cn/pypi/web/simple/", "cn", ("edu",), {}),
+    ("ustc",     "https://mirrors.ustc.edu.cn/pypi/web/simple/", "cn", ("edu",), {}),
+    ("zju",      "https://mirrors.zju.edu.cn/pypi/web/simple/", "cn", ("edu",), {}),
+    ("aliyun",   "https://mirrors.aliyun.com/pypi/simple/", "cn", ("cloud",), {}),
+    ("huawei",   "https://mirrors.huaweicloud.com/repository/pypi/simple/", "cn", ("cloud",), {}),
+    ("tencent",  "https://mirrors.cloud.tencent.com/pypi/simple/", "cn", ("cloud",), {}),
     # 豆瓣長期不穩定，如需可取消註釋
-    # ("douban",   "https://pypi.doubanio.com/simple/"),
+    # ("douban",   "https://pypi.doubanio.com/simple/", "cn", ("community",), {}),
 ]
 
-DEFAULT_URL = MIRROR_DEFS[0][1]
+DEFAULT_URL = BUILTIN_MIRRORS[0][1]
+REGISTRY_FILE_NAME = "pip-mirror-registry.json"
+CAPABILITIES = ("json_api", "http2", "range")
+
+class Mirror(object):
+    """
+    一个镜像：id、URL、可选显示名称、区域、标签与能力（json_api / http2 / range，未知为 None）
+    """
+    __slots__ = ("id", "url", "name", "region", "tags", "capabilities")
+
+    def __init__(self, id, url, name=None, region="", tags=(), capabilities=None):
+        self.id = id
+        self.url = url
+        self.name = name
+        self.region = region or ""
+        self.tags = tuple(tags or ())
+        caps = capabilities or {}
+        self.capabilities = dict((k, caps.get(k)) for k in CAPABILITIES)
+
+    @property
+    def key(self):
+        return normalize_url(self.url)
+
+    def display_name(self):
+        key = "mirror." + self.id
+        if key in _translations():
+            return t(key)
+        return self.name or self.id
+
+    def to_dict(self):
+        return {"id": self.id, "url": self.url, "name": self.display_name(), "region": self.region,
+                "tags": list(self.tags), "capabilities": dict(self.capabilities)}
+
+class MirrorRegistry(object):
+    """
+    有序的镜像集合，按 id 与规范化 URL 建立索引，查找为 O(1)；
+    位置索引供 GUI 下拉框与 CLI 菜单按序号取镜像
+    """
+    def __init__(self, mirrors=()):
+        self._mirrors = []
+        self._by_id = {}
+        self._by_url = {}
+        self._pos = {}
+        self.errors = []
+        for mirror in mirrors:
+            self.add(mirror)
+
+    def _reindex(self):
+        self._by_id = dict((m.id, m) for m in self._mirrors)
+        self._by_url = dict((m.key, m) for m in self._mirrors)
+        self._pos = dict((m.id, i) for i, m in enumerate(self._mirrors))
+
+    def add(self, mirror):
+        """新增镜像；id 或 URL 与已有镜像相同时原位替换"""
+        old = self._by_id.get(mirror.id) or self._by_url.get(mirror.key)
+        if old is not None:
+            self._mirrors[self._pos[old.id]] = mirror
+        else:
+            self._mirrors.append(mirror)
+        self._reindex()
+
+    def remove(self, mirror_id):
+        if mirror_id in self._by_id:
+            self._mirrors.pop(self._pos[mirror_id])
+            self._reindex()
+
+    def get(self, mirror_id):
+        return self._by_id.get(mirror_id)
+
+    def find(self, url):
+        return self._by_url.get(normalize_url(url))
+
+    def index(self, url):
+        """URL 在注册表中的位置，不在其中时返回 -1"""
+        mirror = self.find(url)
+        return -1 if mirror is None else self._pos[mirror.id]
+
+    def __getitem__(self, idx):
+        return self._mirrors[idx]
+
+    def __iter__(self):
+        return iter(list(self._mirrors))
+
+    def __len__(self):
+        return len(self._mirrors)
+
+    def urls(self):
+        return [m.url for m in self._mirrors]
+
+    def filter(self, region=None, tag=None):
+        return [m for m in self._mirrors
+                if (not region or m.region == region) and (not tag or tag in m.tags)]
+
+    def load_file(self, path):
+        """
+        读取 JSON 注册表文件：{"mirrors": [{"id", "url", "name", "region", "tags", "capabilities"}]}
+        或直接是列表。与内置镜像 id/URL 相同的条目覆盖内置值，"disabled": true 移除该镜像。
+        无法解析的文件或条目记入 errors 后跳过
+        """
+        try:
+            with open(str(path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.errors.append("{0}: {1}".format(path, e))
+            return
+        entries = data.get("mirrors", []) if isinstance(data, dict) else data
+        for entry in entries:
+            try:
+                url = entry.get("url", "")
+                mirror_id = entry.get("id") or normalize_url(url)
+                old = self.get(mirror_id) or self.find(url)
+                if entry.get("disabled"):
+                    if old is not None:
+                        self.remove(old.id)
+                    continue
+                if old is not None:
+                    caps = dict(old.capabilities, **(entry.get("capabilities") or {}))
+                    mirror = Mirror(old.id, url or old.url, entry.get("name", old.name),
+                                    entry.get("region", old.region), entry.get("tags", old.tags), caps)
+                else:
+                    if not is_valid_url(url):
+                        raise ValueError("invalid url {0!r}".format(url))
+                    mirror = Mirror(mirror_id, url, entry.get("name"), entry.get("region"),
+                                    entry.get("tags"), entry.get("capabilities"))
+                self.add(mirror)
+            except Exception as e:
+                self.errors.append("{0}: {1}".format(path, e))
+
+def builtin_registry():
+    return MirrorRegistry(Mirror(mid, url, None, region, tags, caps)
+                          for mid, url, region, tags, caps in BUILTIN_MIRRORS)
+
+def get_registry_path():
+    """--registry=FILE > 环境变量 PIP_MIRROR_REGISTRY > pip 配置目录下的 pip-mirror-registry.json"""
+    return (get_cli_option("--registry") or os.environ.get("PIP_MIRROR_REGISTRY")
+            or str(Path(get_user_pip_config_path()).parent / REGISTRY_FILE_NAME))
+
+_registry = None
+
+def get_registry():
+    """内置镜像 + 注册表文件，首次使用时加载"""
+    global _registry
+    if _registry is None:
+        registry = builtin_registry()
+        registry.load_file(get_registry_path())
+        _registry = registry
+    return _registry
 
 # ================== 配置文件路径（跨平台） ==================
 def get_user_pip_config_path():
@@ -278,276 +639,4498 @@ def get_user_pip_config_path():
     pip_dir.mkdir(parents=True, exist_ok=True)
     return pip_dir / suffix
 
-# ================== 读写配置 ==================
-def read_current_index_url(cfg_path):
+def current_layout():
+    if os.name == "nt":
+        return "windows"
+    if sys.platform == "darwin":
+        return "macos"
+    return "linux"
+
+def resolve_pip_config_path(home, layout=None):
     """
-    读取现有配置中的 index-url（若无则返回空字符串）
+    按平台布局返回某个主目录（其他用户、容器镜像的根目录等）下的用户级 pip 配置路径，
+    与 get_user_pip_config_path 的规则一致，但不读取当前用户的环境变量、也不创建目录
     """
-    path = Path(cfg_path)
-    if not path.exists():
+    home = Path(home)
+    layout = layout or current_layout()
+    if layout == "windows":
+        return home / "AppData" / "Roaming" / "pip" / "pip.ini"
+    if layout == "macos":
+        return home / "Library" / "Application Support" / "pip" / "pip.conf"
+    path = home / ".config" / "pip" / "pip.conf"
+    legacy = home / ".pip" / "pip.conf"
+    if legacy.exists() and not path.exists():
+        return legacy
+    return path
+
+# ================== 指标（--metrics） ==================
+# 直方图桶上限（秒），与 Prometheus 客户端的默认值一致
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+METRIC_HELP = {
+    "pip_mirror_dns_seconds": "DNS resolution time per mirror host",
+    "pip_mirror_connect_seconds": "TCP connect time per mirror host",
+    "pip_mirror_tls_seconds": "TLS handshake time per mirror host",
+    "pip_mirror_ttfb_seconds": "Time from request sent to response headers per mirror host",
+    "pip_mirror_transfer_seconds": "Response body transfer time per mirror host",
+    "pip_mirror_responses_total": "HTTP responses per mirror host and status code",
+    "pip_mirror_pool_requests_total": "Requests per mirror host on new or reused pooled connections",
+    "pip_mirror_config_seconds": "pip config read/write time",
+    "pip_mirror_proxy_requests_total": "Proxy requests by kind and cache result",
+}
+
+def _format_labels(labels):
+    if not labels:
         return ""
-    cp = configparser.RawConfigParser()
-    # 尝试多种编码
-    for enc in ("utf-8", "utf-8-sig", "mbcs", "latin-1"):
-        try:
-            cp.read(path, encoding=enc)
-            break
-        except Exception:
-            continue
-    if cp.has_section("global") and cp.has_option("global", "index-url"):
-        return cp.get("global", "index-url").strip()
-    return ""
+    return "{" + ",".join('{0}="{1}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')
+                                             .replace("\n", "\\n")) for k, v in labels) + "}"
 
-def write_pip_config(cfg_path, index_url):
+class MetricsRegistry(object):
     """
-    写入 [global] index-url；若是 http 则自动加入 trusted-host
+    线程安全的计数器与直方图，按 (名称, 标签) 聚合；
+    输出 Prometheus 文本格式（/metrics）或 JSON 快照（--metrics-json）
     """
-    path = Path(cfg_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    host = urlparse(index_url).hostname or ""
-    lines = ["[global]", "index-url = {0}".format(index_url)]
-    if index_url.lower().startswith("http://") and host:
-        lines.append("trusted-host = {0}".format(host))
-    content = "\n".join(lines) + "\n"
-    # 使用 utf-8 写入
-    with path.open("w", encoding="utf-8") as f:
-        f.write(content)
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
 
-def is_valid_url(url):
-    try:
-        u = urlparse(url)
-        return u.scheme in ("http", "https") and bool(u.netloc)
-    except Exception:
-        return False
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
 
-# ================== GUI ==================
-class PipMirrorGUI(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title(t("app.title"))
-        self.resizable(True, True)
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            hist["counts"][idx] += 1
+            hist["sum"] += value
+            hist["count"] += 1
 
-        self.cfg_path = get_user_pip_config_path()
-        self.current_url = read_current_index_url(self.cfg_path) or DEFAULT_URL
+    def _items(self):
+        with self._lock:
+            counters = sorted(self._counters.items(), key=lambda kv: kv[0])
+            hists = sorted(((k, dict(v, counts=list(v["counts"]))) for k, v in self._histograms.items()),
+                           key=lambda kv: kv[0])
+        return counters, hists
 
-        self._build_widgets()
-        self._load_current_selection()
-        self._apply_layout_policies()
-        self.bind("<Configure>", self._on_resize)
+    def render_prometheus(self):
+        counters, hists = self._items()
+        lines = []
+        seen = set()
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append("# HELP {0} {1}".format(name, METRIC_HELP.get(name, name)))
+                lines.append("# TYPE {0} {1}".format(name, kind))
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append("{0}{1} {2}".format(name, _format_labels(labels), value))
+        for (name, labels), hist in hists:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets + (None,), hist["counts"]):
+                cumulative += n
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append("{0}_bucket{1} {2}".format(name, _format_labels(labels + (("le", le),)), cumulative))
+            lines.append("{0}_sum{1} {2!r}".format(name, _format_labels(labels), hist["sum"]))
+            lines.append("{0}_count{1} {2}".format(name, _format_labels(labels), hist["count"]))
+        return "\n".join(lines) + "\n"
 
-    def _build_widgets(self):
-        padding = {"padx": 12, "pady": 8}
+    def snapshot(self):
+        """JSON 快照：直方图给出次数、总和、平均值与各桶（非累计）计数"""
+        counters, hists = self._items()
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in counters],
+            "histograms": [{"name": name, "labels": dict(labels), "count": h["count"],
+                            "sum": round(h["sum"], 6), "mean": round(h["sum"] / h["count"], 6),
+                            "buckets": {("+Inf" if b is None else repr(b)): n
+                                        for b, n in zip(self.buckets + (None,), h["counts"])}}
+                           for (name, labels), h in hists],
+        }
 
-        # 顶部：路径与打开按钮
-        frm_top = ttk.Frame(self)
-        frm_top.pack(fill="x", **padding)
+# 未启用时为 None：埋点处只多一次全局变量判断
+_metrics = None
 
-        ttk.Label(frm_top, text=t("label.user_config_file")).pack(side="left")
-        self.lbl_path = ttk.Label(frm_top, text=str(self.cfg_path), foreground="#555")
-        self.lbl_path.pack(side="left", fill="x", expand=True)
+def enable_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
 
-        btn_open = ttk.Button(frm_top, text=t("btn.open_folder"), command=self.open_folder)
-        btn_open.pack(side="right")
+def get_metrics():
+    return _metrics
 
-        # 中部：镜像选择 + 自定义
-        frm_mid = ttk.LabelFrame(self, text=t("group.select_mirror"))
-        frm_mid.pack(fill="x", **padding)
+def observe_metric(name, value, **labels):
+    if _metrics is not None:
+        _metrics.observe(name, value, **labels)
 
-        ttk.Label(frm_mid, text=t("label.common_mirrors")).grid(row=0, column=0, sticky="w", padx=8, pady=6)
+def inc_metric(name, amount=1, **labels):
+    if _metrics is not None:
+        _metrics.inc(name, amount, **labels)
 
-        mirror_values = [u"{0}  |  {1}".format(t("mirror." + mid), url) for mid, url in MIRROR_DEFS]
+def write_metrics_json(path):
+    """把指标快照写入文件；path 为 - 时写到标准错误，不干扰标准输出上的 JSON 结果"""
+    if _metrics is None:
+        return
+    data = json.dumps(_metrics.snapshot(), indent=1)
+    if path == "-":
+        sys.stderr.write(data + "\n")
+    else:
+        write_text_atomic(path, data + "\n", fsync=False)
 
-        self.combo = ttk.Combobox(frm_mid, state="readonly", values=mirror_values)
-        self.combo.grid(row=0, column=1, sticky="ew", padx=8, pady=6)
-        frm_mid.columnconfigure(1, weight=1)
+class _TimedResponse(http.client.HTTPResponse):
+    """响应体读完或关闭时记录传输耗时"""
+    _metric_host = None
+    _transfer_start = 0.0
 
-        ttk.Label(frm_mid, text=t("label.custom_url")).grid(row=1, column=0, sticky="w", padx=8, pady=6)
-        self.ent_custom = ttk.Entry(frm_mid)
-        self.ent_custom.grid(row=1, column=1, sticky="ew", padx=8, pady=6)
+    def _observe_transfer(self):
+        if self._metric_host is not None:
+            observe_metric("pip_mirror_transfer_seconds", time.perf_counter() - self._transfer_start,
+                           host=self._metric_host)
+            self._metric_host = None
 
-        # 主操作按钮
-        frm_primary = ttk.Frame(self)
-        frm_primary.pack(fill="x", **padding)
-        self.btn_save = ttk.Button(frm_primary, text=t("btn.save_user"), command=self.save_config)
-        self.btn_save.pack(side="left")
+    def _close_conn(self):
+        self._observe_transfer()
+        http.client.HTTPResponse._close_conn(self)
 
-        # 次要按钮
-        frm_btn = ttk.Frame(self)
-        frm_btn.pack(fill="x", **padding)
-        ttk.Button(frm_btn, text=t("btn.restore_official"), command=self.restore_default).pack(side="left")
-        ttk.Button(frm_btn, text=t("btn.exit"), command=self.quit).pack(side="right")
+    def close(self):
+        self._observe_transfer()
+        http.client.HTTPResponse.close(self)
 
-        # 当前状态
-        frm_status = ttk.Frame(self)
-        frm_status.pack(fill="x", **padding)
-        self.status_var = tk.StringVar(value="")
-        ttk.Label(frm_status, textvariable=self.status_var, foreground="#0a7").pack(anchor="w")
+class _TimedConnectionMixin(object):
+    """
+    分阶段计时的 http.client 连接：DNS、TCP 连接、（HTTPS）TLS 握手、首字节、传输。
+    经代理隧道时以目标主机作为 host 标签；DNS 结果来自进程内缓存（见 DNSCache）
+    """
+    response_class = _TimedResponse
+    _request_sent = 0.0
 
-        # 底部提示（自动换行）
-        self.lbl_tip = ttk.Label(self, text=t("tip"), foreground="#666", justify="left")
-        self.lbl_tip.pack(anchor="w", fill="x", padx=12, pady=(0, 12))
+    def _metric_host(self):
+        return self._tunnel_host or self.host
 
-    def _load_current_selection(self):
-        current = self.current_url.strip().rstrip("/")
-        matched = False
-        for idx, (_, url) in enumerate(MIRROR_DEFS):
-            if current == url.strip().rstrip("/"):
-                self.combo.current(idx)
-                matched = True
+    def _open_socket(self):
+        host = self._metric_host()
+        start = time.perf_counter()
+        infos = _dns_cache.resolve(self.host, self.port)
+        resolved = time.perf_counter()
+        observe_metric("pip_mirror_dns_seconds", resolved - start, host=host)
+        error = None
+        for info in infos:
+            try:
+                sock = socket.create_connection(info[4][:2], self.timeout, self.source_address)
                 break
-        if not matched:
-            self.combo.set(u"{0}  |  {1}".format(t("custom"), t("loaded")))
-            self.ent_custom.delete(0, tk.END)
-            self.ent_custom.insert(0, self.current_url)
-        self.status_var.set(t("status.current_index", url=self.current_url))
-
-    def _apply_layout_policies(self):
-        self.update_idletasks()
-        self._update_tip_wraplength()
-        req_w = self.winfo_reqwidth()
-        req_h = self.winfo_reqheight()
-        # 设为最小尺寸以避免裁切
-        self.minsize(req_w, req_h)
-        self._center_window(req_w, req_h)
-
-    def _update_tip_wraplength(self):
-        width = max(self.winfo_width(), self.winfo_reqwidth())
-        wrap = max(200, width - 24)
+            except OSError as e:
+                error = e
+        else:
+            # 地址可能已失效，下次重新解析
+            _dns_cache.forget(self.host, self.port)
+            raise error or OSError("no address for {0}".format(self.host))
+        observe_metric("pip_mirror_connect_seconds", time.perf_counter() - resolved, host=host)
         try:
-            self.lbl_tip.configure(wraplength=wrap)
-        except Exception:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
             pass
+        self.sock = sock
+        if self._tunnel_host:
+            self._tunnel()
 
-    def _center_window(self, w=None, h=None):
-        self.update_idletasks()
-        if w is None:
-            w = self.winfo_width()
-        if h is None:
-            h = self.winfo_height()
-        sw = self.winfo_screenwidth()
-        sh = self.winfo_screenheight()
-        x = int((sw - w) / 2)
-        y = int((sh - h) / 2.5)
-        self.geometry("{0}x{1}+{2}+{3}".format(w, h, x, y))
+    def request(self, *args, **kwargs):
+        http.client.HTTPConnection.request(self, *args, **kwargs)
+        self._request_sent = time.perf_counter()
 
-    def _on_resize(self, event):
-        self._update_tip_wraplength()
+    def getresponse(self):
+        resp = http.client.HTTPConnection.getresponse(self)
+        host = self._metric_host()
+        now = time.perf_counter()
+        observe_metric("pip_mirror_ttfb_seconds", now - self._request_sent, host=host)
+        inc_metric("pip_mirror_responses_total", host=host, code=str(resp.status))
+        if resp.fp is not None:
+            resp._metric_host = host
+            resp._transfer_start = now
+        return resp
 
-    def open_folder(self):
-        folder = str(Path(self.cfg_path).parent)
-        try:
-            if os.name == "nt":
-                os.startfile(folder)
-            elif sys.platform == "darwin":
-                subprocess.run(["open", folder], check=False)
-            else:
-                subprocess.run(["xdg-open", folder], check=False)
-        except Exception as e:
-            messagebox.showerror(t("error"), t("error.open_folder", err=e))
+class _TimedHTTPConnection(_TimedConnectionMixin, http.client.HTTPConnection):
+    def connect(self):
+        self._open_socket()
 
-    def get_target_url(self):
-        custom = self.ent_custom.get().strip()
-        if custom:
-            return custom
-        sel = self.combo.get()
-        if " | " in sel:
-            return sel.split(" | ")[-1].strip()
-        return DEFAULT_URL
+class _TimedHTTPSConnection(_TimedConnectionMixin, http.client.HTTPSConnection):
+    # TLSSessionCache：握手时尝试恢复同一主机上次的会话
+    tls_sessions = None
 
-    def save_config(self):
-        url = self.get_target_url()
-        if not is_valid_url(url):
-            messagebox.showwarning(t("warn.invalid_url_title"), t("warn.invalid_url_msg"))
+    def _tls_peer(self):
+        return self._tunnel_host or self.host, self._tunnel_port or self.port
+
+    def connect(self):
+        self._open_socket()
+        host, port = self._tls_peer()
+        session = self.tls_sessions.get(host, port) if self.tls_sessions is not None else None
+        start = time.perf_counter()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=host, session=session)
+        observe_metric("pip_mirror_tls_seconds", time.perf_counter() - start, host=self._metric_host())
+
+    def close(self):
+        # TLS 1.3 的会话票据在握手之后才到达，关闭前再保存一次
+        if self.tls_sessions is not None and self.sock is not None:
+            host, port = self._tls_peer()
+            self.tls_sessions.save(host, port, self.sock)
+        http.client.HTTPSConnection.close(self)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/metrics" or _metrics is None:
+            self.send_error(404)
             return
-        try:
-            write_pip_config(self.cfg_path, url)
-            self.current_url = url
-            self.status_var.set(t("status.current_index", url=url))
-            messagebox.showinfo(t("ok.title"), t("ok.saved", url=url, path=self.cfg_path))
-        except Exception as e:
-            messagebox.showerror(t("fail.write_title"), t("fail.write_msg", err=e))
+        body = _metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-    def restore_default(self):
-        try:
-            write_pip_config(self.cfg_path, DEFAULT_URL)
-            self.current_url = DEFAULT_URL
-            self.ent_custom.delete(0, tk.END)
-            for idx, (_, url) in enumerate(MIRROR_DEFS):
-                if url.strip().rstrip("/") == DEFAULT_URL.strip().rstrip("/"):
-                    self.combo.current(idx)
-                    break
-            self.status_var.set(t("status.current_index", url=DEFAULT_URL))
-            messagebox.showinfo(t("ok.restored_title"), t("ok.restored_msg"))
-        except Exception as e:
-            messagebox.showerror(t("fail.restore_title"), t("fail.restore_msg", err=e))
 
-# ================== CLI 回退（可选） ==================
-def run_cli():
-    cfg_path = get_user_pip_config_path()
-    current = read_current_index_url(cfg_path) or DEFAULT_URL
-    print(t("cli.title"))
-    print("-" * 60)
-    print(t("status.current_index", url=current))
-    print()
-    for i, (mid, url) in enumerate(MIRROR_DEFS, 1):
-        print("{0}. {1}: {2}".format(i, t("mirror." + mid), url))
-    print("0. {0}".format(t("custom")))
-    print("R. {0}".format(t("btn.restore_official")))
-    print("Q. quit")
-    while True:
+def serve_metrics(port, host="127.0.0.1"):
+    """在后台线程提供独立的 /metrics 端点（GUI、--cli、--watch 等没有自带 HTTP 服务的长时间运行模式）"""
+    enable_metrics()
+    server = HTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ================== 读写配置 ==================
+# 解析结果缓存的文件数上限（用户/全局/site/PIP_CONFIG_FILE 等）
+CONFIG_CACHE_SIZE = 64
+_CONFIG_BOMS = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be"))
+
+_config_cache = OrderedDict()
+_config_cache_lock = threading.Lock()
+
+def sniff_config_encoding(data):
+    """
+    一次性解码配置文件内容，返回 (文本, (BOM, 编码))：有 BOM（UTF-8 / UTF-16）时按 BOM 解码；
+    否则依次尝试 utf-8、系统首选编码（如中文 Windows 的 cp936），最后 latin-1（不会失败）。
+    latin-1 解码后再编码得到原样的字节，插入的键值又都是 ASCII，因此按它写回也不会改动其余内容
+    """
+    for bom, enc in _CONFIG_BOMS:
+        if data.startswith(bom):
+            try:
+                return data[len(bom):].decode(enc), (bom, enc)
+            except UnicodeDecodeError:
+                break
+    for enc in ("utf-8", locale.getpreferredencoding(False)):
         try:
-            print()
-            print(t("cli.menu"))
-            choice = input(t("cli.prompt")).strip()
-        except (EOFError, KeyboardInterrupt):
-            print()
-            break
-        if not choice:
-            print(t("cli.invalid"))
+            return data.decode(enc), (b"", enc)
+        except (UnicodeDecodeError, LookupError):
             continue
-        if choice.lower() == "q":
-            break
-        if choice.lower() == "r":
-            try:
-                write_pip_config(cfg_path, DEFAULT_URL)
-                print(t("cli.restored"))
-            except Exception as e:
-                print(t("fail.restore_msg", err=e))
+    return data.decode("latin-1"), (b"", "latin-1")
+
+def decode_config_bytes(data):
+    return sniff_config_encoding(data)[0]
+
+def encode_config_text(text, encoding):
+    """按读取时识别出的编码写回，保留 BOM"""
+    bom, enc = encoding
+    return bom + text.encode(enc)
+
+def parse_config_text(text):
+    """
+    解析 ini 文本为 {节: 键值映射}（键名不区分大小写）；格式错误的行忽略，其余内容照常解析。
+    各节直接使用 configparser 的节代理，不逐键复制（大文件上复制比解析本身还慢）
+    """
+    cp = configparser.RawConfigParser(strict=False)
+    try:
+        cp.read_string(text)
+    except configparser.Error:
+        pass
+    return {section: cp[section] for section in cp.sections()}
+
+def load_config_file(path):
+    """
+    读取并解析配置文件，返回 {节: {键: 值}}；文件不存在或不可读时返回 {}。
+    结果按 (路径, mtime, 大小, inode) 缓存：文件未变化时只需一次 stat。
+    返回值在调用方之间共享，不要修改
+    """
+    key = os.path.abspath(str(path))
+    try:
+        st = os.stat(key)
+    except OSError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _config_cache_lock:
+        cached = _config_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            _config_cache.move_to_end(key)
+            return cached[1]
+    try:
+        with open(key, "rb") as f:
+            # 以读到的内容对应的状态为准，避免 stat 与读取之间文件被替换
+            st = os.fstat(f.fileno())
+            data = f.read()
+    except OSError:
+        return {}
+    parsed = parse_config_text(decode_config_bytes(data))
+    with _config_cache_lock:
+        _config_cache[key] = ((st.st_mtime_ns, st.st_size, st.st_ino), parsed)
+        _config_cache.move_to_end(key)
+        while len(_config_cache) > CONFIG_CACHE_SIZE:
+            _config_cache.popitem(last=False)
+    return parsed
+
+def forget_config_file(path):
+    """本进程写入配置后丢弃缓存（mtime 精度较粗的文件系统上 stat 可能看不出变化）"""
+    with _config_cache_lock:
+        _config_cache.pop(os.path.abspath(str(path)), None)
+
+def _index_info(options):
+    """从 [global] 的键值中取出下载源设置"""
+    info = {"index_url": "", "extra_index_urls": [], "trusted_hosts": [],
+            "timeout": None, "retries": None}
+    def get(key):
+        # pip 同时接受 index-url 与 index_url 两种写法
+        for name in (key, key.replace("-", "_")):
+            if name in options:
+                return options[name].strip()
+        return ""
+    info["index_url"] = get("index-url")
+    info["extra_index_urls"] = get("extra-index-url").split()
+    info["trusted_hosts"] = get("trusted-host").split()
+    try:
+        # pip 的 timeout 是浮点数（如 0.5）；整数值保持为 int，写回时不会变成 "6.0"
+        timeout = float(get("timeout")) if get("timeout") else None
+        info["timeout"] = int(timeout) if timeout is not None and timeout.is_integer() else timeout
+    except ValueError:
+        pass
+    try:
+        info["retries"] = int(float(get("retries"))) if get("retries") else None
+    except ValueError:
+        pass
+    return info
+
+def read_pip_index_config(cfg_path):
+    """
+    读取 [global] 中与下载源相关的设置：
+      index_url / extra_index_urls / trusted_hosts / timeout / retries
+    extra-index-url 与 trusted-host 支持多行或空白分隔的多值写法。
+    """
+    start = time.perf_counter()
+    info = _index_info(load_config_file(cfg_path).get("global", {}))
+    observe_metric("pip_mirror_config_seconds", time.perf_counter() - start, op="read")
+    return info
+
+def read_current_index_url(cfg_path):
+    """
+    读取现有配置中的 index-url（若无则返回空字符串）
+    """
+    return read_pip_index_config(cfg_path)["index_url"]
+
+def _format_multi(key, values):
+    if len(values) == 1:
+        return ["{0} = {1}".format(key, values[0])]
+    return ["{0} =".format(key)] + ["    {0}".format(v) for v in values]
+
+_SECTION_RE = re.compile(r"^\s*\[([^\]]+)\]")
+_KEY_RE = re.compile(r"^([^\s#;=:\[][^=:]*?)\s*[=:]")
+
+def _ini_key(name):
+    # configparser 会把键名转成小写；pip 同时接受 index_url 与 index-url
+    return name.strip().lower().replace("_", "-")
+
+def update_ini_section(text, section, updates):
+    """
+    只修改 section 中 updates 列出的键，其余内容（注释、其他键与节、空行）原样保留。
+    updates: {键名: 替换后的行列表 | None(删除)}；不存在的键追加到该节末尾，
+    节不存在时追加到文件末尾。
+    """
+    newline = "\r\n" if "\r\n" in text else "\n"
+    out = []
+    current = None
+    found = False
+    insert_at = None
+    done = set()
+    skipping = False
+    for line in text.splitlines():
+        m = _SECTION_RE.match(line)
+        if m:
+            current = m.group(1).strip()
+            skipping = False
+            out.append(line)
+            if current == section:
+                found = True
+                insert_at = len(out)
             continue
-        if choice == "0":
-            url = input(t("cli.enter_custom")).strip()
-            if not is_valid_url(url):
-                print(t("cli.invalid_url"))
+        is_continuation = bool(line.strip()) and line[0] in " \t"
+        if skipping and is_continuation:
+            continue  # 被替换键的续行
+        skipping = False
+        if current == section:
+            km = _KEY_RE.match(line)
+            if km and _ini_key(km.group(1)) in updates:
+                key = _ini_key(km.group(1))
+                if key not in done and updates[key] is not None:
+                    out.extend(updates[key])
+                done.add(key)
+                skipping = True
+                insert_at = len(out)
                 continue
-            try:
-                write_pip_config(cfg_path, url)
-                print(t("cli.saved", path=cfg_path, url=url))
-            except Exception as e:
-                print(t("fail.write_msg", err=e))
+            out.append(line)
+            if km or is_continuation:
+                insert_at = len(out)
             continue
-        # 数字镜像
+        out.append(line)
+    pending = [l for key, lines in updates.items() if key not in done and lines is not None for l in lines]
+    if pending:
+        if found:
+            out[insert_at:insert_at] = pending
+        else:
+            if out and out[-1].strip():
+                out.append("")
+            out.append("[{0}]".format(section))
+            out.extend(pending)
+    return newline.join(out) + newline if out else ""
+
+def merge_pip_config(text, index_url, extra_index_urls=None, timeout=None, retries=None, cache_dir=None):
+    """
+    在现有配置文本上设置 [global] index-url（可附带按优先级排列的 extra-index-url 以及 timeout/retries）。
+    所有 http 源的主机都会自动加入 trusted-host；原有 trusted-host 中不属于旧镜像的主机保留。
+    未传入 extra_index_urls 时删除旧的 extra-index-url；timeout/retries/cache_dir 为 None 时保持不变，
+    cache_dir 为空字符串时删除 cache-dir。
+    """
+    old = _index_info(parse_config_text(text).get("global", {}))
+    old_mirror_hosts = set(urlparse(u).hostname for u in [old["index_url"]] + old["extra_index_urls"] if u)
+
+    extras = [u for u in (extra_index_urls or []) if normalize_url(u) != normalize_url(index_url)]
+    hosts = [h for h in old["trusted_hosts"] if h.split(":")[0] not in old_mirror_hosts]
+    for url in [index_url] + extras:
+        host = urlparse(url).hostname or ""
+        if url.lower().startswith("http://") and host and host not in hosts:
+            hosts.append(host)
+
+    updates = OrderedDict()
+    updates["index-url"] = ["index-url = {0}".format(index_url)]
+    updates["extra-index-url"] = _format_multi("extra-index-url", extras) if extras else None
+    updates["trusted-host"] = _format_multi("trusted-host", hosts) if hosts else None
+    if timeout is not None:
+        updates["timeout"] = ["timeout = {0}".format(timeout)]
+    if retries is not None:
+        updates["retries"] = ["retries = {0}".format(retries)]
+    if cache_dir is not None:
+        updates["cache-dir"] = ["cache-dir = {0}".format(cache_dir)] if cache_dir else None
+    return update_ini_section(text, "global", updates)
+
+def write_text_atomic(path, text, fsync=True, existing=None):
+    """
+    先写同目录临时文件（fsync）再 os.replace，读者只会看到旧文件或完整的新文件。
+    text 为 str 时按 utf-8 编码，也可直接传入 bytes。内容与现有文件相同时不写入，返回 False；否则返回 True。
+    existing 为调用方已读取的原文件字节，避免重复读取
+    """
+    path = Path(path)
+    data = text if isinstance(text, bytes) else text.encode("utf-8")
+    if existing is None:
         try:
-            idx = int(choice)
-            if not (1 <= idx <= len(MIRROR_DEFS)):
-                print(t("cli.invalid"))
-                continue
-            url = MIRROR_DEFS[idx - 1][1]
-            write_pip_config(cfg_path, url)
-            print(t("cli.saved", path=cfg_path, url=url))
-        except ValueError:
-            print(t("cli.invalid"))
-        except Exception as e:
-            print(t("fail.write_msg", err=e))
-    # Windows 控制台停留
-    if os.name == "nt":
+            existing = path.read_bytes()
+        except OSError:
+            pass
+    if existing == data:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(".{0}.{1}.{2}.tmp".format(path.name, os.getpid(), threading.get_ident()))
+    try:
+        with tmp.open("wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(str(tmp), str(path))
+    except BaseException:
         try:
-            input(t("cli.enter_to_exit"))
-        except Exception:
+            os.unlink(str(tmp))
+        except OSError:
             pass
+        raise
+    return True
 
-# ================== 入口 ==================
-def main():
-    # 命令行参数：--cli 强制命令行模式
+def write_pip_config(cfg_path, index_url, extra_index_urls=None, timeout=None, retries=None, fsync=True,
+                     cache_dir=None):
+    """
+    合并写入 [global] index-url；若是 http 则自动加入 trusted-host（参见 merge_pip_config）。
+    现有文件只读取一次，并按其原编码（含 BOM）写回；编码无法识别时抛出 UnicodeError。
+    结果未变化时不写盘。返回是否写入
+    """
+    start = time.perf_counter()
+    path = Path(cfg_path)
+    try:
+        existing = path.read_bytes()
+    except OSError:
+        existing = b""
+    text, encoding = sniff_config_encoding(existing)
+    merged = merge_pip_config(text, index_url, extra_index_urls, timeout, retries, cache_dir)
+    # 按原文件的编码写回，未改动的行与注释保持原样
+    changed = write_text_atomic(path, encode_config_text(merged, encoding), fsync, existing)
+    if changed:
+        forget_config_file(path)
+    observe_metric("pip_mirror_config_seconds", time.perf_counter() - start, op="write")
+    return changed
+
+def write_pip_cache_dir(cfg_path, cache_dir):
+    """只设置 [global] cache-dir，下载源等其余内容不变；cache_dir 为空时删除该键。返回是否写入"""
+    path = Path(cfg_path)
+    try:
+        existing = path.read_bytes()
+    except OSError:
+        existing = b""
+    value = ["cache-dir = {0}".format(cache_dir)] if cache_dir else None
+    text, encoding = sniff_config_encoding(existing)
+    text = update_ini_section(text, "global", {"cache-dir": value})
+    changed = write_text_atomic(path, encode_config_text(text, encoding), True, existing)
+    if changed:
+        forget_config_file(path)
+    return changed
+
+def switch_index_url(cfg_path, url):
+    """只切换 index-url，保留现有的 extra-index-url / timeout / retries；返回是否写入"""
+    info = read_pip_index_config(cfg_path)
+    extras = [u for u in info["extra_index_urls"] if normalize_url(u) != normalize_url(url)]
+    return write_pip_config(cfg_path, url, extras, info["timeout"], info["retries"])
+
+def is_valid_url(url):
+    try:
+        u = urlparse(url)
+        return u.scheme in ("http", "https") and bool(u.netloc)
+    except Exception:
+        return False
+
+def normalize_url(url):
+    return (url or "").strip().rstrip("/")
+
+def mirror_display_name(url):
+    """
+    注册表中的镜像返回（本地化）名称，其他 URL 原样返回
+    """
+    mirror = get_registry().find(url)
+    return mirror.display_name() if mirror is not None else url
+
+# ================== pip 实际生效的配置 ==================
+# pip 自身的选项名，不会作为配置项读取
+PIP_ENV_IGNORED = ("PIP_CONFIG_FILE", "PIP_VERSION", "PIP_HELP")
+
+def _pip_user_config_dir(environ):
+    # 与 get_user_pip_config_path 相同的新位置，但按给定环境解析且不创建目录
+    if os.name == "nt":
+        return Path(environ.get("APPDATA") or str(Path.home() / "AppData" / "Roaming")) / "pip"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / "pip"
+    return Path(environ.get("XDG_CONFIG_HOME") or str(Path.home() / ".config")) / "pip"
+
+def pip_config_files(environ=None):
+    """
+    按 pip 的加载顺序返回 [(层级, 路径)]，后加载的覆盖先加载的：
+      global  系统级：$XDG_CONFIG_DIRS/pip/pip.conf 与 /etc/pip.conf（macOS 为
+              /Library/Application Support/pip/pip.conf，Windows 为 C:\\ProgramData\\pip\\pip.ini）
+      user    旧位置 ~/.pip/pip.conf（Windows 为 ~\\pip\\pip.ini），再是用户配置目录下的文件
+      site    sys.prefix 下的 pip.conf / pip.ini（当前解释器所在的虚拟环境）
+      env     PIP_CONFIG_FILE 指定的文件
+    PIP_CONFIG_FILE 为 os.devnull 时 pip 不加载任何文件；指向存在的文件时不加载 user 层
+    """
+    environ = os.environ if environ is None else environ
+    name = "pip.ini" if os.name == "nt" else "pip.conf"
+    config_file = environ.get("PIP_CONFIG_FILE")
+    if config_file == os.devnull:
+        return []
+    files = []
+    if os.name == "nt":
+        files.append(("global", Path(environ.get("ProgramData") or r"C:\ProgramData") / "pip" / name))
+    elif sys.platform == "darwin":
+        files.append(("global", Path("/Library/Application Support/pip") / name))
+    else:
+        dirs = environ.get("XDG_CONFIG_DIRS") or "/etc/xdg"
+        files.extend(("global", Path(d) / "pip" / name) for d in dirs.split(os.pathsep) if d)
+        files.append(("global", Path("/etc") / name))
+    if not (config_file and os.path.exists(config_file)):
+        files.append(("user", Path.home() / ("pip" if os.name == "nt" else ".pip") / name))
+        files.append(("user", _pip_user_config_dir(environ) / name))
+    files.append(("site", Path(sys.prefix) / name))
+    if config_file:
+        files.append(("env", Path(config_file)))
+    return files
+
+def read_effective_pip_config(environ=None):
+    """
+    按 pip 的优先级合并 [global] 设置：配置文件依 pip_config_files 的顺序逐层覆盖，
+    最后由 PIP_<选项> 环境变量覆盖（PIP_INDEX_URL → index-url）。
+    只合并 [global]；[install] 等命令节只对对应子命令生效，这里不计入。
+    返回 {"values": {选项: 值}, "sources": {选项: 来源}, "files": [{variant, path, loaded}]}
+    """
+    environ = os.environ if environ is None else environ
+    values, sources, files = {}, {}, []
+    for variant, path in pip_config_files(environ):
+        parsed = load_config_file(path)
+        files.append({"variant": variant, "path": str(path), "loaded": bool(parsed)})
+        for key, value in parsed.get("global", {}).items():
+            key = key.replace("_", "-")
+            values[key] = value
+            sources[key] = "{0}: {1}".format(variant, path)
+    for name in sorted(environ):
+        if name.startswith("PIP_") and name not in PIP_ENV_IGNORED:
+            key = name[4:].lower().replace("_", "-")
+            values[key] = environ[name]
+            sources[key] = "env: {0}".format(name)
+    return {"values": values, "sources": sources, "files": files}
+
+def effective_override_note(current, environ=None):
+    """
+    pip 实际使用的 index-url 与用户配置不同（被环境变量、site 或 PIP_CONFIG_FILE 覆盖）时
+    返回提示文本，否则返回空字符串
+    """
+    effective = read_effective_pip_config(environ)
+    url = effective["values"].get("index-url", "").strip()
+    if not url or normalize_url(url) == normalize_url(current):
+        return ""
+    return t("status.effective_override", url=url, source=effective["sources"]["index-url"])
+
+# ================== 批量配置（--batch） ==================
+BATCH_MAX_WORKERS = 32
+
+def resolve_batch_target(target, layout=None):
+    """
+    以 .conf / .ini 结尾的视为配置文件路径，其余视为主目录并按平台布局解析
+    """
+    path = Path(target).expanduser()
+    if path.suffix.lower() in (".conf", ".ini"):
+        return path
+    return resolve_pip_config_path(path, layout)
+
+def write_configs_parallel(paths, settings, max_workers=BATCH_MAX_WORKERS, fsync=True):
+    """
+    并行地对每个目标执行 write_pip_config(**settings)（合并、原子写入、无变化跳过），
+    返回 {"changed": [...], "unchanged": [...], "failed": [...]}
+    """
+    summary = {"changed": [], "unchanged": [], "failed": []}
+    paths = list(dict.fromkeys(str(p) for p in paths))
+    if not paths:
+        return summary
+
+    def write_one(path):
+        try:
+            return path, write_pip_config(path, fsync=fsync, **settings), None
+        except Exception as e:
+            return path, None, str(e) or e.__class__.__name__
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        for path, changed, err in pool.map(write_one, paths):
+            if err is not None:
+                summary["failed"].append({"path": path, "error": err})
+            else:
+                summary["changed" if changed else "unchanged"].append(path)
+    return summary
+
+# ================== 镜像测速 ==================
+BENCH_PROJECT = "numpy"              # 代表性项目页（文件多、页面大）
+BENCH_TIMEOUT = 10                   # 单次请求超时（秒）
+BENCH_SAMPLE_BYTES = 2 * 1024 * 1024 # 吞吐量采样的下载字节数
+BENCH_MAX_WORKERS = 8
+USER_AGENT = "pip-mirror-manager"
+
+def open_url(url, timeout=BENCH_TIMEOUT, headers=None):
+    """
+    GET 请求，行为与 urlopen 相同：非 2xx 抛出 HTTPError，响应有 url / getcode() / headers。
+    http/https 走共享连接池，其他协议（如 file://）交给 urllib
+    """
+    if urlparse(url).scheme not in ("http", "https"):
+        hdrs = {"User-Agent": USER_AGENT}
+        hdrs.update(headers or {})
+        return urllib.request.urlopen(urllib.request.Request(url, headers=hdrs), timeout=timeout)
+    resp = get_http_pool().open(url, headers, timeout)
+    if not 200 <= resp.status < 300:
+        with resp:
+            body = resp.read()
+        raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+    return resp
+
+def probe_mirror(index_url, project=BENCH_PROJECT, timeout=BENCH_TIMEOUT,
+                 sample_bytes=BENCH_SAMPLE_BYTES):
+    """
+    对单个镜像测速，返回结果字典：
+      ttfb          /simple/ 首字节时间（秒）
+      project_time  项目页完整下载时间（秒）
+      throughput    采样 wheel 的下载速度（字节/秒），无 wheel 时为 None
+    任一步骤失败时 ok=False，并在 error 中给出原因。
+    """
+    base = normalize_url(index_url) + "/"
+    result = {"url": index_url, "ok": False, "ttfb": None, "project_time": None,
+              "throughput": None, "score": float("inf"), "error": ""}
+    try:
+        start = time.perf_counter()
+        with open_url(base, timeout) as resp:
+            resp.read(1)
+            result["ttfb"] = time.perf_counter() - start
+
+        # 项目页边下载边解析，只保留最后（通常最新）的 wheel 作为吞吐量样本
+        start = time.perf_counter()
+        sample = None
+        for entry in iter_index_files(base, project, timeout=timeout):
+            if entry["filename"].endswith(".whl"):
+                sample = entry["url"]
+        result["project_time"] = time.perf_counter() - start
+
+        if sample:
+            received = 0
+            start = time.perf_counter()
+            with open_url(sample, timeout) as resp:
+                while received < sample_bytes:
+                    chunk = resp.read(min(65536, sample_bytes - received))
+                    if not chunk:
+                        break
+                    received += len(chunk)
+            elapsed = time.perf_counter() - start
+            if received and elapsed > 0:
+                result["throughput"] = received / elapsed
+        result["ok"] = True
+        result["score"] = score_result(result, sample_bytes)
+    except Exception as e:
+        result["error"] = str(e) or e.__class__.__name__
+    return result
+
+def score_result(result, sample_bytes=BENCH_SAMPLE_BYTES):
+    """
+    评分 = 估算的一次典型安装耗时（秒）：首字节 + 项目页 + 采样文件下载时间，越小越好
+    """
+    if not result.get("ok"):
+        return float("inf")
+    score = (result.get("ttfb") or 0) + (result.get("project_time") or 0)
+    if result.get("throughput"):
+        score += sample_bytes / result["throughput"]
+    return score
+
+def benchmark_mirrors(urls, project=BENCH_PROJECT, timeout=BENCH_TIMEOUT,
+                      sample_bytes=BENCH_SAMPLE_BYTES, max_workers=BENCH_MAX_WORKERS):
+    """
+    并发测速所有镜像，按评分从快到慢排序返回（不可达的排在最后）
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as pool:
+        results = list(pool.map(
+            lambda u: probe_mirror(u, project, timeout, sample_bytes), urls))
+    results.sort(key=lambda r: r["score"])
+    return results
+
+def benchmark_candidates(current_url=""):
+    """注册表中的镜像 + 当前配置中的自定义 URL"""
+    registry = get_registry()
+    urls = registry.urls()
+    if current_url and registry.find(current_url) is None:
+        urls.append(current_url)
+    return urls
+
+FALLBACK_COUNT = 2
+
+def plan_fallback_config(results, fallbacks=FALLBACK_COUNT):
+    """
+    由（已排序的）测速结果生成多镜像配置：最快的可达镜像作为 index-url，
+    其后 fallbacks 个作为 extra-index-url。
+    pip 会查询所有源，因此 timeout 取所选镜像中最慢“首字节+项目页”耗时的 4 倍（5~60 秒），
+    有备用源时 retries 降为 2，缩短某个源卡住时的等待。
+    """
+    ok = [r for r in results if r["ok"]]
+    if not ok:
+        return None
+    chosen = ok[:1 + max(0, fallbacks)]
+    slowest = max((r["ttfb"] or 0) + (r["project_time"] or 0) for r in chosen)
+    return {
+        "index_url": chosen[0]["url"],
+        "extra_index_urls": [r["url"] for r in chosen[1:]],
+        "timeout": int(min(60, max(5, math.ceil(slowest * 4)))),
+        "retries": 2 if len(chosen) > 1 else 5,
+    }
+
+def format_benchmark_row(rank, result):
+    name = mirror_display_name(result["url"])
+    if not result["ok"]:
+        return "{0:<3} {1:<27} {2}".format(rank, name, t("bench.failed", err=result["error"]))
+    tput = result["throughput"]
+    return "{0:<3} {1:<27} {2:>5.0f}ms {3:>6.0f}ms {4:>6} {5:>7.2f}s".format(
+        rank, name, result["ttfb"] * 1000, result["project_time"] * 1000,
+        "{0:.2f}".format(tput / 1e6) if tput else "-", result["score"])
+
+def detect_capabilities(index_url, project="pip", timeout=BENCH_TIMEOUT):
+    """
+    探测镜像能力：json_api（项目页是否返回 PEP 691 JSON）、http2（TLS ALPN 是否协商出 h2）、
+    range（分发文件是否支持 Range 请求）。无法判断的项为 None
+    """
+    caps = dict((k, None) for k in CAPABILITIES)
+    u = urlparse(index_url)
+    if u.scheme == "https":
+        import ssl
+        try:
+            ctx = ssl.create_default_context()
+            ctx.set_alpn_protocols(["h2", "http/1.1"])
+            with socket.create_connection((u.hostname, u.port or 443), timeout) as sock:
+                with ctx.wrap_socket(sock, server_hostname=u.hostname) as tls:
+                    caps["http2"] = tls.selected_alpn_protocol() == "h2"
+        except (OSError, NotImplementedError):
+            pass
+    else:
+        caps["http2"] = False
+    page_url = urljoin(normalize_url(index_url) + "/", canonical_project_name(project) + "/")
+    try:
+        with open_url(page_url, timeout, {"Accept": SIMPLE_ACCEPT}) as resp:
+            content_type = resp.headers.get("Content-Type", "")
+            caps["json_api"] = SIMPLE_JSON in content_type
+            sample = next(iter_index_entries(resp, resp.url, content_type), None)
+        if sample:
+            with open_url(sample["url"], timeout, {"Range": "bytes=0-0"}) as resp:
+                caps["range"] = resp.getcode() == 206
+    except Exception:
+        pass
+    return caps
+
+# ================== 共享 HTTP 连接池 ==================
+POOL_PER_HOST = 8            # 每个主机同时进行的请求数上限（--host-limit=N）
+POOL_MAX_IDLE = 4            # 每个主机保留的空闲长连接数
+POOL_IDLE_TIMEOUT = 30       # 空闲超过该时间（秒）的连接不再复用（服务器多半已关闭）
+DNS_TTL = 300                # 进程内 DNS 缓存的有效期（秒）
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+class DNSCache(object):
+    """getaddrinfo 结果的进程内缓存；只缓存成功的解析"""
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[(host, port)] = (now + self.ttl, infos)
+        return infos
+
+    def forget(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+_dns_cache = DNSCache()
+
+class TLSSessionCache(object):
+    """
+    按 (主机, 端口) 保存最近一次的 TLS 会话，新连接握手时提交以恢复会话（省去证书交换与密钥协商）。
+    会话只能在创建它的 SSLContext 上恢复，所以缓存与 context 绑定；context 首次使用时才创建
+    """
+    def __init__(self, context=None):
+        self._context = context
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def context(self):
+        if self._context is None:
+            import ssl
+            with self._lock:
+                if self._context is None:
+                    self._context = ssl.create_default_context()
+        return self._context
+
+    def get(self, host, port):
+        with self._lock:
+            return self._sessions.get((host, port))
+
+    def save(self, host, port, sock):
+        session = getattr(sock, "session", None)
+        if session is not None:
+            with self._lock:
+                self._sessions[(host, port)] = session
+
+class _PooledResponse(_TimedResponse):
+    """响应体读完或关闭时把连接交还连接池；提前关闭（未读完）的连接直接丢弃"""
+    _on_release = None
+    _reusable = True
+    url = None
+
+    def _release(self):
+        release, self._on_release = self._on_release, None
+        if release is not None:
+            release(self._reusable and not self.will_close)
+
+    def _close_conn(self):
+        _TimedResponse._close_conn(self)
+        self._release()
+
+    def close(self):
+        if self.fp is not None:
+            self._reusable = False
+        _TimedResponse.close(self)
+        self._release()
+
+class HTTPPool(object):
+    """
+    所有镜像流量共用的 HTTP/1.1 连接池：
+      - 每个 (协议, 主机, 端口) 保留空闲长连接，响应体读完后连接自动归还
+      - 每个主机同时进行的请求数不超过 per_host，等待超过请求超时则报错
+      - DNS 结果与 TLS 会话缓存在进程内，新连接可跳过解析并恢复会话
+      - 按环境变量（http_proxy / https_proxy / no_proxy）走代理：http 直接转发，https 经 CONNECT 隧道
+    """
+    def __init__(self, per_host=POOL_PER_HOST, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 proxies=None, context=None):
+        self.per_host = per_host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.proxies = urllib.request.getproxies() if proxies is None else proxies
+        self.tls_sessions = TLSSessionCache(context)
+        self.counters = {"requests": 0, "connections": 0, "reused": 0, "tls_handshakes": 0, "tls_resumed": 0}
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _proxy_for(self, scheme, host):
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return None
+        return urlparse(proxy if "://" in proxy else "http://" + proxy)
+
+    def _connect(self, key, timeout):
+        """新建连接（尚未建立 TCP）；经 http 代理时请求行使用完整 URL"""
+        scheme, host, port = key
+        proxy = self._proxy_for(scheme, host)
+        proxy_headers = {}
+        if proxy is not None and proxy.username:
+            token = "{0}:{1}".format(unquote(proxy.username), unquote(proxy.password or ""))
+            proxy_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(token.encode("utf-8")).decode("ascii")
+        if scheme == "https":
+            if proxy is not None:
+                conn = _TimedHTTPSConnection(proxy.hostname, proxy.port or 80, timeout=timeout,
+                                             context=self.tls_sessions.context)
+                conn.set_tunnel(host, port, headers=proxy_headers)
+            else:
+                conn = _TimedHTTPSConnection(host, port, timeout=timeout, context=self.tls_sessions.context)
+            conn.tls_sessions = self.tls_sessions
+            conn.via_proxy = False
+        elif proxy is not None:
+            conn = _TimedHTTPConnection(proxy.hostname, proxy.port or 80, timeout=timeout)
+            conn.via_proxy = True
+        else:
+            conn = _TimedHTTPConnection(host, port, timeout=timeout)
+            conn.via_proxy = False
+        conn.proxy_headers = proxy_headers if conn.via_proxy else {}
+        conn.response_class = _PooledResponse
+        return conn
+
+    def _checkout(self, key, timeout):
+        """占用该主机的一个并发名额，返回仍在有效期内的空闲连接或 None"""
+        if not self._slot(key).acquire(timeout=timeout):
+            raise OSError("too many concurrent requests to {0}:{1}".format(key[1], key[2]))
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                conn, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    return conn
+                conn.close()
+        return None
+
+    def _checkin(self, key, conn, reuse):
+        if reuse and conn.sock is not None:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append((conn, time.time()))
+                    conn = None
+        if conn is not None:
+            conn.close()
+        self._slot(key).release()
+
+    def _request(self, url, headers, timeout):
+        u = urlparse(url)
+        key = (u.scheme, u.hostname, u.port or (443 if u.scheme == "https" else 80))
+        path = (u.path or "/") + ("?" + u.query if u.query else "")
+        conn = self._checkout(key, timeout)
+        try:
+            while True:
+                reused = conn is not None
+                if reused:
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                else:
+                    conn = self._connect(key, timeout)
+                try:
+                    hdrs = dict(headers, **conn.proxy_headers) if conn.proxy_headers else headers
+                    conn.request("GET", url if conn.via_proxy else path, headers=hdrs)
+                    if not reused:
+                        self._count_connection(key, conn)
+                    resp = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    conn = None
+                    # 服务器可能已关闭空闲连接：复用的连接失败时换新连接重试一次
+                    if not reused:
+                        raise
+        except Exception:
+            if conn is not None:
+                conn.close()
+            self._slot(key).release()
+            raise
+        with self._lock:
+            self.counters["requests"] += 1
+            if reused:
+                self.counters["reused"] += 1
+        inc_metric("pip_mirror_pool_requests_total", host=u.hostname, connection="reused" if reused else "new")
+        resp.url = url
+        resp._on_release = lambda reuse: self._checkin(key, conn, reuse)
+        return resp
+
+    def _count_connection(self, key, conn):
+        resumed = getattr(conn.sock, "session_reused", False)
+        if key[0] == "https":
+            # 先保存本次会话，其他线程并发新建的连接即可恢复（关闭时还会再保存一次）
+            self.tls_sessions.save(key[1], key[2], conn.sock)
+        with self._lock:
+            self.counters["connections"] += 1
+            if key[0] == "https":
+                self.counters["tls_handshakes"] += 1
+                self.counters["tls_resumed"] += 1 if resumed else 0
+
+    def open(self, url, headers=None, timeout=BENCH_TIMEOUT, max_redirects=3):
+        """
+        发送 GET 并返回响应，4xx/5xx 不抛异常；跟随重定向，resp.url 为最终 URL。
+        响应体读完或 close() 后连接归还连接池，调用方应读完或关闭响应
+        """
+        hdrs = {"User-Agent": USER_AGENT}
+        hdrs.update(headers or {})
+        for _ in range(max_redirects + 1):
+            resp = self._request(url, hdrs, timeout)
+            location = resp.getheader("Location")
+            if resp.status in REDIRECT_CODES and location:
+                resp.read()
+                resp.close()
+                url = urljoin(url, location)
+                continue
+            return resp
+        raise IOError("too many redirects: {0}".format(url))
+
+    def close(self):
+        """关闭全部空闲连接（进行中的请求不受影响）"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["idle"] = sum(len(v) for v in self._idle.values())
+        stats["dns_hits"] = _dns_cache.hits
+        stats["dns_misses"] = _dns_cache.misses
+        return stats
+
+_http_pool = None
+_http_pool_lock = threading.Lock()
+
+def get_http_pool():
+    """所有镜像请求共用的连接池，首次使用时创建；--host-limit=N 调整每个主机的并发上限"""
+    global _http_pool
+    if _http_pool is None:
+        with _http_pool_lock:
+            if _http_pool is None:
+                _http_pool = HTTPPool(per_host=int(get_cli_option("--host-limit", POOL_PER_HOST)))
+    return _http_pool
+
+# ================== 索引页解析（PEP 691 JSON / 流式 PEP 503 HTML） ==================
+SIMPLE_JSON = "application/vnd.pypi.simple.v1+json"
+SIMPLE_ACCEPT = SIMPLE_JSON + ", text/html;q=0.1"
+PARSE_CHUNK = 64 * 1024
+_SDIST_EXTS = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".zip", ".tar")
+
+def _parse_upload_time(value):
+    if not value:
+        return None
+    value = value.rstrip("Z").split("+")[0]
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    return None
+
+def version_from_filename(filename):
+    """从 wheel / sdist / egg 文件名中取出版本号（无法识别时返回 None）"""
+    if filename.endswith(".whl") or filename.endswith(".egg"):
+        parts = filename.rsplit(".", 1)[0].split("-")
+        return parts[1] if len(parts) >= 2 else None
+    for ext in _SDIST_EXTS:
+        if filename.endswith(ext):
+            stem = filename[:-len(ext)]
+            return stem.rsplit("-", 1)[1] if "-" in stem else None
+    return None
+
+_PRE_ALIASES = {"alpha": "a", "beta": "b", "c": "rc", "pre": "rc", "preview": "rc"}
+
+def canonical_version(version):
+    """
+    PEP 440 的简化规范化，用于比较版本是否相同：小写、去掉前缀 v、
+    去掉 release 段末尾的 .0，统一预发布/后发布/开发版的写法（"V1.0.0-RC.1" -> "1rc1"）
+    """
+    v = (version or "").strip().lower()
+    v, _, local = v.partition("+")
+    v = v[1:] if v.startswith("v") else v
+    m = re.match(r"^(\d+(?:\.\d+)*)(.*)$", v)
+    if not m:
+        return version
+    release = [int(x) for x in m.group(1).split(".")]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+    rest = re.sub(r"[-_.]?(alpha|beta|preview|pre|a|b|c|rc|post|dev)[-_.]?(\d*)",
+                  lambda s: _PRE_ALIASES.get(s.group(1), s.group(1)) + str(int(s.group(2) or 0)),
+                  m.group(2))
+    rest = re.sub(r"^-(\d+)$", r"post\1", rest)
+    v = ".".join(str(x) for x in release) + rest
+    return v + "+" + re.sub(r"[-_]", ".", local) if local else v
+
+_PY_SPEC_RE = re.compile(r"^\s*(~=|===|==|!=|<=|>=|<|>)\s*v?(\d+(?:\.\d+)*)(\.\*)?\S*\s*$")
+
+def python_version_matches(spec, python=None):
+    """
+    检查 Requires-Python（如 ">=3.8, !=3.9.*"）是否接受当前解释器；
+    只比较 release 段，无法解析的约束与 pip 一样视为接受
+    """
+    have = tuple(python or sys.version_info[:3])
+    for clause in (spec or "").split(","):
+        if not clause.strip():
+            continue
+        m = _PY_SPEC_RE.match(clause)
+        if not m:
+            return True
+        op, want, wildcard = m.group(1), tuple(int(x) for x in m.group(2).split(".")), m.group(3)
+        if wildcard and op in ("==", "!="):
+            ok = have[:len(want)] == want
+            ok = ok if op == "==" else not ok
+        else:
+            n = max(len(want), len(have))
+            a, b = have + (0,) * (n - len(have)), want + (0,) * (n - len(want))
+            ok = {"==": a == b, "===": a == b, "!=": a != b, "<=": a <= b, ">=": a >= b,
+                  "<": a < b, ">": a > b,
+                  "~=": a >= b and have[:len(want) - 1] == want[:-1]}[op]
+        if not ok:
+            return False
+    return True
+
+def project_from_filename(filename):
+    """从 wheel / sdist 文件名（含 .metadata）取出规范化的项目名（无法识别时返回 None）"""
+    if filename.endswith(".metadata"):
+        filename = filename[:-len(".metadata")]
+    version = version_from_filename(filename)
+    if not version:
+        return None
+    name = filename.split("-" + version, 1)[0]
+    return canonical_project_name(name) if name else None
+
+def _file_entry(url, filename=None, hashes=None, requires_python=None, yanked=False, upload_time=None):
+    u = urlparse(url)
+    filename = filename or unquote(u.path.rsplit("/", 1)[-1])
+    if hashes is None:
+        hashes = dict([u.fragment.split("=", 1)]) if "=" in u.fragment else {}
+    return {"filename": filename, "url": url.split("#", 1)[0], "hashes": hashes,
+            "requires_python": requires_python, "yanked": yanked,
+            "upload_time": upload_time, "version": version_from_filename(filename)}
+
+class _StreamingIndexParser(HTMLParser):
+    """逐块 feed 的 PEP 503 解析器，每遇到一个 <a> 就生成一个文件条目放入 pending"""
+    def __init__(self, page_url):
+        HTMLParser.__init__(self)
+        self.page_url = page_url
+        self.pending = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        attrs = dict(attrs)
+        href = attrs.get("href")
+        if href:
+            self.pending.append(_file_entry(
+                urljoin(self.page_url, href),
+                requires_python=attrs.get("data-requires-python"),
+                yanked="data-yanked" in attrs))
+
+def iter_index_entries(resp, page_url, content_type=""):
+    """
+    从已打开的响应中逐个产出文件条目：
+    JSON（PEP 691）整体解析；HTML 按块读取、增量解码与解析，不缓存整个页面。
+    调用方提前停止迭代时，响应中剩余的内容不会被读取。
+    """
+    if SIMPLE_JSON in (content_type or ""):
+        data = json.loads(resp.read().decode("utf-8"))
+        for f in data.get("files", []):
+            yield _file_entry(urljoin(page_url, f["url"]), f.get("filename"), f.get("hashes") or {},
+                              f.get("requires-python"), bool(f.get("yanked")),
+                              _parse_upload_time(f.get("upload-time")))
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parser = _StreamingIndexParser(page_url)
+    while True:
+        chunk = resp.read(PARSE_CHUNK)
+        parser.feed(decoder.decode(chunk, final=not chunk))
+        if parser.pending:
+            pending, parser.pending = parser.pending, []
+            for entry in pending:
+                yield entry
+        if not chunk:
+            break
+    parser.close()
+    for entry in parser.pending:
+        yield entry
+
+def select_version(entries, version):
+    """
+    只产出指定版本的文件；simple 页面按版本分组排列，
+    一旦越过该版本的文件段就停止读取
+    """
+    seen = False
+    version = canonical_version(version)
+    for entry in entries:
+        if entry["version"] and canonical_version(entry["version"]) == version:
+            seen = True
+            yield entry
+        elif seen:
+            return
+
+def iter_index_files(index_url, project, version=None, timeout=BENCH_TIMEOUT):
+    """
+    获取镜像上某个项目的文件条目（生成器）；优先请求 PEP 691 JSON，
+    指定 version 时找到该版本的全部文件后即停止
+    """
+    page_url = urljoin(normalize_url(index_url) + "/", canonical_project_name(project) + "/")
+    with open_url(page_url, timeout, {"Accept": SIMPLE_ACCEPT}) as resp:
+        entries = iter_index_entries(resp, resp.url, resp.headers.get("Content-Type"))
+        if version:
+            entries = select_version(entries, version)
+        for entry in entries:
+            yield entry
+
+# ================== 镜像健康缓存 ==================
+HEALTH_CACHE_NAME = "pip-mirror-manager.json"
+HEALTH_TTL = 6 * 3600        # 超过该时长（秒）的测速结果视为过期
+HEALTH_DECAY = 0.3           # 指数衰减平均中新样本的权重
+CUSTOM_HISTORY_LIMIT = 10
+NETWORK_HISTORY_LIMIT = 20   # 最多记住多少个网络的预选结果
+NETWORK_TTL = 7 * 86400      # 网络上的缓存胜出者超过该时长（秒）后重新测速
+
+def get_health_cache_path(cfg_path=None):
+    """缓存文件与用户 pip 配置文件放在同一目录"""
+    return Path(cfg_path or get_user_pip_config_path()).parent / HEALTH_CACHE_NAME
+
+class MirrorHealthCache(object):
+    """
+    按镜像 URL 保存测速结果：指数衰减平均的延迟/吞吐量/评分、成功与失败次数、更新时间。
+    同时记录用户用过的自定义 URL，用于淘汰已不再使用的镜像条目；
+    以及按网络指纹记录的胜出镜像（见 --auto）。
+    """
+    def __init__(self, path, ttl=HEALTH_TTL, decay=HEALTH_DECAY):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.decay = decay
+        self.mirrors = {}
+        self.custom_history = []
+        self.networks = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.mirrors = dict(data.get("mirrors") or {})
+            self.custom_history = list(data.get("custom_history") or [])
+            self.networks = dict(data.get("networks") or {})
+        except Exception:
+            self.mirrors, self.custom_history, self.networks = {}, [], {}
+
+    def save(self):
+        with self._lock:
+            data = {"version": 1, "mirrors": self.mirrors, "custom_history": self.custom_history,
+                    "networks": self.networks}
+            # GUI、--watch 与命令行可能同时保存：每个进程/线程使用各自的临时文件
+            write_text_atomic(self.path, json.dumps(data, indent=1, sort_keys=True))
+
+    def _ewma(self, old, new):
+        if new is None:
+            return old
+        if old is None:
+            return new
+        return old + self.decay * (new - old)
+
+    def record(self, result, now=None):
+        now = time.time() if now is None else now
+        key = normalize_url(result["url"])
+        with self._lock:
+            entry = self.mirrors.setdefault(key, {"url": result["url"], "successes": 0, "failures": 0})
+            entry["updated"] = now
+            entry["last_ok"] = bool(result["ok"])
+            if result["ok"]:
+                entry["successes"] += 1
+                for field in ("ttfb", "project_time", "throughput", "score"):
+                    entry[field] = self._ewma(entry.get(field), result.get(field))
+            else:
+                entry["failures"] += 1
+                entry["last_error"] = result.get("error", "")
+
+    def record_all(self, results):
+        for result in results:
+            self.record(result)
+
+    def get(self, url):
+        return self.mirrors.get(normalize_url(url))
+
+    def is_stale(self, url, now=None):
+        entry = self.get(url)
+        now = time.time() if now is None else now
+        return entry is None or now - entry.get("updated", 0) > self.ttl
+
+    def stale_urls(self, urls):
+        return [u for u in urls if self.is_stale(u)]
+
+    def unexported(self):
+        """未过期、且自上次导出到集群存储后又更新过的条目"""
+        return [e for e in self.mirrors.values()
+                if not self.is_stale(e["url"]) and e.get("exported", 0) < e.get("updated", 0)]
+
+    def mark_exported(self, urls):
+        """记录这些镜像当前的测量已导出，避免 --fleet --export 重复导出同一条"""
+        with self._lock:
+            for url in urls:
+                entry = self.mirrors.get(normalize_url(url))
+                if entry is not None:
+                    entry["exported"] = entry.get("updated", 0)
+
+    def record_freshness(self, report, now=None):
+        key = normalize_url(report["url"])
+        with self._lock:
+            entry = self.mirrors.setdefault(key, {"url": report["url"], "successes": 0, "failures": 0,
+                                                  "updated": 0})
+            entry["sync_lag"] = report["sync_lag"]
+            entry["missing_pins"] = list(report["missing_pins"])
+            entry["freshness_checked"] = time.time() if now is None else now
+
+    @staticmethod
+    def is_behind(entry):
+        """同步检查发现缺少固定版本，或同步延迟超过容忍值"""
+        return bool(entry.get("missing_pins")) or (entry.get("sync_lag") or 0) > FRESHNESS_TOLERANCE
+
+    def ranking(self, urls):
+        """按缓存评分排序；最近一次失败或从未成功的排在最后，同步落后的排在可用镜像之后"""
+        entries = [e for e in (self.get(u) for u in urls) if e]
+        return sorted(entries, key=lambda e: (not e.get("last_ok"), self.is_behind(e),
+                                              e.get("score") or float("inf")))
+
+    def add_custom(self, url):
+        if not url or get_registry().find(url) is not None:
+            return
+        with self._lock:
+            history = [u for u in self.custom_history if normalize_url(u) != normalize_url(url)]
+            self.custom_history = ([url] + history)[:CUSTOM_HISTORY_LIMIT]
+
+    def network_winner(self, fingerprint, now=None):
+        """该网络上未过期的胜出镜像 URL；未知网络或已过期时返回 None"""
+        entry = self.networks.get(fingerprint)
+        now = time.time() if now is None else now
+        if not entry or now - entry.get("updated", 0) > NETWORK_TTL:
+            return None
+        return entry.get("winner")
+
+    def record_network(self, fingerprint, winner, rtts, now=None):
+        with self._lock:
+            self.networks[fingerprint] = {"winner": winner, "rtt": rtts,
+                                          "updated": time.time() if now is None else now}
+            # 只保留最近使用的若干个网络
+            for key in sorted(self.networks, key=lambda k: self.networks[k].get("updated", 0),
+                              reverse=True)[NETWORK_HISTORY_LIMIT:]:
+                del self.networks[key]
+
+    def evict(self):
+        """淘汰既不在镜像注册表也不在自定义历史中的条目"""
+        keep = set(m.key for m in get_registry())
+        keep.update(normalize_url(u) for u in self.custom_history)
+        with self._lock:
+            for key in [k for k in self.mirrors if k not in keep]:
+                del self.mirrors[key]
+
+def load_health_cache(cfg_path=None):
+    return MirrorHealthCache(get_health_cache_path(cfg_path))
+
+def format_cached_ranking(entries, limit=3):
+    items = []
+    for entry in entries[:limit]:
+        if entry.get("last_ok") and entry.get("score") is not None:
+            items.append("{0} {1} ms".format(mirror_display_name(entry["url"]), int(entry["score"] * 1000)))
+    return " · ".join(items)
+
+def refresh_stale_async(cache, urls, on_done=None):
+    """
+    后台线程中只重新测速过期的镜像，完成后写回缓存并调用 on_done(results)
+    """
+    stale = cache.stale_urls(urls)
+    if not stale:
+        return None
+
+    def worker():
+        results = benchmark_mirrors(stale)
+        cache.record_all(results)
+        cache.evict()
+        try:
+            cache.save()
+        except Exception:
+            pass
+        if on_done:
+            on_done(results)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+# ================== 后台探测（GUI 实时延迟） ==================
+PROBE_TIMEOUT = 5
+PROBE_MAX_WORKERS = 4        # 同时进行的探测数上限
+PROBE_INTERVAL_MS = 60000    # 两轮探测之间的间隔
+PROBE_POLL_MS = 100          # 结果队列的轮询间隔
+PROBE_PROJECT = "six"        # 探测用的小项目页：各镜像都有，文件少、页面只有十几 KB
+
+def probe_latency(index_url, timeout=PROBE_TIMEOUT, project=PROBE_PROJECT):
+    """
+    轻量探测：只测一个小项目页的首字节时间，不下载 wheel。
+    不用 /simple/ 根页面（PyPI 上有几十 MB）；页面读完后连接回到连接池，下次探测直接复用
+    """
+    result = {"url": index_url, "ok": False, "ttfb": None, "error": ""}
+    try:
+        start = time.perf_counter()
+        with open_url(urljoin(normalize_url(index_url) + "/", project + "/"), timeout) as resp:
+            resp.read(1)
+            result["ttfb"] = time.perf_counter() - start
+            resp.read()
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e) or e.__class__.__name__
+    return result
+
+class BackgroundProber(object):
+    """
+    在线程池中执行探测，结果放入线程安全队列，由 Tk 线程通过 after() 取出。
+    cancel() 之后尚未开始的探测直接跳过，已完成的结果不再入队。
+    """
+    def __init__(self, max_workers=PROBE_MAX_WORKERS, timeout=PROBE_TIMEOUT):
+        self.timeout = timeout
+        self.results = queue.Queue()
+        self._cancelled = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def submit(self, key, url):
+        if not self.cancelled:
+            self._pool.submit(self._run, key, url)
+
+    def _run(self, key, url):
+        if self.cancelled:
+            return
+        result = probe_latency(url, self.timeout)
+        if not self.cancelled:
+            self.results.put((key, result))
+
+    def drain(self):
+        """非阻塞地取出当前所有结果"""
+        items = []
+        while True:
+            try:
+                items.append(self.results.get_nowait())
+            except queue.Empty:
+                return items
+
+    def cancel(self):
+        self._cancelled.set()
+        self._pool.shutdown(wait=False)
+
+def format_probe_status(result):
+    if result is None:
+        return "…"
+    if not result["ok"]:
+        return "✗"
+    return "{0} ms".format(int(result["ttfb"] * 1000))
+
+# ================== 后台守护（--watch） ==================
+WATCH_INTERVAL = 600         # 两轮评估之间的平均间隔（秒）
+WATCH_JITTER = 0.2           # 间隔随机浮动比例，避免多台机器同时探测
+WATCH_MARGIN = 0.2           # 挑战者的延迟至少低于当前镜像该比例才计入
+WATCH_ROUNDS = 3             # 连续多少轮胜出才切换，避免来回切换
+WATCH_SAMPLES = 3            # 每轮每个镜像的探测次数（取中位数）
+
+def probe_median(index_url, samples=WATCH_SAMPLES, timeout=PROBE_TIMEOUT):
+    """重复轻量探测取首字节时间中位数；全部失败时 ok=False"""
+    results = [probe_latency(index_url, timeout) for _ in range(max(1, samples))]
+    times = sorted(r["ttfb"] for r in results if r["ok"])
+    if not times:
+        return results[-1]
+    return {"url": index_url, "ok": True, "ttfb": times[len(times) // 2], "error": ""}
+
+class MirrorWatcher(object):
+    """
+    周期性地轻量探测所有候选镜像；某个挑战者比当前镜像快 margin 以上且连续 rounds 轮时，
+    才通过 switch_index_url 切换（保留其余设置）。每轮的决定交给 log(decision)
+    """
+    def __init__(self, cfg_path, interval=WATCH_INTERVAL, jitter=WATCH_JITTER, margin=WATCH_MARGIN,
+                 rounds=WATCH_ROUNDS, samples=WATCH_SAMPLES, log=None):
+        self.cfg_path = cfg_path
+        self.interval = interval
+        self.jitter = jitter
+        self.margin = margin
+        self.rounds = max(1, rounds)
+        self.samples = samples
+        self.log = log or (lambda decision: None)
+        self.streaks = {}
+        self.current = None
+        self.stop_event = threading.Event()
+
+    def candidates(self, current):
+        urls = benchmark_candidates(current)
+        known = set(normalize_url(u) for u in urls)
+        for url in load_health_cache(self.cfg_path).custom_history:
+            if normalize_url(url) not in known:
+                known.add(normalize_url(url))
+                urls.append(url)
+        return urls
+
+    def probe(self, urls):
+        with ThreadPoolExecutor(max_workers=min(PROBE_MAX_WORKERS, len(urls))) as pool:
+            return list(pool.map(lambda u: probe_median(u, self.samples), urls))
+
+    def evaluate(self, current, results):
+        """
+        根据一轮探测结果更新连胜计数并返回决定：
+          keep     当前镜像最快，或没有挑战者超过余量
+          pending  有挑战者超过余量，但连胜轮数不足
+          switch   挑战者连续 rounds 轮超过余量，应切换
+          hold     所有镜像均不可达，保持不变
+        """
+        by_url = {normalize_url(r["url"]): r for r in results}
+        mine = by_url.get(normalize_url(current)) or {"ok": False, "ttfb": None}
+        ok = sorted((r for r in results if r["ok"]), key=lambda r: r["ttfb"])
+        decision = {"time": time.time(), "current": current, "current_ttfb": mine["ttfb"],
+                    "challenger": None, "challenger_ttfb": None, "streak": 0, "rounds": self.rounds}
+        if not ok:
+            self.streaks = {}
+            decision["action"] = "hold"
+            return decision
+        # 当前镜像不可达时，任何可达镜像都算胜出
+        limit = mine["ttfb"] * (1 - self.margin) if mine["ok"] else float("inf")
+        winners = [r for r in ok if normalize_url(r["url"]) != normalize_url(current) and r["ttfb"] < limit]
+        self.streaks = {normalize_url(r["url"]): self.streaks.get(normalize_url(r["url"]), 0) + 1
+                        for r in winners}
+        if not winners:
+            decision["action"] = "keep"
+            return decision
+        ready = [r for r in winners if self.streaks[normalize_url(r["url"])] >= self.rounds]
+        best = (ready or winners)[0]
+        decision.update(challenger=best["url"], challenger_ttfb=best["ttfb"],
+                        streak=self.streaks[normalize_url(best["url"])],
+                        action="switch" if ready else "pending")
+        return decision
+
+    def apply(self, url):
+        switch_index_url(self.cfg_path, url)
+
+    def run_round(self):
+        current = read_current_index_url(self.cfg_path) or DEFAULT_URL
+        if self.current is not None and normalize_url(current) != normalize_url(self.current):
+            self.streaks = {}  # 配置被外部修改，重新计数
+        self.current = current
+        decision = self.evaluate(current, self.probe(self.candidates(current)))
+        if decision["action"] == "switch":
+            try:
+                self.apply(decision["challenger"])
+                self.current = decision["challenger"]
+                self.streaks = {}
+            except Exception as e:
+                decision["action"] = "error"
+                decision["error"] = str(e)
+        self.log(decision)
+        return decision
+
+    def next_delay(self):
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        """循环直到 stop()；两轮之间在 Event 上等待，空闲时不占用 CPU"""
+        while not self.stop_event.is_set():
+            self.run_round()
+            self.stop_event.wait(self.next_delay())
+
+    def stop(self):
+        self.stop_event.set()
+
+def format_watch_decision(decision):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(decision["time"]))
+    def ms(value):
+        return "-" if value is None else str(int(value * 1000))
+    fields = {"current": mirror_display_name(decision["current"]), "current_ms": ms(decision["current_ttfb"]),
+              "challenger": mirror_display_name(decision["challenger"] or ""),
+              "challenger_ms": ms(decision["challenger_ttfb"]),
+              "streak": decision["streak"], "rounds": decision["rounds"], "err": decision.get("error", "")}
+    return "[{0}] {1}".format(stamp, t("watch." + decision["action"], **fields))
+
+# ================== 网络指纹与快速预选（--auto） ==================
+PRESELECT_TIMEOUT = 2        # DNS + TCP 连接的超时（秒）
+PRESELECT_TOP = 3            # 新网络上只对 RTT 最低的几个镜像做完整测速
+
+def _default_gateway():
+    """默认网关（Linux 读取 /proc/net/route，其他平台返回空字符串）"""
+    try:
+        with open("/proc/net/route", "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                # 目标 0.0.0.0 且带 RTF_GATEWAY 标志；地址按主机字节序（小端）的十六进制保存
+                if len(fields) > 3 and fields[1] == "00000000" and int(fields[3], 16) & 2:
+                    return "{0}%{1}".format(socket.inet_ntoa(bytes.fromhex(fields[2])[::-1]), fields[0])
+    except (OSError, ValueError):
+        pass
+    return ""
+
+def _local_prefixes():
+    """出站地址所在的网段（IPv4 /24、IPv6 /64）；UDP connect 只选路由，不发送数据"""
+    prefixes = []
+    for family, target in ((socket.AF_INET, "192.0.2.1"), (socket.AF_INET6, "2001:db8::1")):
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as s:
+                s.connect((target, 53))
+                addr = s.getsockname()[0]
+        except OSError:
+            continue
+        if family == socket.AF_INET:
+            prefixes.append(".".join(addr.split(".")[:3]) + ".0/24")
+        else:
+            packed = socket.inet_pton(family, addr)[:8] + bytes(8)
+            prefixes.append(socket.inet_ntop(family, packed) + "/64")
+    return prefixes
+
+def _nameservers():
+    try:
+        with open("/etc/resolv.conf", "r") as f:
+            return [line.split()[1] for line in f
+                    if line.startswith("nameserver") and len(line.split()) > 1]
+    except OSError:
+        return []
+
+def network_fingerprint():
+    """
+    返回 (指纹, 组成部分)。由默认网关、出站网段、网络接口与 DNS 服务器组成，
+    只读本地状态、不产生网络流量，通常在几毫秒内完成
+    """
+    try:
+        interfaces = sorted(name for _, name in socket.if_nameindex() if name != "lo")
+    except (AttributeError, OSError):
+        interfaces = []
+    parts = {"gateway": _default_gateway(), "prefixes": _local_prefixes(),
+             "interfaces": interfaces, "nameservers": _nameservers()}
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return digest, parts
+
+def connect_rtt(index_url, timeout=PRESELECT_TIMEOUT):
+    """只做 DNS 解析与 TCP 连接（不发 HTTP 请求），返回 {url, ok, dns, rtt, error}"""
+    u = urlparse(index_url)
+    port = u.port or (443 if u.scheme == "https" else 80)
+    result = {"url": index_url, "ok": False, "dns": None, "rtt": None, "error": ""}
+    try:
+        start = time.perf_counter()
+        infos = socket.getaddrinfo(u.hostname, port, 0, socket.SOCK_STREAM)
+        result["dns"] = time.perf_counter() - start
+        start = time.perf_counter()
+        socket.create_connection(infos[0][4][:2], timeout).close()
+        result["rtt"] = time.perf_counter() - start
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e) or e.__class__.__name__
+    return result
+
+def preselect_mirrors(urls, timeout=PRESELECT_TIMEOUT):
+    """并发解析并连接所有镜像主机，按 TCP 连接 RTT 从低到高排序（不可达的排在最后）"""
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        results = list(pool.map(lambda u: connect_rtt(u, timeout), urls))
+    results.sort(key=lambda r: r["rtt"] if r["ok"] else float("inf"))
+    return results
+
+def auto_select_mirror(cfg_path, health=None, refresh=False, top=PRESELECT_TOP):
+    """
+    已知网络：直接返回缓存的胜出镜像；新网络：配置了集群存储且本站点有推荐时直接采用，
+    否则（或 refresh）TCP RTT 预选后只对前 top 个做完整测速，结果按网络指纹写入健康缓存。
+    返回 {fingerprint, url, cached, fleet, preselect, results}；没有可达镜像时 url 为 None
+    """
+    health = health or load_health_cache(cfg_path)
+    fingerprint, parts = network_fingerprint()
+    report = {"fingerprint": fingerprint, "url": None, "cached": False, "fleet": None, "preselect": [],
+              "results": []}
+    winner = None if refresh else health.network_winner(fingerprint)
+    if winner:
+        report.update(url=winner, cached=True)
+        return report
+    if not refresh:
+        report["fleet"] = fleet_recommendation(location=fleet_location((fingerprint, parts)))
+        if report["fleet"]:
+            report["url"] = report["fleet"]["url"]
+            health.record_network(fingerprint, report["url"], {})
+            try:
+                health.save()
+            except Exception:
+                pass
+            return report
+    candidates = benchmark_candidates(read_current_index_url(cfg_path))
+    report["preselect"] = preselect_mirrors(candidates)
+    reachable = [r["url"] for r in report["preselect"] if r["ok"]]
+    # 前 top 个都测速失败时再测其余可达镜像
+    for batch in (reachable[:top], reachable[top:]):
+        if not batch:
+            continue
+        results = benchmark_mirrors(batch)
+        report["results"] += results
+        health.record_all(results)
+        if results[0]["ok"]:
+            report["url"] = results[0]["url"]
+            break
+    if report["url"]:
+        health.record_network(fingerprint, report["url"],
+                              {r["url"]: r["rtt"] for r in report["preselect"] if r["ok"]})
+    try:
+        health.save()
+    except Exception:
+        pass
+    return report
+
+# ================== 集群共享测速结果（--fleet） ==================
+FLEET_STORE_ENV = "PIP_MIRROR_FLEET_STORE"
+FLEET_SITE_ENV = "PIP_MIRROR_FLEET_SITE"
+FLEET_WINDOW_DAYS = 7        # 查询时只使用最近若干天的测量
+FLEET_TRIM = 0.2             # 截尾均值两端各去掉的比例
+FLEET_MIN_OK = 0.8           # 成功率低于该值的镜像不推荐
+FLEET_MIN_HOSTS = 1          # 至少有多少台主机测过才推荐
+FLEET_LOCK_TIMEOUT = 30      # SQLite 等待其他写入者释放锁的时间（秒）
+FLEET_FIELDS = ("time", "host", "subnet", "network", "url", "ok", "ttfb", "throughput", "score")
+_SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+def get_fleet_store_path():
+    """--fleet-store=PATH > 环境变量 PIP_MIRROR_FLEET_STORE；都未设置时不使用集群数据"""
+    return get_cli_option("--fleet-store") or os.environ.get(FLEET_STORE_ENV) or None
+
+def get_fleet_site():
+    """--fleet-site=NAME > 环境变量 PIP_MIRROR_FLEET_SITE；显式的站点名优先于自动推断的网段"""
+    return get_cli_option("--fleet-site") or os.environ.get(FLEET_SITE_ENV) or None
+
+def _gateway_mac(gateway):
+    """默认网关的 MAC 地址（Linux 读取 /proc/net/arp，其他平台或未解析时返回空字符串）"""
+    ip = gateway.split("%", 1)[0]
+    try:
+        with open("/proc/net/arp", "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 3 and fields[0] == ip and fields[3] != "00:00:00:00:00:00":
+                    return fields[3].lower()
+    except OSError:
+        pass
+    return ""
+
+def fleet_location(network=None):
+    """
+    本机在集群数据中的键：(主机名, 站点, 网络指纹)。站点为显式的 --fleet-site，
+    否则为出站 IPv4 /24（或 IPv6 /64）加默认网关的 MAC 地址（取不到时用网关地址）：
+    私有网段在不同地点常常相同（如 192.168.1.0/24），只按网段会把无关的站点混在一起。
+    network 为已算好的 network_fingerprint() 结果
+    """
+    fingerprint, parts = network or network_fingerprint()
+    site = get_fleet_site()
+    if site:
+        return socket.gethostname(), "site:" + site, fingerprint
+    prefixes = parts["prefixes"]
+    if not prefixes:
+        return socket.gethostname(), "", fingerprint
+    gateway = _gateway_mac(parts["gateway"]) or parts["gateway"].split("%", 1)[0]
+    return socket.gethostname(), prefixes[0] + ("@" + gateway if gateway else ""), fingerprint
+
+def fleet_group(row):
+    """聚合的分组键：站点（见 fleet_location）；没有站点的主机按网络指纹分组"""
+    return row.get("subnet") or "net:" + (row.get("network") or "")
+
+class JsonlFleetStore(object):
+    """
+    只追加的 JSON Lines 目录：每台主机每天一个文件（<主机>-<YYYYMMDD>.jsonl）。
+    不同主机从不写同一个文件，因此共享卷（包括 NFS）上也不会互相覆盖；
+    同一主机上的多个进程以 O_APPEND 一次 write() 写入整批记录，不会交错。
+    读取时跳过未写完的最后一行和无法解析的行；旧数据可直接按文件删除
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _file(self, host, now):
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", host) or "host"
+        return self.path / "{0}-{1}.jsonl".format(safe, time.strftime("%Y%m%d", time.gmtime(now)))
+
+    def append(self, rows):
+        if not rows:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(row, sort_keys=True) + "\n" for row in rows).encode("utf-8")
+        fd = os.open(str(self._file(rows[0]["host"], rows[0]["time"])), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        return len(rows)
+
+    def rows(self, since=0):
+        day = time.strftime("%Y%m%d", time.gmtime(since))
+        try:
+            names = sorted(os.listdir(str(self.path)))
+        except OSError:
+            return
+        for name in names:
+            # 文件名中的日期早于查询窗口的整个文件跳过
+            if not name.endswith(".jsonl") or name[-14:-6] < day:
+                continue
+            try:
+                with open(str(self.path / name), "rb") as f:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        try:
+                            row = json.loads(line.decode("utf-8"))
+                        except ValueError:
+                            continue
+                        if isinstance(row, dict) and row.get("time", 0) >= since and row.get("url"):
+                            yield row
+            except OSError:
+                continue
+
+class SqliteFleetStore(object):
+    """
+    SQLite 单文件。写入在一个事务中完成，其他写入者持锁时最多等待 FLEET_LOCK_TIMEOUT 秒。
+    使用默认的回滚日志而不是 WAL：WAL 依赖共享内存，要求所有进程在同一台主机上，不适合共享卷
+    """
+    def __init__(self, path):
+        self.path = str(path)
+
+    def _connect(self):
+        import sqlite3
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=FLEET_LOCK_TIMEOUT)
+        conn.execute("CREATE TABLE IF NOT EXISTS measurements (time REAL NOT NULL, host TEXT NOT NULL, "
+                     "subnet TEXT NOT NULL, network TEXT NOT NULL, url TEXT NOT NULL, ok INTEGER NOT NULL, "
+                     "ttfb REAL, throughput REAL, score REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS measurements_time ON measurements (time)")
+        return conn
+
+    def append(self, rows):
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT INTO measurements ({0}) VALUES ({1})".format(
+                    ", ".join(FLEET_FIELDS), ", ".join("?" * len(FLEET_FIELDS))),
+                    [tuple(row.get(field) for field in FLEET_FIELDS) for row in rows])
+        finally:
+            conn.close()
+        return len(rows)
+
+    def rows(self, since=0):
+        conn = self._connect()
+        try:
+            cursor = conn.execute("SELECT {0} FROM measurements WHERE time >= ?".format(", ".join(FLEET_FIELDS)),
+                                  (since,))
+            for values in cursor:
+                row = dict(zip(FLEET_FIELDS, values))
+                row["ok"] = bool(row["ok"])
+                yield row
+        finally:
+            conn.close()
+
+def open_fleet_store(path):
+    """以 .db / .sqlite / .sqlite3 结尾的路径为 SQLite 文件，其余为 JSON Lines 目录"""
+    if str(path).lower().endswith(_SQLITE_SUFFIXES):
+        return SqliteFleetStore(path)
+    return JsonlFleetStore(path)
+
+def fleet_rows(results, location=None, now=None):
+    """把测速结果（或健康缓存条目）转换为集群记录"""
+    host, subnet, network = location or fleet_location()
+    now = time.time() if now is None else now
+    rows = []
+    for r in results:
+        ok = bool(r.get("ok", r.get("last_ok")))
+        rows.append({"time": r.get("updated", now), "host": host, "subnet": subnet, "network": network,
+                     "url": r["url"], "ok": ok, "ttfb": r.get("ttfb") if ok else None,
+                     "throughput": r.get("throughput") if ok else None, "score": r.get("score") if ok else None})
+    return rows
+
+def export_to_fleet(results, path=None):
+    """已配置集群存储时导出测速结果，返回导出的条数；未配置或写入失败时返回 0"""
+    path = path or get_fleet_store_path()
+    if not path or not results:
+        return 0
+    try:
+        return open_fleet_store(path).append(fleet_rows(results))
+    except Exception:
+        return 0
+
+def median(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    if not n:
+        return None
+    mid = n // 2
+    return ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2.0
+
+def trimmed_mean(values, proportion=FLEET_TRIM):
+    """两端各去掉 proportion 比例的样本后取平均"""
+    ordered = sorted(values)
+    cut = int(len(ordered) * proportion)
+    kept = ordered[cut:len(ordered) - cut] or ordered
+    return sum(kept) / float(len(kept)) if kept else None
+
+def aggregate_fleet(rows):
+    """
+    按站点汇总：{分组: {"hosts", "samples", "mirrors": [按推荐顺序排序的统计]}}。
+    每台主机先取自己的中位数评分，再在主机之间取中位数与截尾均值，
+    因此测得多的主机不会压过其他主机，个别异常主机也影响不大
+    """
+    groups, urls, seen = {}, {}, set()
+    for row in rows:
+        key = normalize_url(row["url"])
+        # 同一批记录可能被写入两次（如写入共享卷超时后重试导出），同一主机对同一镜像同一时刻的测量只计一次
+        if (row["host"], key, row.get("time")) in seen:
+            continue
+        seen.add((row["host"], key, row.get("time")))
+        urls.setdefault(key, row["url"])
+        group = groups.setdefault(fleet_group(row), {})
+        samples = group.setdefault(key, {}).setdefault(row["host"], [])
+        samples.append(row["score"] if row.get("ok") and row.get("score") is not None else None)
+    summary = {}
+    for key, mirrors in groups.items():
+        stats = []
+        for url_key, per_host in mirrors.items():
+            scores = [median([s for s in samples if s is not None]) for samples in per_host.values()]
+            scores = [s for s in scores if s is not None]
+            total = sum(len(samples) for samples in per_host.values())
+            ok = sum(1 for samples in per_host.values() for s in samples if s is not None)
+            stats.append({"url": urls[url_key], "hosts": len(per_host), "samples": total,
+                          "ok_rate": round(ok / float(total), 3), "median": median(scores),
+                          "trimmed_mean": trimmed_mean(scores)})
+        stats.sort(key=lambda s: (not _fleet_eligible(s), s["median"] if s["median"] is not None else float("inf"),
+                                  s["trimmed_mean"] if s["trimmed_mean"] is not None else float("inf")))
+        summary[key] = {"hosts": len(set(h for per_host in mirrors.values() for h in per_host)),
+                        "samples": sum(s["samples"] for s in stats), "mirrors": stats}
+    return summary
+
+def _fleet_eligible(stats):
+    return stats["median"] is not None and stats["ok_rate"] >= FLEET_MIN_OK and stats["hosts"] >= FLEET_MIN_HOSTS
+
+def fleet_recommendation(path=None, location=None, days=FLEET_WINDOW_DAYS, now=None):
+    """
+    本机所在站点的集群推荐：{group, url, hosts, median, trimmed_mean}；
+    未配置存储、站点没有数据或没有合格镜像时返回 None。只读存储，不做任何探测
+    """
+    path = path or get_fleet_store_path()
+    if not path:
+        return None
+    host, subnet, network = location or fleet_location()
+    key = fleet_group({"subnet": subnet, "network": network})
+    since = (time.time() if now is None else now) - days * 86400
+    try:
+        rows = [r for r in open_fleet_store(path).rows(since) if fleet_group(r) == key]
+    except Exception:
+        return None
+    group = aggregate_fleet(rows).get(key)
+    if not group or not _fleet_eligible(group["mirrors"][0]):
+        return None
+    best = dict(group["mirrors"][0])
+    best["group"] = key
+    return best
+
+def format_fleet_recommendation(rec):
+    return t("fleet.recommend", group=rec["group"], name=mirror_display_name(rec["url"]), hosts=rec["hosts"],
+             ms=int(rec["median"] * 1000))
+
+# ================== 本地缓存代理（--serve） ==================
+PROXY_HOST = "127.0.0.1"
+PROXY_PORT = 3141
+PROXY_CACHE_BUDGET = 2 * 1024 ** 3  # 分发文件缓存的字节上限
+INDEX_MAX_AGE = 300                 # 索引页在该时长（秒）内直接使用缓存，超过后向上游重新验证
+STREAM_CHUNK = 64 * 1024
+
+_HREF_RE = re.compile(r"""(href\s*=\s*)(["'])(.*?)\2""", re.I | re.S)
+
+def get_proxy_cache_dir():
+    """
+    代理缓存目录（跨平台）：
+    - Windows: %LOCALAPPDATA%\\pip-mirror-manager\\Cache
+    - macOS:   ~/Library/Caches/pip-mirror-manager
+    - Linux:   ~/.cache/pip-mirror-manager
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+        return Path(base) / "pip-mirror-manager" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "pip-mirror-manager"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "pip-mirror-manager"
+
+def canonical_project_name(name):
+    """PEP 503 名称规范化"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def rewrite_index_links(html_text, page_url):
+    """
+    将项目页中的分发文件链接改写为代理本地路径 /files/<scheme>/<host>/<path>，
+    保留 #sha256=... 片段与 data-* 属性；返回 (新页面, 出现的文件主机集合)
+    """
+    hosts = set()
+
+    def sub(m):
+        absolute = urljoin(page_url, html_unescape(m.group(3)))
+        u = urlparse(absolute)
+        if u.scheme not in ("http", "https"):
+            return m.group(0)
+        hosts.add(u.netloc)
+        local = "/files/{0}/{1}{2}".format(u.scheme, u.netloc, u.path)
+        if u.query:
+            local += "?" + u.query
+        if u.fragment:
+            local += "#" + u.fragment
+        return "{0}{1}{2}{1}".format(m.group(1), m.group(2), html_escape(local, quote=True))
+
+    return _HREF_RE.sub(sub, html_text), hosts
+
+class ProxyCache(object):
+    """
+    磁盘缓存：
+      index/<项目>.html + .json   索引页及其 ETag / Last-Modified / 获取时间
+      files/<sha1>                分发文件，按最近使用顺序（LRU）在超出预算时淘汰
+    """
+    def __init__(self, root, budget=PROXY_CACHE_BUDGET):
+        self.root = Path(root)
+        self.budget = budget
+        self.index_dir = self.root / "index"
+        self.files_dir = self.root / "files"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        self.allowed_hosts = set()
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._total = 0
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(str(self.files_dir)):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                entries.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._lru[name] = size
+            self._total += size
+        for meta in self.index_dir.glob("*.json"):
+            try:
+                with meta.open("r", encoding="utf-8") as f:
+                    self.allowed_hosts.update(json.load(f).get("file_hosts", []))
+            except Exception:
+                pass
+
+    # ---- 索引页 ----
+    def _index_paths(self, key):
+        return self.index_dir / (key + ".html"), self.index_dir / (key + ".json")
+
+    def get_index(self, key):
+        """返回 (页面字节, 元数据) ，没有缓存时返回 (None, None)"""
+        body_path, meta_path = self._index_paths(key)
+        try:
+            with meta_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return body_path.read_bytes(), meta
+        except Exception:
+            return None, None
+
+    def put_index(self, key, body, meta):
+        body_path, meta_path = self._index_paths(key)
+        with self._lock:
+            self.allowed_hosts.update(meta.get("file_hosts", []))
+        _write_bytes_atomic(body_path, body)
+        _write_bytes_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def touch_index(self, key, meta):
+        meta["fetched"] = time.time()
+        _write_bytes_atomic(self._index_paths(key)[1], json.dumps(meta).encode("utf-8"))
+
+    # ---- 分发文件 ----
+    @staticmethod
+    def file_key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def open_file(self, url):
+        """命中时返回已打开的文件对象并刷新 LRU 位置，否则返回 None"""
+        key = self.file_key(url)
+        path = self.files_dir / key
+        try:
+            f = path.open("rb")
+        except OSError:
+            return None
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+        try:
+            os.utime(str(path), None)
+        except OSError:
+            pass
+        return f
+
+    def new_file(self, url):
+        """返回 (临时路径, 最终 key)，下载完成后调用 commit_file"""
+        key = self.file_key(url)
+        return self.files_dir / "{0}.{1}.part".format(key, threading.get_ident()), key
+
+    def commit_file(self, tmp_path, key):
+        size = tmp_path.stat().st_size
+        os.replace(str(tmp_path), str(self.files_dir / key))
+        with self._lock:
+            self._total -= self._lru.pop(key, 0)
+            self._lru[key] = size
+            self._total += size
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total > self.budget and len(self._lru) > 1:
+            key, size = self._lru.popitem(last=False)
+            self._total -= size
+            try:
+                os.unlink(str(self.files_dir / key))
+            except OSError:
+                pass
+
+def _write_bytes_atomic(path, data):
+    tmp = path.with_name("{0}.{1}.tmp".format(path.name, threading.get_ident()))
+    with tmp.open("wb") as f:
+        f.write(data)
+    os.replace(str(tmp), str(path))
+
+# ================== 故障切换（--serve --failover） ==================
+FAILOVER_TRIP_AFTER = 3       # 连续失败多少次后熔断
+FAILOVER_COOLDOWN = 60        # 熔断后多少秒允许一次试探请求
+FAILOVER_HEDGE_DEFAULT = 1.0  # 样本不足时的对冲阈值（秒）
+FAILOVER_HEDGE_MIN = 0.05
+FAILOVER_MIN_SAMPLES = 20
+FAILOVER_CONSENSUS_TTL = 600  # 各镜像项目页文件数的观测在该时长（秒）内参与比较
+
+_FILE_HREF_RE = re.compile(br"""href\s*=\s*["']([^"'#?]+)""", re.I)
+_FILE_LINK_SUFFIXES = (b".whl", b".tar.gz", b".zip", b".tar.bz2", b".tgz", b".egg")
+
+def count_file_links(body):
+    """项目页中指向分发文件的链接数（不计其他锚点）"""
+    return sum(1 for m in _FILE_HREF_RE.finditer(body) if m.group(1).lower().endswith(_FILE_LINK_SUFFIXES))
+
+class _BufferedResponse(object):
+    """已完整读取的上游响应，接口与 urlopen 返回值一致（read / headers / with）"""
+    def __init__(self, body, headers, url):
+        self._body = body
+        self.headers = headers
+        self.url = url
+
+    def read(self, *args):
+        body, self._body = self._body, b""
+        return body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class MirrorHealth(object):
+    """单个上游的健康状态：延迟样本、指数衰减评分、熔断器与计数器"""
+    def __init__(self, url):
+        self.url = normalize_url(url) + "/"
+        self.latencies = deque(maxlen=100)
+        self.score = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.counters = {"requests": 0, "won": 0, "hedged": 0, "tripped": 0, "failures": 0, "stale": 0}
+
+    def available(self, now):
+        return now >= self.open_until
+
+    def p95(self):
+        if len(self.latencies) < FAILOVER_MIN_SAMPLES:
+            return FAILOVER_HEDGE_DEFAULT
+        ordered = sorted(self.latencies)
+        return max(FAILOVER_HEDGE_MIN, ordered[int(len(ordered) * 0.95) - 1])
+
+    def rank_key(self):
+        return self.score if self.score is not None else FAILOVER_HEDGE_DEFAULT
+
+class FailoverUpstream(object):
+    """
+    多上游转发：每个索引请求发给评分最好的镜像；超过其 p95 延迟仍未返回时，
+    同时向次优镜像发出对冲请求，先成功者胜出。返回 5xx、连接失败或明显过期页面
+    （文件数少于其他镜像近期观测的中位数；或项目页 404 而其他镜像有该项目，即尚未同步）
+    的镜像在连续失败后熔断一段时间；所有镜像都 404 时项目确实不存在，原样返回 404。
+    只与近期观测比较：项目删除或撤下文件后，旧的观测过期，不会让所有镜像一直被判为过期
+    """
+    def __init__(self, urls, timeout=BENCH_TIMEOUT):
+        self.mirrors = [MirrorHealth(u) for u in dict.fromkeys(urls)]
+        self.timeout = timeout
+        self._file_counts = {}   # 项目 -> {镜像 URL: (文件数, 观测时间)}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.mirrors)))
+
+    def ranked(self):
+        now = time.time()
+        with self._lock:
+            usable = [m for m in self.mirrors if m.available(now)]
+            # 全部熔断时仍按评分尝试，避免代理完全不可用
+            return sorted(usable or self.mirrors, key=MirrorHealth.rank_key)
+
+    def _fetch(self, mirror, suffix, headers, origin):
+        url = urljoin(mirror.url, suffix)
+        hdrs = dict(headers)
+        if url != origin:
+            # 条件请求的校验值只对原镜像有效
+            hdrs.pop("If-None-Match", None)
+            hdrs.pop("If-Modified-Since", None)
+        start = time.perf_counter()
+        with self._lock:
+            mirror.counters["requests"] += 1
+        try:
+            with open_url(url, self.timeout, hdrs) as resp:
+                body = resp.read()
+                result = _BufferedResponse(body, resp.headers, url)
+        except urllib.error.HTTPError as e:
+            if e.code == 404 and suffix:
+                # 是否算过期由 open() 根据其他镜像的结果决定
+                e.latency = time.perf_counter() - start
+                raise
+            if e.code < 500:
+                self._record(mirror, time.perf_counter() - start, True)
+                raise
+            self._record(mirror, None, False)
+            raise
+        except Exception:
+            self._record(mirror, None, False)
+            raise
+        key = canonical_project_name(suffix.strip("/")) if suffix else ""
+        if key and self._is_stale(mirror, key, body):
+            with self._lock:
+                mirror.counters["stale"] += 1
+            self._record(mirror, None, False)
+            raise IOError("stale index page from {0}".format(mirror.url))
+        self._record(mirror, time.perf_counter() - start, True)
+        return result
+
+    def _is_stale(self, mirror, key, body):
+        count = count_file_links(body)
+        now = time.time()
+        with self._lock:
+            seen = self._file_counts.setdefault(key, {})
+            for url in [u for u, (_, at) in seen.items() if now - at >= FAILOVER_CONSENSUS_TTL]:
+                del seen[url]
+            others = sorted(c for url, (c, _) in seen.items() if url != mirror.url)
+            seen[mirror.url] = (count, now)
+        # 与其他镜像近期观测的（偏低）中位数比较；没有其他观测时无从判断
+        return bool(others) and count < others[(len(others) - 1) // 2]
+
+    def _record(self, mirror, latency, ok):
+        with self._lock:
+            if ok:
+                mirror.consecutive_failures = 0
+                mirror.open_until = 0.0
+                if latency is not None:
+                    mirror.latencies.append(latency)
+                    mirror.score = latency if mirror.score is None else \
+                        mirror.score + HEALTH_DECAY * (latency - mirror.score)
+                return
+            mirror.counters["failures"] += 1
+            mirror.consecutive_failures += 1
+            mirror.score = min(FAILOVER_COOLDOWN, (mirror.score or FAILOVER_HEDGE_DEFAULT) * 2)
+            if mirror.consecutive_failures >= FAILOVER_TRIP_AFTER and mirror.available(time.time()):
+                mirror.open_until = time.time() + FAILOVER_COOLDOWN
+                mirror.counters["tripped"] += 1
+
+    def open(self, suffix, headers, origin=None):
+        """
+        返回 (响应, 页面 URL)；4xx（含 304）原样以 HTTPError 抛出。
+        项目页 404 时改试下一个镜像：有镜像返回该页面时，404 的镜像记为过期（计入熔断）
+        """
+        candidates = self.ranked()
+        missing = []
+        pending = {}
+        primary = candidates[0]
+        pending[self._pool.submit(self._fetch, primary, suffix, headers, origin)] = primary
+        next_idx = 1
+        error = None
+        wait_for = primary.p95()
+        while pending:
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                # 超过 p95 仍未返回：对冲到下一个镜像
+                if next_idx < len(candidates):
+                    with self._lock:
+                        pending_mirror = pending[next(iter(pending))]
+                        pending_mirror.counters["hedged"] += 1
+                    mirror = candidates[next_idx]
+                    next_idx += 1
+                    pending[self._pool.submit(self._fetch, mirror, suffix, headers, origin)] = mirror
+                    wait_for = mirror.p95()
+                else:
+                    wait_for = None
+                continue
+            for future in done:
+                mirror = pending.pop(future)
+                try:
+                    resp = future.result()
+                except urllib.error.HTTPError as e:
+                    if e.code == 404 and suffix:
+                        missing.append((mirror, e.latency))
+                        error = e
+                        continue
+                    if e.code < 500:
+                        with self._lock:
+                            mirror.counters["won"] += 1
+                        raise
+                    error = e
+                except Exception as e:
+                    error = e
+                else:
+                    with self._lock:
+                        mirror.counters["won"] += 1
+                        for stale, _ in missing:
+                            stale.counters["stale"] += 1
+                    for stale, _ in missing:
+                        self._record(stale, None, False)
+                    return resp, resp.url
+            # 全部失败时立即尝试下一个镜像
+            if not pending and next_idx < len(candidates):
+                mirror = candidates[next_idx]
+                next_idx += 1
+                pending[self._pool.submit(self._fetch, mirror, suffix, headers, origin)] = mirror
+                wait_for = mirror.p95()
+        if missing and len(missing) == next_idx:
+            # 每个镜像都 404：项目不存在，不是镜像的问题
+            for mirror, latency in missing:
+                self._record(mirror, latency, True)
+        raise error or IOError("no upstream available")
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return [dict(m.counters, url=m.url, open=not m.available(now),
+                         score=m.score, p95=m.p95()) for m in self.mirrors]
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    server_version = "pip-mirror-manager-proxy"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, fmt, *args)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        try:
+            if path in ("/simple", "/simple/"):
+                self._serve_index("", "")
+            elif path.startswith("/simple/"):
+                project = path[len("/simple/"):]
+                if not project.endswith("/"):
+                    self._redirect(path + "/")
+                    return
+                name = canonical_project_name(project.strip("/"))
+                self._serve_index(name, name + "/")
+            elif path.startswith("/files/"):
+                self._serve_file(self.path[len("/files/"):])
+            elif path == "/stats":
+                self._send_body(json.dumps(self.server.stats(), indent=1).encode("utf-8"),
+                                "application/json")
+            elif path == "/metrics" and get_metrics() is not None:
+                self._send_body(get_metrics().render_prometheus().encode("utf-8"), METRICS_CONTENT_TYPE)
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _redirect(self, location):
+        self.send_response(301)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_body(self, body, content_type="text/html; charset=utf-8"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve_index(self, name, suffix):
+        cache = self.server.cache
+        key = name or "_root"
+        body, meta = cache.get_index(key)
+        if body is not None and time.time() - meta.get("fetched", 0) < INDEX_MAX_AGE:
+            inc_metric("pip_mirror_proxy_requests_total", kind="index", result="hit")
+            self._send_body(body)
+            return
+        headers = {"Accept": "text/html"}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp, page_url = self.server.open_upstream(suffix, headers, (meta or {}).get("upstream"))
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and body is not None:
+                inc_metric("pip_mirror_proxy_requests_total", kind="index", result="revalidated")
+                cache.touch_index(key, meta)
+                self._send_body(body)
+            elif body is not None and e.code >= 500:
+                inc_metric("pip_mirror_proxy_requests_total", kind="index", result="stale")
+                self._send_body(body)  # 上游故障时使用过期缓存
+            else:
+                inc_metric("pip_mirror_proxy_requests_total", kind="index", result="error")
+                self.send_error(e.code)
+            return
+        except Exception:
+            if body is not None:
+                inc_metric("pip_mirror_proxy_requests_total", kind="index", result="stale")
+                self._send_body(body)
+            else:
+                inc_metric("pip_mirror_proxy_requests_total", kind="index", result="error")
+                self.send_error(502)
+            return
+        inc_metric("pip_mirror_proxy_requests_total", kind="index", result="miss")
+        with resp:
+            raw = resp.read()
+            new_meta = {"etag": resp.headers.get("ETag"),
+                        "last_modified": resp.headers.get("Last-Modified"),
+                        "fetched": time.time(), "upstream": page_url}
+        text = raw.decode("utf-8", "replace")
+        hosts = set()
+        if name:
+            text, hosts = rewrite_index_links(text, page_url)
+        new_meta["file_hosts"] = sorted(hosts)
+        body = text.encode("utf-8")
+        cache.put_index(key, body, new_meta)
+        self._send_body(body)
+
+    def _serve_file(self, rest):
+        scheme, _, remainder = rest.partition("/")
+        host, _, tail = remainder.partition("/")
+        host = unquote(host)  # pip 会把 host:port 中的冒号编码为 %3A
+        if scheme not in ("http", "https") or host not in self.server.cache.allowed_hosts:
+            self.send_error(403)
+            return
+        url = "{0}://{1}/{2}".format(scheme, host, tail)
+        cache = self.server.cache
+        f = cache.open_file(url)
+        if f is not None:
+            inc_metric("pip_mirror_proxy_requests_total", kind="file", result="hit")
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile, STREAM_CHUNK)
+            return
+        try:
+            resp = open_url(url, self.server.timeout)
+        except urllib.error.HTTPError as e:
+            inc_metric("pip_mirror_proxy_requests_total", kind="file", result="error")
+            self.send_error(e.code)
+            return
+        except Exception:
+            inc_metric("pip_mirror_proxy_requests_total", kind="file", result="error")
+            self.send_error(502)
+            return
+        inc_metric("pip_mirror_proxy_requests_total", kind="file", result="miss")
+        tmp_path, key = cache.new_file(url)
+        complete = False
+        with resp:
+            length = resp.headers.get("Content-Length")
+            self.send_response(200)
+            self.send_header("Content-Type", resp.headers.get("Content-Type", "application/octet-stream"))
+            if length:
+                self.send_header("Content-Length", length)
+            self.end_headers()
+            # 边下载边转发给客户端，同时写入缓存临时文件
+            try:
+                with tmp_path.open("wb") as out:
+                    received = 0
+                    while True:
+                        chunk = resp.read(STREAM_CHUNK)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        received += len(chunk)
+                        self.wfile.write(chunk)
+                complete = not length or received == int(length)
+            finally:
+                if complete:
+                    cache.commit_file(tmp_path, key)
+                else:
+                    try:
+                        os.unlink(str(tmp_path))
+                    except OSError:
+                        pass
+
+class CachingIndexProxy(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    PEP 503 simple 索引的本地缓存代理：索引页与分发文件从磁盘提供，未命中时转发到上游镜像
+    """
+    daemon_threads = True
+
+    def __init__(self, address, upstream, cache, timeout=BENCH_TIMEOUT, verbose=False):
+        """upstream 为单个镜像 URL，或 FailoverUpstream（多镜像故障切换）"""
+        HTTPServer.__init__(self, address, _ProxyHandler)
+        self.failover = upstream if isinstance(upstream, FailoverUpstream) else None
+        urls = [m.url for m in self.failover.mirrors] if self.failover else [upstream]
+        self.upstream = normalize_url(urls[0]) + "/"
+        self.cache = cache
+        self.timeout = timeout
+        self.verbose = verbose
+        self.cache.allowed_hosts.update(urlparse(u).netloc for u in urls)
+
+    @property
+    def index_url(self):
+        return "http://{0}:{1}/simple/".format(self.server_address[0], self.server_address[1])
+
+    def open_upstream(self, suffix, headers, origin=None):
+        """请求上游 <index>/<suffix>，返回 (响应, 页面 URL)；origin 为缓存页面的来源 URL"""
+        if self.failover:
+            return self.failover.open(suffix, headers, origin)
+        url = urljoin(self.upstream, suffix)
+        return open_url(url, self.timeout, headers), url
+
+    def stats(self):
+        if self.failover:
+            return {"upstreams": self.failover.stats()}
+        return {"upstreams": [{"url": self.upstream}]}
+
+# ================== 镜像同步新鲜度（--freshness） ==================
+FRESHNESS_PER_HOST = 2           # 每个镜像同时使用的连接数
+FRESHNESS_MAX_WORKERS = 16       # 全局并发上限
+FRESHNESS_WINDOW = 30 * 86400    # 只用该时间窗口内上传的缺失文件估算同步延迟
+FRESHNESS_TOLERANCE = 3600       # 同步延迟超过该值（秒）的镜像在排名中靠后
+_REQ_NAME_RE = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*(?:==\s*([^\s;,#]+))?")
+
+class KeepAliveFetcher(object):
+    """
+    顺序发送 GET 的小封装（每个工作线程一个实例）：连接取自共享连接池，
+    4xx/5xx 不抛异常，原样返回响应
+    """
+    def __init__(self, timeout=BENCH_TIMEOUT):
+        self.timeout = timeout
+        self._resp = None
+
+    def close(self):
+        """关闭上一个响应；未读完的响应其连接不会回到连接池"""
+        if self._resp is not None:
+            self._resp.close()
+            self._resp = None
+
+    def open(self, url, headers=None, max_redirects=3):
+        """发送 GET，返回 (尚未读取的响应, 最终 URL)；响应具有 getcode() / headers / read()"""
+        self.close()
+        self._resp = get_http_pool().open(url, headers, self.timeout, max_redirects)
+        return self._resp, self._resp.url
+
+def parse_requirements(path):
+    """
+    读取 requirements 文件，返回 [(规范化项目名, 固定版本或 None)]；跳过注释、选项行与 URL
+    """
+    result = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split(" #", 1)[0].strip()
+            if not line or line.startswith(("#", "-")) or "://" in line:
+                continue
+            m = _REQ_NAME_RE.match(line)
+            if m:
+                result.append((canonical_project_name(m.group(1)), m.group(2)))
+    return list(OrderedDict.fromkeys(result))
+
+def _upload_times(entries):
+    return dict((e["filename"], e["upload_time"]) for e in entries)
+
+def fetch_project_pages(index_urls, projects, per_host=FRESHNESS_PER_HOST,
+                        max_workers=FRESHNESS_MAX_WORKERS, timeout=BENCH_TIMEOUT, collect=_upload_times):
+    """
+    并发获取每个镜像上每个项目的页面：每个镜像最多 per_host 条长连接，全局最多 max_workers 个线程。
+    返回 {(镜像, 项目): collect(文件条目) | None(不存在) | Exception}，默认 collect 得到 {文件名: 上传时间}
+    """
+    jobs = []
+    for index_url in index_urls:
+        for i in range(per_host):
+            chunk = projects[i::per_host]
+            if chunk:
+                jobs.append((index_url, chunk))
+
+    def run(job):
+        index_url, chunk = job
+        base = normalize_url(index_url) + "/"
+        fetcher = KeepAliveFetcher(timeout)
+        out = {}
+        try:
+            for project in chunk:
+                page_url = urljoin(base, project + "/")
+                try:
+                    resp, final = fetcher.open(page_url, {"Accept": SIMPLE_ACCEPT})
+                    status = resp.getcode()
+                    if status >= 400:
+                        resp.read()
+                        out[(index_url, project)] = None if status == 404 else IOError("HTTP {0}".format(status))
+                    else:
+                        entries = iter_index_entries(resp, final, resp.headers.get("Content-Type"))
+                        out[(index_url, project)] = collect(entries)
+                except Exception as e:
+                    fetcher.close()
+                    out[(index_url, project)] = e
+        finally:
+            fetcher.close()
+        return out
+
+    pages = {}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+            for out in pool.map(run, jobs):
+                pages.update(out)
+    return pages
+
+def check_freshness(mirrors, requirements, reference=DEFAULT_URL, now=None, **kwargs):
+    """
+    将每个镜像的项目页与参考索引比较，返回每个镜像的报告：
+      missing_files   参考索引中有、镜像中没有的文件数
+      missing_pins    requirements 中固定、参考索引已有但镜像缺失的版本
+      sync_lag        时间窗口内最早缺失文件的上传距今秒数（参考索引提供上传时间时），0 表示已同步
+      errors          获取失败的项目数
+    """
+    now = time.time() if now is None else now
+    projects = [name for name, _ in requirements]
+    mirrors = [m for m in dict.fromkeys(mirrors) if normalize_url(m) != normalize_url(reference)]
+    pages = fetch_project_pages([reference] + mirrors, projects, **kwargs)
+    ref_has_times = any(isinstance(page, dict) and any(page.values())
+                        for (url, _), page in pages.items() if url == reference)
+    reports = []
+    for mirror in mirrors:
+        report = {"url": mirror, "checked": 0, "errors": 0, "missing_files": 0,
+                  "missing_pins": [], "sync_lag": 0}
+        oldest_missing = None
+        for name, pin in requirements:
+            ref = pages.get((reference, name))
+            got = pages.get((mirror, name))
+            if not isinstance(ref, dict):
+                continue
+            if isinstance(got, Exception):
+                report["errors"] += 1
+                continue
+            report["checked"] += 1
+            missing = [f for f in ref if f not in (got or {})]
+            report["missing_files"] += len(missing)
+            for filename in missing:
+                uploaded = ref[filename]
+                if uploaded and now - uploaded <= FRESHNESS_WINDOW:
+                    oldest_missing = uploaded if oldest_missing is None else min(oldest_missing, uploaded)
+            if pin:
+                ref_versions = set(canonical_version(version_from_filename(f)) for f in ref)
+                got_versions = set(canonical_version(version_from_filename(f)) for f in (got or {}))
+                if canonical_version(pin) in ref_versions and canonical_version(pin) not in got_versions:
+                    report["missing_pins"].append("{0}=={1}".format(name, pin))
+        if oldest_missing is not None:
+            report["sync_lag"] = now - oldest_missing
+        elif not report["checked"] or (report["missing_files"] and not ref_has_times):
+            report["sync_lag"] = None  # 镜像不可达，或参考索引没有上传时间，无法估算
+        reports.append(report)
+    return reports
+
+def format_freshness_row(report):
+    lag = report["sync_lag"]
+    lag_text = "-" if lag is None else "{0:.1f}h".format(lag / 3600.0)
+    return "{0:<27} {1:>8} {2:>8} {3:>8} {4:>6}".format(
+        mirror_display_name(report["url"]), report["missing_files"], len(report["missing_pins"]),
+        lag_text, report["errors"])
+
+# ================== 并行预取（--prefetch） ==================
+PREFETCH_MIRRORS = 3         # 在评分最好的几个镜像之间分摊下载
+PREFETCH_PER_HOST = 4        # 每个主机同时下载的连接数上限
+PREFETCH_CHUNK = 256 * 1024
+PREFETCH_DEST = "wheelhouse"
+_MANYLINUX_LEGACY = {"manylinux1": (2, 5), "manylinux2010": (2, 12), "manylinux2014": (2, 17)}
+
+def _interpreter_tags():
+    """当前解释器的 (python 标签偏好列表, 精确 abi, 主次版本)"""
+    major, minor = sys.version_info[:2]
+    impl = {"cpython": "cp", "pypy": "pp"}.get(sys.implementation.name, "py")
+    soabi = sysconfig.get_config_var("SOABI") or ""
+    abi = soabi.split("-")[1] if soabi.startswith("cpython-") else ""
+    abi = "cp" + abi if abi else "{0}{1}{2}".format(impl, major, minor)
+    pythons = ["{0}{1}{2}".format(impl, major, minor), "py{0}{1}".format(major, minor), "py{0}".format(major)]
+    return pythons, abi, (major, minor)
+
+def _platform_rank(plat):
+    """wheel 平台标签的适配程度：0 为本平台专用，1 为 any，不兼容时为 None"""
+    if plat == "any":
+        return 1
+    import platform
+    sysplat = sysconfig.get_platform().replace("-", "_").replace(".", "_")
+    if sysplat.startswith("linux_"):
+        arch = sysplat[len("linux_"):]
+        if plat == sysplat:
+            return 0
+        libc, libc_version = platform.libc_ver()
+        m = re.match(r"^(manylinux|musllinux)_(\d+)_(\d+)_(.+)$", plat)
+        if m:
+            family, need, tag_arch = m.group(1), (int(m.group(2)), int(m.group(3))), m.group(4)
+        elif plat.split("_", 1)[0] in _MANYLINUX_LEGACY:
+            family, need, tag_arch = "manylinux", _MANYLINUX_LEGACY[plat.split("_", 1)[0]], plat.split("_", 1)[1]
+        else:
+            return None
+        if tag_arch != arch or (family == "manylinux") != (libc == "glibc"):
+            return None
+        have = tuple(int(x) for x in re.findall(r"\d+", libc_version)[:2]) if libc == "glibc" else need
+        return 0 if have >= need else None
+    if sysplat.startswith("macosx_"):
+        m = re.match(r"^macosx_(\d+)_(\d+)_(.+)$", plat)
+        if not m:
+            return None
+        arch = platform.machine()
+        release = tuple(int(x) for x in (platform.mac_ver()[0] or "0.0").split(".")[:2])
+        arches = {m.group(3)} | ({"arm64", "x86_64"} if m.group(3) in ("universal2", "universal") else set())
+        return 0 if arch in arches and (int(m.group(1)), int(m.group(2))) <= release else None
+    return 0 if plat == sysplat else None
+
+def wheel_rank(filename):
+    """
+    wheel 对当前解释器的偏好排序键（越小越好），不兼容时返回 None。
+    PEP 425 的简化实现：支持压缩标签、abi3 与 manylinux/musllinux/macOS 版本比较
+    """
+    parts = filename[:-len(".whl")].split("-")
+    if not filename.endswith(".whl") or len(parts) < 5:
+        return None
+    pythons, exact_abi, (major, minor) = _interpreter_tags()
+    best = None
+    for plat in parts[-1].split("."):
+        plat_rank = _platform_rank(plat)
+        if plat_rank is None:
+            continue
+        for abi in parts[-2].split("."):
+            for py in parts[-3].split("."):
+                if abi == exact_abi and py == pythons[0]:
+                    rank = (plat_rank, 0, 0)
+                elif abi == "abi3" and py.startswith("cp") and py[2:3] == str(major) \
+                        and py[3:].isdigit() and int(py[3:]) <= minor and pythons[0].startswith("cp"):
+                    rank = (plat_rank, 1, minor - int(py[3:]))
+                elif abi == "none" and py in pythons:
+                    rank = (plat_rank, 2, pythons.index(py))
+                else:
+                    continue
+                if best is None or rank < best:
+                    best = rank
+    return best
+
+def _release_key(version):
+    """未固定版本时的比较键：逐段比较数字；预发布、开发版与无法识别的版本返回 None"""
+    m = re.match(r"^v?(\d+(?:\.\d+)*)(.*)$", (version or "").split("+", 1)[0])
+    post = re.match(r"^[.-]?post(\d*)$", m.group(2).lower()) if m else None
+    if not m or (m.group(2) and not post):
+        return None
+    return tuple(int(x) for x in m.group(1).split(".")), int(post.group(1) or 0) if post else -1
+
+def choose_distribution(entries, pin=None):
+    """
+    从项目页条目中为当前解释器选出一个文件：固定版本（按规范化后的版本号比较）
+    或最新的正式版，跳过 Requires-Python 不接受当前解释器的文件，
+    优先最匹配的 wheel，没有兼容 wheel 时使用 sdist。找不到时返回 None
+    """
+    usable = [e for e in entries if e["version"] and (pin or not e["yanked"])
+              and python_version_matches(e["requires_python"])]
+    if pin:
+        pin = canonical_version(pin)
+        usable = [e for e in usable if canonical_version(e["version"]) == pin]
+    else:
+        keyed = [(_release_key(e["version"]), e) for e in usable]
+        latest = max((k for k, _ in keyed if k is not None), default=None)
+        usable = [e for k, e in keyed if k is not None and k == latest]
+    wheels = [(wheel_rank(e["filename"]), e) for e in usable if e["filename"].endswith(".whl")]
+    wheels = [(r, e) for r, e in wheels if r is not None]
+    if wheels:
+        return min(wheels, key=lambda item: item[0])[1]
+    sdists = [e for e in usable if e["filename"].endswith(_SDIST_EXTS)]
+    return sdists[0] if sdists else None
+
+def parse_requirement_hashes(path):
+    """读取 requirements/锁文件中的 --hash=sha256:...，返回 {规范化项目名: {sha256, ...}}"""
+    hashes = {}
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().replace("\\\n", " ")
+    for line in text.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        m = _REQ_NAME_RE.match(line)
+        if not m or line.startswith(("#", "-")):
+            continue
+        found = re.findall(r"--hash[=\s]+sha256:([0-9a-fA-F]{64})", line)
+        if found:
+            hashes.setdefault(canonical_project_name(m.group(1)), set()).update(h.lower() for h in found)
+    return hashes
+
+def download_resumable(fetcher, url, dest, sha256=None, allowed=None, chunk_size=PREFETCH_CHUNK):
+    """
+    下载到 dest.part 并在校验通过后改名为 dest。已有 .part 时用 Range 续传，
+    服务器不支持续传（返回 200）时从头下载。sha256 为索引给出的哈希，
+    allowed 为锁文件允许的哈希集合；任一不匹配时删除临时文件并抛出 IOError。
+    返回本次实际下载的字节数
+    """
+    dest = Path(dest)
+    part = dest.with_name(dest.name + ".part")
+    digest = hashlib.sha256()
+    offset = 0
+    if part.exists():
+        with part.open("rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                digest.update(block)
+                offset += len(block)
+    headers = {"Range": "bytes={0}-".format(offset)} if offset else {}
+    resp, _ = fetcher.open(url, headers)
+    status = resp.getcode()
+    received = 0
+    try:
+        if status == 416 and offset:
+            resp.read()  # .part 已完整，直接校验
+        elif status >= 400:
+            resp.read()
+            raise IOError("HTTP {0}: {1}".format(status, url))
+        else:
+            if status != 206:
+                digest, offset = hashlib.sha256(), 0
+            with part.open("ab" if offset else "wb") as out:
+                while True:
+                    block = resp.read(chunk_size)
+                    if not block:
+                        break
+                    out.write(block)
+                    digest.update(block)
+                    received += len(block)
+    except Exception:
+        fetcher.close()
+        raise
+    actual = digest.hexdigest()
+    if (sha256 and actual != sha256.lower()) or (allowed and actual not in allowed):
+        try:
+            os.unlink(str(part))
+        except OSError:
+            pass
+        raise IOError("hash mismatch for {0}: {1}".format(dest.name, actual))
+    os.replace(str(part), str(dest))
+    return received
+
+def _file_matches(path, sha256=None, allowed=None):
+    if not path.exists():
+        return False
+    if not (sha256 or allowed):
+        return True
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(PREFETCH_CHUNK), b""):
+            digest.update(block)
+    actual = digest.hexdigest()
+    return (not sha256 or actual == sha256.lower()) and (not allowed or actual in allowed)
+
+def prefetch(requirements, mirrors, dest=PREFETCH_DEST, per_host=PREFETCH_PER_HOST,
+             lock_hashes=None, timeout=BENCH_TIMEOUT):
+    """
+    把 requirements 中每个项目选定的分发文件并行下载到 dest（wheelhouse）。
+    版本与文件在第一个镜像（已配置的索引）上确定，其余镜像只要有同名文件即可分担下载。
+    每个镜像 per_host 个工作线程共用一个任务列表，吞吐量高的镜像自然领取更多文件；
+    同一文件主机的并发连接数也不超过 per_host。某个镜像下载失败的文件交给其他镜像重试，
+    中断的文件下次运行时续传。返回 {"files": [...], "mirrors": {镜像: {files, bytes, seconds}}}
+    """
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    lock_hashes = lock_hashes or {}
+    mirrors = list(dict.fromkeys(mirrors))
+    projects = [name for name, _ in requirements]
+    pages = fetch_project_pages(mirrors, projects, per_host=per_host, timeout=timeout, collect=list)
+
+    jobs = []
+    for name, pin in requirements:
+        page = next((pages.get((m, name)) for m in mirrors if isinstance(pages.get((m, name)), list)), None)
+        chosen = choose_distribution(page or [], pin)
+        job = {"project": name, "pin": pin, "filename": None, "mirror": None, "bytes": 0,
+               "status": "failed", "error": "", "sources": {}, "tried": set(), "taken": False}
+        jobs.append(job)
+        if chosen is None:
+            job["error"] = "no matching distribution" if page is not None else "project not found"
+            continue
+        job["filename"] = chosen["filename"]
+        job["sha256"] = chosen["hashes"].get("sha256")
+        job["allowed"] = lock_hashes.get(name)
+        for m in mirrors:
+            entries = pages.get((m, name))
+            if isinstance(entries, list):
+                for entry in entries:
+                    if entry["filename"] == chosen["filename"]:
+                        job["sources"][m] = entry["url"]
+                        break
+        if _file_matches(dest / chosen["filename"], job["sha256"], job["allowed"]):
+            job.update(status="cached", taken=True)
+
+    lock = threading.Lock()
+    host_slots = {}
+    stats = dict((m, {"files": 0, "bytes": 0, "seconds": 0.0}) for m in mirrors)
+
+    def take(mirror):
+        with lock:
+            for job in jobs:
+                if not job["taken"] and mirror in job["sources"] and mirror not in job["tried"]:
+                    job["taken"] = True
+                    return job
+        return None
+
+    def worker(mirror):
+        fetcher = KeepAliveFetcher(timeout)
+        try:
+            while True:
+                job = take(mirror)
+                if job is None:
+                    return
+                url = job["sources"][mirror]
+                host = urlparse(url).netloc
+                with lock:
+                    slot = host_slots.setdefault(host, threading.BoundedSemaphore(per_host))
+                start = time.perf_counter()
+                try:
+                    with slot:
+                        received = download_resumable(fetcher, url, dest / job["filename"],
+                                                      job["sha256"], job["allowed"])
+                except Exception as e:
+                    with lock:
+                        job["tried"].add(mirror)
+                        job["error"] = str(e) or e.__class__.__name__
+                        job["taken"] = False
+                    continue
+                with lock:
+                    job.update(status="downloaded", mirror=mirror, bytes=received, error="")
+                    stats[mirror]["files"] += 1
+                    stats[mirror]["bytes"] += received
+                    stats[mirror]["seconds"] += time.perf_counter() - start
+        finally:
+            fetcher.close()
+
+    # 失败的文件会退回列表；只要还有未尝试过的镜像就再来一轮
+    while any(not j["taken"] and set(j["sources"]) - j["tried"] for j in jobs):
+        active = [m for m in mirrors if any(not j["taken"] and m in j["sources"] and m not in j["tried"]
+                                            for j in jobs)]
+        with ThreadPoolExecutor(max_workers=len(active) * per_host) as pool:
+            for mirror in active:
+                for _ in range(per_host):
+                    pool.submit(worker, mirror)
+
+    files = [dict((k, v) for k, v in job.items() if k not in ("sources", "tried", "taken", "allowed"))
+             for job in jobs]
+    return {"files": files, "mirrors": stats}
+
+def prefetch_mirrors(cfg_path, count=PREFETCH_MIRRORS):
+    """已配置的索引排第一，其后是健康缓存中吞吐量最高的可达镜像"""
+    primary = read_current_index_url(cfg_path) or DEFAULT_URL
+    health = load_health_cache(cfg_path)
+    entries = [e for e in health.ranking(benchmark_candidates(primary)) if e.get("last_ok")]
+    entries.sort(key=lambda e: -(e.get("throughput") or 0))
+    urls = [primary] + [e["url"] for e in entries if normalize_url(e["url"]) != normalize_url(primary)]
+    return urls[:max(1, count)]
+
+# ================== pip 缓存目录（--pip-cache） ==================
+PIP_CACHE_WORKERS = 16       # 并行删除的线程数（unlink 会释放 GIL，网络盘上收益最大）
+PIP_CACHE_SCAN_WORKERS = 1   # 扫描线程数：默认串行，网络盘上用 --scan-workers=N 并行
+# pip 缓存中的条目类型：http-v2（pip ≥ 23.3）与 http 为 HTTP 响应缓存，wheels 为本地构建的 wheel
+PIP_CACHE_KINDS = {"http-v2": "http", "http": "http", "wheels": "wheels"}
+
+def default_pip_cache_dir(environ=None):
+    """未设置 cache-dir / PIP_CACHE_DIR 时 pip 使用的缓存目录"""
+    environ = os.environ if environ is None else environ
+    if os.name == "nt":
+        return Path(environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")) / "pip" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "pip"
+    return Path(environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")) / "pip"
+
+def effective_pip_cache_dir(environ=None):
+    """pip 实际使用的缓存目录：按生效配置中的 cache-dir（含 PIP_CACHE_DIR），否则为默认目录"""
+    value = read_effective_pip_config(environ)["values"].get("cache-dir", "").strip()
+    if value:
+        return Path(os.path.expandvars(os.path.expanduser(value)))
+    return default_pip_cache_dir(environ)
+
+def _scan_one(path):
+    """列出一个目录（不递归），返回 ([(路径, 大小, atime, mtime)], [子目录])；读不到的目录与文件跳过"""
+    files, dirs = [], []
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return files, dirs
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, st.st_size, st.st_atime, st.st_mtime))
+            except OSError:
+                continue
+    return files, dirs
+
+def walk_files(root, workers=1):
+    """
+    列出 root 下的全部文件，返回 [(路径, 大小, atime, mtime)]。
+    默认串行遍历：本地磁盘上 os.scandir 几乎不等待 I/O，线程池反而更慢（见 bench pip_cache）；
+    workers > 1 时每个目录作为一个任务交给线程池，子目录一发现就提交，
+    适合每次目录读取都有往返延迟的网络盘（NFS、SMB）
+    """
+    files = []
+    if workers <= 1:
+        stack = [str(root)]
+        while stack:
+            found, dirs = _scan_one(stack.pop())
+            files.extend(found)
+            stack.extend(dirs)
+        return files
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_one, str(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, dirs = future.result()
+                files.extend(found)
+                pending.update(pool.submit(_scan_one, path) for path in dirs)
+    return files
+
+def pip_cache_entries(root, workers=PIP_CACHE_SCAN_WORKERS):
+    """
+    把缓存目录整理成条目 [{kind, size, last_used, reused, paths}]：
+    http 缓存中的 <哈希> 与 <哈希>.body 合为一个条目，wheels 下每个文件是一个条目，其余文件归为 other。
+    last_used 取 atime 与 mtime 中较新者；reused 表示写入后被再次读取过（atime 晚于 mtime，
+    relatime 挂载也成立，noatime 挂载时恒为 False）
+    """
+    root = str(root)
+    entries = {}
+    for path, size, atime, mtime in walk_files(root, workers):
+        rel = os.path.relpath(path, root)
+        kind = PIP_CACHE_KINDS.get(rel.split(os.sep, 1)[0], "other")
+        key = path[:-5] if kind == "http" and path.endswith(".body") else path
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = {"kind": kind, "size": 0, "last_used": 0.0, "reused": False, "paths": []}
+        entry["size"] += size
+        entry["last_used"] = max(entry["last_used"], atime, mtime)
+        entry["reused"] = entry["reused"] or atime > mtime + 1
+        entry["paths"].append(path)
+    return list(entries.values())
+
+def pip_cache_stats(root, entries=None):
+    """
+    缓存大小与命中率：按类型统计文件数、条目数、字节数与被再次读取过的条目比例（hit_rate）
+    """
+    if entries is None:
+        entries = pip_cache_entries(root)
+    kinds = {}
+    for entry in entries:
+        stat = kinds.setdefault(entry["kind"], {"entries": 0, "files": 0, "bytes": 0, "reused": 0})
+        stat["entries"] += 1
+        stat["files"] += len(entry["paths"])
+        stat["bytes"] += entry["size"]
+        stat["reused"] += 1 if entry["reused"] else 0
+    for stat in kinds.values():
+        stat["hit_rate"] = round(stat["reused"] / float(stat["entries"]), 3)
+    reusable = [e for e in entries if e["kind"] != "other"]
+    return {"dir": str(root), "exists": os.path.isdir(str(root)),
+            "bytes": sum(e["size"] for e in entries),
+            "files": sum(len(e["paths"]) for e in entries),
+            "hit_rate": round(sum(1 for e in reusable if e["reused"]) / float(len(reusable)), 3) if reusable else None,
+            "kinds": kinds}
+
+def prune_pip_cache(root, budget, workers=PIP_CACHE_WORKERS, entries=None):
+    """
+    按最近使用时间从旧到新删除 http / wheels 条目，直到缓存总大小不超过 budget 字节（other 不删除）。
+    删除由线程池并行完成，之后清理变空的哈希子目录。
+    返回 {before, after, removed_entries, removed_bytes, errors}
+    """
+    root = str(root)
+    if entries is None:
+        entries = pip_cache_entries(root)
+    total = before = sum(e["size"] for e in entries)
+    victims = []
+    for entry in sorted((e for e in entries if e["kind"] != "other"), key=lambda e: e["last_used"]):
+        if total <= budget:
+            break
+        victims.append(entry)
+        total -= entry["size"]
+
+    def remove(entry):
+        failed = 0
+        for path in entry["paths"]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                failed += 1
+        return failed
+
+    errors = 0
+    if victims:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(victims)))) as pool:
+            errors = sum(pool.map(remove, victims))
+    # 由深到浅删除空目录；非空目录 rmdir 失败即跳过，类型目录本身保留
+    parents = set(os.path.dirname(p) for e in victims for p in e["paths"])
+    keep = set(os.path.join(root, name) for name in PIP_CACHE_KINDS)
+    while parents:
+        above = set()
+        for path in sorted(parents, key=len, reverse=True):
+            if path in keep or not path.startswith(root + os.sep):
+                continue
+            try:
+                os.rmdir(path)
+                above.add(os.path.dirname(path))
+            except OSError:
+                pass
+        parents = above
+    removed = sum(e["size"] for e in victims)
+    return {"before": before, "after": before - removed, "removed_entries": len(victims),
+            "removed_bytes": removed, "errors": errors}
+
+# ================== 负载回放（--replay） ==================
+REPLAY_CONCURRENCY = (1, 10, 50)   # 逐级提高的虚拟客户端数（每个相当于一个 CI 任务里的 pip）
+REPLAY_TIMEOUT = 30                # 单个请求的超时（秒）
+REPLAY_CHUNK = 64 * 1024
+_DIST_SUFFIXES = (".whl", ".tar.gz", ".zip", ".tar.bz2", ".tgz", ".egg", ".whl.metadata")
+# pip 日志中带 URL 的“请求项目页 / 下载文件”行：项目页只在 -vv 及以上出现，-vvv 时还有 urllib3 的请求行
+_LOG_URL_RES = (
+    re.compile(r"(?:Fetching project page and analyzing links|Getting page|Fetched page|Fetching page)"
+               r":?\s+(https?://[^\s\"'<>]+)"),
+    re.compile(r"(?:Downloading(?: link)?:?|Obtaining dependency information for \S+ from)"
+               r"\s+(https?://[^\s\"'<>#]+)"),
+)
+# pip -v：每个需求一行 "Collecting 名称"（隐含请求该项目页）；files.pythonhosted.org 上的文件
+# 只显示文件名（"Downloading x-1.0-py3-none-any.whl (64 kB)"），其他主机显示完整 URL
+_LOG_COLLECT_RE = re.compile(r"^\s*Collecting\s+([A-Za-z0-9][A-Za-z0-9._-]*)(?:[\s\[<>=!~;(]|$)")
+_LOG_FILE_RE = re.compile(r"^\s*Downloading\s+([^\s/\"'<>:]+)(?:\s+\([^)]*\))?\s*$")
+_URLLIB3_RE = re.compile(r"(https?)://([^\s/\"]+) \"GET (\S+) HTTP/1\.[01]\" \d{3}")
+
+def _trace_request(url):
+    """URL 归类为项目页 {"kind": "index", "project"} 或分发文件 {"kind": "file", "filename"}"""
+    path = unquote(urlparse(url).path)
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+    if not name:
+        return None
+    if path.endswith(_DIST_SUFFIXES):
+        return {"kind": "file", "filename": name}
+    return {"kind": "index", "project": canonical_project_name(name)}
+
+def parse_pip_log(lines):
+    """
+    从 pip install -v（或 -vv / -vvv）日志中提取按时间顺序的请求序列；每行一个 URL 的纯文本也可以。
+    -v 日志没有项目页 URL：由 "Collecting" 行与文件名推断出对应的项目页请求，排在该项目的文件之前。
+    同一项目页或文件只保留第一次出现（pip 会在多行日志里提到同一个请求）
+    """
+    seen = OrderedDict()
+
+    def add(request):
+        if request["kind"] == "file":
+            project = project_from_filename(request["filename"])
+            if project:
+                add({"kind": "index", "project": project})
+        seen.setdefault(tuple(sorted(request.items())), request)
+
+    for line in lines:
+        urls = [m.group(1) for regex in _LOG_URL_RES for m in regex.finditer(line)]
+        for m in _URLLIB3_RE.finditer(line):
+            host = re.sub(r":(443|80)$", "", m.group(2))
+            urls.append("{0}://{1}{2}".format(m.group(1), host, m.group(3)))
+        stripped = line.strip()
+        if not urls and re.match(r"^https?://\S+$", stripped):
+            urls.append(stripped)
+        for url in urls:
+            request = _trace_request(url)
+            if request is not None:
+                add(request)
+        m = _LOG_COLLECT_RE.match(line)
+        if m:
+            add({"kind": "index", "project": canonical_project_name(m.group(1))})
+        m = _LOG_FILE_RE.match(line)
+        if m and m.group(1).endswith(_DIST_SUFFIXES):
+            add({"kind": "file", "filename": m.group(1)})
+    return list(seen.values())
+
+def load_trace(path):
+    """读取轨迹：--save-trace 保存的 JSON，或 pip 日志（- 为标准输入）"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", errors="replace")
+    with f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        return json.loads(text)["requests"]
+    return parse_pip_log(text.splitlines())
+
+def resolve_trace(trace, index_url, timeout=BENCH_TIMEOUT, file_bytes=0):
+    """
+    把轨迹映射到某个镜像：项目页直接拼接，文件在该镜像上由文件名对应的项目页中按文件名查找
+    （.metadata 跟随对应的 wheel）。返回 [(URL 或 None(镜像上没有), 请求头)]
+    """
+    base = normalize_url(index_url) + "/"
+    projects = [r["project"] if r["kind"] == "index" else project_from_filename(r["filename"]) for r in trace]
+    projects = list(OrderedDict.fromkeys(p for p in projects if p))
+    pages = fetch_project_pages([index_url], projects, timeout=timeout,
+                                collect=lambda entries: dict((e["filename"], e["url"]) for e in entries))
+    links = {}
+    for page in pages.values():
+        if isinstance(page, dict):
+            links.update(page)
+    file_headers = {"Range": "bytes=0-{0}".format(file_bytes - 1)} if file_bytes else {}
+    requests = []
+    for r in trace:
+        if r["kind"] == "index":
+            requests.append((urljoin(base, r["project"] + "/"), {"Accept": SIMPLE_ACCEPT}))
+        elif r["filename"].endswith(".metadata"):
+            wheel = links.get(r["filename"][:-len(".metadata")])
+            requests.append((wheel + ".metadata" if wheel else None, {}))
+        else:
+            requests.append((links.get(r["filename"]), file_headers))
+    return requests
+
+class _AsyncClient(object):
+    """
+    一个虚拟客户端：每个主机一条 HTTP/1.1 长连接，顺序发送 GET（与单个 pip 进程相同）。
+    只用 asyncio 的流接口，兼容 Python 3.6
+    """
+    def __init__(self, ssl_context):
+        self.ssl_context = ssl_context
+        self._conns = {}
+
+    def drop(self, key):
+        conn = self._conns.pop(key, None)
+        if conn is not None:
+            conn[1].close()
+
+    def close(self):
+        for key in list(self._conns):
+            self.drop(key)
+
+    async def _connection(self, u):
+        """返回 (键, (reader, writer), 是否复用)"""
+        import asyncio
+        key = (u.scheme, u.netloc)
+        conn = self._conns.get(key)
+        if conn is not None and not conn[0].at_eof():
+            return key, conn, True
+        self.drop(key)
+        port = u.port or (443 if u.scheme == "https" else 80)
+        ssl_context = self.ssl_context if u.scheme == "https" else None
+        conn = await asyncio.open_connection(u.hostname, port, ssl=ssl_context,
+                                             server_hostname=u.hostname if ssl_context else None)
+        self._conns[key] = conn
+        return key, conn, False
+
+    async def _exchange(self, u, headers):
+        key, (reader, writer), reused = await self._connection(u)
+        lines = ["GET {0} HTTP/1.1".format((u.path or "/") + ("?" + u.query if u.query else "")),
+                 "Host: {0}".format(u.netloc), "User-Agent: {0}".format(USER_AGENT),
+                 "Accept-Encoding: identity"]
+        lines += ["{0}: {1}".format(k, v) for k, v in headers.items()]
+        try:
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            status_line = (await reader.readline()).decode("latin-1").split(None, 2)
+            if len(status_line) < 2:
+                raise ConnectionError("connection closed by {0}".format(u.netloc))
+        except ConnectionError:
+            self.drop(key)
+            if not reused:
+                raise
+            # 服务器关闭了空闲的长连接：换新连接重发一次
+            return await self._exchange(u, headers)
+        hdrs = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            hdrs[name.strip().lower()] = value.strip()
+        size, complete = await self._read_body(reader, hdrs)
+        if not complete or status_line[0] == "HTTP/1.0" or hdrs.get("connection", "").lower() == "close":
+            self.drop(key)
+        return int(status_line[1]), hdrs, size
+
+    async def get(self, url, headers, max_redirects=3):
+        """返回 (状态码, 响应体字节数)；响应体边读边丢弃，跟随重定向"""
+        for _ in range(max_redirects + 1):
+            status, hdrs, size = await self._exchange(urlparse(url), headers)
+            if status in REDIRECT_CODES and hdrs.get("location"):
+                url = urljoin(url, hdrs["location"])
+                continue
+            return status, size
+        raise IOError("too many redirects: {0}".format(url))
+
+    @staticmethod
+    async def _read_body(reader, hdrs):
+        """读完并丢弃响应体，返回 (字节数, 连接是否可复用)"""
+        size = 0
+        if "chunked" in hdrs.get("transfer-encoding", "").lower():
+            while True:
+                chunk = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+                if not chunk:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return size, True
+                await reader.readexactly(chunk + 2)
+                size += chunk
+        if "content-length" in hdrs:
+            left = int(hdrs["content-length"])
+            while left:
+                data = await reader.read(min(left, REPLAY_CHUNK))
+                if not data:
+                    raise IOError("connection closed mid-body")
+                left -= len(data)
+                size += len(data)
+            return size, True
+        while True:
+            data = await reader.read(REPLAY_CHUNK)
+            if not data:
+                return size, False
+            size += len(data)
+
+async def _replay_clients(requests, concurrency, timeout, ssl_context):
+    import asyncio
+    loop = asyncio.get_event_loop()
+    samples = []
+
+    async def client():
+        http = _AsyncClient(ssl_context)
+        try:
+            for url, headers in requests:
+                if url is None:
+                    samples.append((None, False, 0))
+                    continue
+                start = loop.time()
+                try:
+                    status, size = await asyncio.wait_for(http.get(url, headers), timeout)
+                    samples.append((loop.time() - start, status < 400, size))
+                except Exception:
+                    # 超时或连接出错后连接状态未知，换新连接继续
+                    samples.append((loop.time() - start, False, 0))
+                    http.close()
+        finally:
+            http.close()
+
+    start = loop.time()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return samples, loop.time() - start
+
+def percentile(ordered, q):
+    """已排序序列的 q 分位（最近秩法），空序列返回 None"""
+    if not ordered:
+        return None
+    return ordered[max(0, int(math.ceil(q / 100.0 * len(ordered))) - 1)]
+
+def summarize_load(samples, elapsed):
+    latencies = sorted(s[0] for s in samples if s[1])
+    errors = sum(1 for s in samples if not s[1])
+    return {"requests": len(samples), "errors": errors,
+            "error_rate": round(errors / float(len(samples)), 4) if samples else 0.0,
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            "rps": round(len(samples) / elapsed, 1) if elapsed else None,
+            "bytes_per_sec": round(sum(s[2] for s in samples) / elapsed) if elapsed else None,
+            "seconds": round(elapsed, 3)}
+
+def run_load(requests, concurrency, timeout=REPLAY_TIMEOUT, ssl_context=None):
+    """
+    concurrency 个虚拟客户端同时各自完整回放一遍 requests，返回 summarize_load 的统计。
+    每次调用使用独立的事件循环（不依赖 3.7 的 asyncio.run）
+    """
+    import asyncio
+    if ssl_context is None:
+        ssl_context = get_http_pool().tls_sessions.context
+    loop = asyncio.new_event_loop()
+    try:
+        # Python 3.6 的 asyncio 在协程内部也通过 get_event_loop 取循环，需先设为当前循环
+        asyncio.set_event_loop(loop)
+        samples, elapsed = loop.run_until_complete(_replay_clients(requests, concurrency, timeout, ssl_context))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return summarize_load(samples, elapsed)
+
+def replay_mirrors(trace, mirrors, levels=REPLAY_CONCURRENCY, timeout=REPLAY_TIMEOUT, file_bytes=0,
+                   ssl_context=None, on_result=None):
+    """
+    对每个镜像按 levels 逐级回放轨迹。返回 [{url, missing, levels: [{concurrency, ...统计}]}]；
+    镜像上找不到的文件计为错误。on_result(url, level_result) 用于边测边输出
+    """
+    reports = []
+    for url in mirrors:
+        requests = resolve_trace(trace, url, file_bytes=file_bytes)
+        report = {"url": url, "missing": sum(1 for u, _ in requests if u is None), "levels": []}
+        for concurrency in levels:
+            result = run_load(requests, concurrency, timeout, ssl_context)
+            result["concurrency"] = concurrency
+            report["levels"].append(result)
+            if on_result is not None:
+                on_result(url, result)
+        reports.append(report)
+    return reports
+
+def format_load_row(result):
+    def ms(value):
+        return "{0:.0f}ms".format(value * 1000) if value is not None else "-"
+    return "  c={0:<4} {1:>6} req  p50 {2:>7}  p95 {3:>7}  p99 {4:>7}  {5:>8.1f} req/s {6:>8.2f} MB/s  " \
+           "err {7:.1%}".format(result["concurrency"], result["requests"], ms(result["p50"]), ms(result["p95"]),
+                                ms(result["p99"]), result["rps"] or 0, (result["bytes_per_sec"] or 0) / 1e6,
+                                result["error_rate"])
+
+# ================== GUI ==================
+# tkinter 仅在启动 GUI 时导入，命令行/批量/测速等路径不依赖 Tk
+tk = ttk = messagebox = None
+
+def _load_tk():
+    global tk, ttk, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as tk_ttk, messagebox as tk_messagebox
+        tk, ttk, messagebox = tkinter, tk_ttk, tk_messagebox
+    return tk
+
+class PipMirrorGUI(object):
+    """
+    主窗口。持有 tk.Tk 实例（self.root）而不是继承它，
+    这样定义类时不需要 tkinter，创建窗口时才导入
+    """
+    def __init__(self):
+        _load_tk()
+        self.root = tk.Tk()
+        self.root.title(t("app.title"))
+        self.root.resizable(True, True)
+
+        self.cfg_path = get_user_pip_config_path()
+        self.current_url = read_current_index_url(self.cfg_path) or DEFAULT_URL
+        self.registry = get_registry()
+        self.health = load_health_cache(self.cfg_path)
+        self.prober = BackgroundProber()
+        self.probe_results = {}
+
+        self._build_widgets()
+        self._load_current_selection()
+        self._apply_layout_policies()
+        self.root.bind("<Configure>", self._on_resize)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._probe_all()
+        self.root.after(PROBE_POLL_MS, self._drain_probes)
+
+    def _build_widgets(self):
+        padding = {"padx": 12, "pady": 8}
+
+        # 顶部：路径与打开按钮
+        frm_top = ttk.Frame(self.root)
+        frm_top.pack(fill="x", **padding)
+
+        ttk.Label(frm_top, text=t("label.user_config_file")).pack(side="left")
+        self.lbl_path = ttk.Label(frm_top, text=str(self.cfg_path), foreground="#555")
+        self.lbl_path.pack(side="left", fill="x", expand=True)
+
+        btn_open = ttk.Button(frm_top, text=t("btn.open_folder"), command=self.open_folder)
+        btn_open.pack(side="right")
+
+        # 中部：镜像选择 + 自定义
+        frm_mid = ttk.LabelFrame(self.root, text=t("group.select_mirror"))
+        frm_mid.pack(fill="x", **padding)
+
+        ttk.Label(frm_mid, text=t("label.common_mirrors")).grid(row=0, column=0, sticky="w", padx=8, pady=6)
+
+        self.combo = ttk.Combobox(frm_mid, state="readonly", values=self._mirror_values())
+        self.combo.grid(row=0, column=1, sticky="ew", padx=8, pady=6)
+        frm_mid.columnconfigure(1, weight=1)
+
+        ttk.Label(frm_mid, text=t("label.custom_url")).grid(row=1, column=0, sticky="w", padx=8, pady=6)
+        self.ent_custom = ttk.Entry(frm_mid)
+        self.ent_custom.grid(row=1, column=1, sticky="ew", padx=8, pady=6)
+
+        # 主操作按钮
+        frm_primary = ttk.Frame(self.root)
+        frm_primary.pack(fill="x", **padding)
+        self.btn_save = ttk.Button(frm_primary, text=t("btn.save_user"), command=self.save_config)
+        self.btn_save.pack(side="left")
+        self.btn_bench = ttk.Button(frm_primary, text=t("btn.benchmark"), command=self.run_benchmark)
+        self.btn_bench.pack(side="left", padx=(8, 0))
+
+        # 次要按钮
+        frm_btn = ttk.Frame(self.root)
+        frm_btn.pack(fill="x", **padding)
+        ttk.Button(frm_btn, text=t("btn.restore_official"), command=self.restore_default).pack(side="left")
+        ttk.Button(frm_btn, text=t("btn.exit"), command=self.on_close).pack(side="right")
+
+        # 当前状态
+        frm_status = ttk.Frame(self.root)
+        frm_status.pack(fill="x", **padding)
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(frm_status, textvariable=self.status_var, foreground="#0a7").pack(anchor="w")
+        self.rank_var = tk.StringVar(value="")
+        ttk.Label(frm_status, textvariable=self.rank_var, foreground="#555").pack(anchor="w")
+        self.fleet_var = tk.StringVar(value="")
+        ttk.Label(frm_status, textvariable=self.fleet_var, foreground="#555").pack(anchor="w")
+
+        # 底部提示（自动换行）
+        self.lbl_tip = ttk.Label(self.root, text=t("tip"), foreground="#666", justify="left")
+        self.lbl_tip.pack(anchor="w", fill="x", padx=12, pady=(0, 12))
+
+    def _mirror_values(self):
+        # 下拉框第 idx 项即注册表第 idx 个镜像，选择时按位置取回，不解析显示文本
+        return [u"{0} [{1}]  |  {2}".format(m.display_name(), format_probe_status(self.probe_results.get(idx)), m.url)
+                for idx, m in enumerate(self.registry)]
+
+    def _probe_all(self):
+        if self.prober.cancelled:
+            return
+        for idx, mirror in enumerate(self.registry):
+            self.prober.submit(idx, mirror.url)
+        self.root.after(PROBE_INTERVAL_MS, self._probe_all)
+
+    def _drain_probes(self):
+        if self.prober.cancelled:
+            return
+        items = self.prober.drain()
+        if items:
+            for idx, result in items:
+                self.probe_results[idx] = result
+            selected = self.combo.current()
+            self.combo.configure(values=self._mirror_values())
+            # 刷新选项后重新选中，使显示文本同步更新
+            if selected >= 0:
+                self.combo.current(selected)
+        self.root.after(PROBE_POLL_MS, self._drain_probes)
+
+    def mainloop(self):
+        self.root.mainloop()
+
+    def on_close(self):
+        self.prober.cancel()
+        self.root.quit()
+
+    def _show_current_index(self):
+        # 环境变量、site 或 PIP_CONFIG_FILE 覆盖了用户配置时一并提示
+        lines = [t("status.current_index", url=self.current_url)]
+        note = effective_override_note(self.current_url)
+        if note:
+            lines.append(note)
+        self.status_var.set("\n".join(lines))
+
+    def _load_current_selection(self):
+        self._select_url(self.current_url)
+        self._show_current_index()
+        # 先显示缓存的排名，再在后台刷新过期条目
+        self._show_cached_ranking()
+        thread = refresh_stale_async(self.health, benchmark_candidates(self.current_url))
+        if thread is not None:
+            self.root.after(500, self._poll_refresh, thread)
+        self._load_fleet_recommendation()
+
+    def _load_fleet_recommendation(self):
+        """共享卷可能较慢，在后台线程读取集群推荐；只读取，不做任何探测"""
+        if not get_fleet_store_path():
+            return
+        holder = {}
+        thread = threading.Thread(target=lambda: holder.update(rec=fleet_recommendation()), daemon=True)
+        thread.start()
+        self.root.after(200, self._poll_fleet, thread, holder)
+
+    def _poll_fleet(self, thread, holder):
+        if thread.is_alive():
+            self.root.after(200, self._poll_fleet, thread, holder)
+            return
+        rec = holder.get("rec")
+        if not rec:
+            return
+        self.fleet_var.set(format_fleet_recommendation(rec))
+        # 与测速相同：仅选中推荐的镜像，由用户点击“保存”写入
+        if normalize_url(rec["url"]) != normalize_url(self.current_url):
+            self._select_url(rec["url"])
+
+    def _show_cached_ranking(self):
+        items = format_cached_ranking(self.health.ranking(benchmark_candidates(self.current_url)))
+        self.rank_var.set(t("cache.ranking", items=items) if items else "")
+
+    def _poll_refresh(self, thread):
+        if thread.is_alive():
+            self.root.after(500, self._poll_refresh, thread)
+        else:
+            self._show_cached_ranking()
+
+    def _select_url(self, target):
+        idx = self.registry.index(target)
+        if idx >= 0:
+            self.combo.current(idx)
+            self.ent_custom.delete(0, tk.END)
+            return
+        self.combo.set(u"{0}  |  {1}".format(t("custom"), t("loaded")))
+        self.ent_custom.delete(0, tk.END)
+        self.ent_custom.insert(0, target)
+
+    def _apply_layout_policies(self):
+        self.root.update_idletasks()
+        self._update_tip_wraplength()
+        req_w = self.root.winfo_reqwidth()
+        req_h = self.root.winfo_reqheight()
+        # 设为最小尺寸以避免裁切
+        self.root.minsize(req_w, req_h)
+        self._center_window(req_w, req_h)
+
+    def _update_tip_wraplength(self):
+        width = max(self.root.winfo_width(), self.root.winfo_reqwidth())
+        wrap = max(200, width - 24)
+        try:
+            self.lbl_tip.configure(wraplength=wrap)
+        except Exception:
+            pass
+
+    def _center_window(self, w=None, h=None):
+        self.root.update_idletasks()
+        if w is None:
+            w = self.root.winfo_width()
+        if h is None:
+            h = self.root.winfo_height()
+        sw = self.root.winfo_screenwidth()
+        sh = self.root.winfo_screenheight()
+        x = int((sw - w) / 2)
+        y = int((sh - h) / 2.5)
+        self.root.geometry("{0}x{1}+{2}+{3}".format(w, h, x, y))
+
+    def _on_resize(self, event):
+        self._update_tip_wraplength()
+
+    def open_folder(self):
+        folder = str(Path(self.cfg_path).parent)
+        try:
+            if os.name == "nt":
+                os.startfile(folder)
+            elif sys.platform == "darwin":
+                subprocess.run(["open", folder], check=False)
+            else:
+                subprocess.run(["xdg-open", folder], check=False)
+        except Exception as e:
+            messagebox.showerror(t("error"), t("error.open_folder", err=e))
+
+    def get_target_url(self):
+        custom = self.ent_custom.get().strip()
+        if custom:
+            return custom
+        idx = self.combo.current()
+        if idx >= 0:
+            return self.registry[idx].url
+        # 下拉框显示的是“自定义（已加载）”但输入框已清空
+        return ""
+
+    def save_config(self):
+        url = self.get_target_url()
+        if not is_valid_url(url):
+            messagebox.showwarning(t("warn.invalid_url_title"), t("warn.invalid_url_msg"))
+            return
+        try:
+            switch_index_url(self.cfg_path, url)
+            self.current_url = url
+            self._show_current_index()
+            self._remember_custom(url)
+            messagebox.showinfo(t("ok.title"), t("ok.saved", url=url, path=self.cfg_path))
+        except Exception as e:
+            messagebox.showerror(t("fail.write_title"), t("fail.write_msg", err=e))
+
+    def _remember_custom(self, url):
+        self.health.add_custom(url)
+        try:
+            self.health.save()
+        except Exception:
+            pass
+
+    def run_benchmark(self):
+        """后台线程测速，避免阻塞 Tk 主循环；结果通过 after() 轮询取回"""
+        urls = benchmark_candidates(self.current_url)
+        self.btn_bench.state(["disabled"])
+        self.status_var.set(t("status.benchmarking", count=len(urls)))
+        holder = {}
+
+        def worker():
+            holder["results"] = benchmark_mirrors(urls)
+            self.health.record_all(holder["results"])
+            if export_to_fleet(holder["results"]):
+                self.health.mark_exported(r["url"] for r in holder["results"])
+            self.health.evict()
+            try:
+                self.health.save()
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self.root.after(200, self._poll_benchmark, thread, holder)
+
+    def _poll_benchmark(self, thread, holder):
+        if thread.is_alive():
+            self.root.after(200, self._poll_benchmark, thread, holder)
+            return
+        self.btn_bench.state(["!disabled"])
+        results = holder.get("results") or []
+        if not results or not results[0]["ok"]:
+            self.status_var.set(t("status.benchmark_failed"))
+            return
+        self._show_cached_ranking()
+        best = results[0]
+        # 仅选中最快镜像，由用户点击“保存”写入
+        self._select_url(best["url"])
+        self.status_var.set(t("status.benchmark_done", name=mirror_display_name(best["url"]),
+                              ms=int(best["score"] * 1000)))
+
+    def restore_default(self):
+        try:
+            switch_index_url(self.cfg_path, DEFAULT_URL)
+            self.current_url = DEFAULT_URL
+            self._select_url(DEFAULT_URL)
+            self._show_current_index()
+            messagebox.showinfo(t("ok.restored_title"), t("ok.restored_msg"))
+        except Exception as e:
+            messagebox.showerror(t("fail.restore_title"), t("fail.restore_msg", err=e))
+
+# ================== CLI 回退（可选） ==================
+def run_cli():
+    cfg_path = get_user_pip_config_path()
+    current = read_current_index_url(cfg_path) or DEFAULT_URL
+    print(t("cli.title"))
+    print("-" * 60)
+    print(t("status.current_index", url=current))
+    note = effective_override_note(current)
+    if note:
+        print(note)
+    # 缓存排名立即显示；过期条目在后台刷新，不阻塞交互
+    health = load_health_cache(cfg_path)
+    candidates = benchmark_candidates(current)
+    items = format_cached_ranking(health.ranking(candidates))
+    if items:
+        print(t("cache.ranking", items=items))
+    stale = health.stale_urls(candidates)
+    if refresh_stale_async(health, candidates) is not None:
+        print(t("cache.refreshing", count=len(stale)))
+    # 集群推荐只读共享存储，新主机无需测速即可选用
+    fleet = fleet_recommendation()
+    if fleet:
+        print(format_fleet_recommendation(fleet))
+    print()
+    registry = get_registry()
+    for i, mirror in enumerate(registry, 1):
+        print("{0}. {1}: {2}".format(i, mirror.display_name(), mirror.url))
+    print("0. {0}".format(t("custom")))
+    if fleet:
+        print("F. {0}".format(t("fleet.apply")))
+    print("R. {0}".format(t("btn.restore_official")))
+    print("Q. quit")
+    while True:
+        try:
+            print()
+            print(t("cli.menu_fleet" if fleet else "cli.menu"))
+            choice = input(t("cli.prompt")).strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not choice:
+            print(t("cli.invalid"))
+            continue
+        if choice.lower() == "q":
+            break
+        if choice.lower() == "f" and fleet:
+            try:
+                switch_index_url(cfg_path, fleet["url"])
+                print(t("cli.saved", path=cfg_path, url=fleet["url"]))
+            except Exception as e:
+                print(t("fail.write_msg", err=e))
+            continue
+        if choice.lower() == "r":
+            try:
+                switch_index_url(cfg_path, DEFAULT_URL)
+                print(t("cli.restored"))
+            except Exception as e:
+                print(t("fail.restore_msg", err=e))
+            continue
+        if choice == "0":
+            url = input(t("cli.enter_custom")).strip()
+            if not is_valid_url(url):
+                print(t("cli.invalid_url"))
+                continue
+            try:
+                switch_index_url(cfg_path, url)
+                print(t("cli.saved", path=cfg_path, url=url))
+                health.add_custom(url)
+                health.save()
+            except Exception as e:
+                print(t("fail.write_msg", err=e))
+            continue
+        # 数字镜像
+        try:
+            idx = int(choice)
+            if not (1 <= idx <= len(registry)):
+                print(t("cli.invalid"))
+                continue
+            url = registry[idx - 1].url
+            switch_index_url(cfg_path, url)
+            print(t("cli.saved", path=cfg_path, url=url))
+        except ValueError:
+            print(t("cli.invalid"))
+        except Exception as e:
+            print(t("fail.write_msg", err=e))
+    # Windows 控制台停留
+    if os.name == "nt":
+        try:
+            input(t("cli.enter_to_exit"))
+        except Exception:
+            pass
+
+def run_benchmark_cli(apply=False):
+    """
+    --benchmark：并发测速所有镜像并输出排名；带 --apply 时写入最快的镜像，
+    再加 --fallbacks=N 时按排名追加 N 个 extra-index-url 并调整 timeout/retries，
+    加 --pip-cache-dir=DIR 时一并设置 pip 的缓存目录（--serve 的 --cache-dir 是代理自己的缓存）；
+    配置了集群存储时把结果导出到其中
+    """
+    cfg_path = get_user_pip_config_path()
+    current = read_current_index_url(cfg_path)
+    project = get_cli_option("--project", BENCH_PROJECT)
+    print(t("bench.title", project=project))
+    print("-" * 60)
+    print(t("bench.header"))
+    results = benchmark_mirrors(benchmark_candidates(current), project=project)
+    health = load_health_cache(cfg_path)
+    health.record_all(results)
+    exported = export_to_fleet(results)
+    if exported:
+        health.mark_exported(r["url"] for r in results)
+    health.evict()
+    try:
+        health.save()
+    except Exception:
+        pass
+    for rank, result in enumerate(results, 1):
+        print(format_benchmark_row(rank, result))
+    print()
+    if exported:
+        print(t("fleet.exported", count=exported, path=get_fleet_store_path()))
+    if not results or not results[0]["ok"]:
+        print(t("bench.none"))
+        return 1
+    if apply:
+        try:
+            fallbacks = get_cli_option("--fallbacks")
+            cache_dir = get_cli_option("--pip-cache-dir")
+            if fallbacks:
+                plan = plan_fallback_config(results, int(fallbacks))
+                write_pip_config(cfg_path, cache_dir=cache_dir, **plan)
+            else:
+                plan = {"index_url": results[0]["url"], "extra_index_urls": []}
+                write_pip_config(cfg_path, plan["index_url"], cache_dir=cache_dir)
+            print(t("bench.applied", path=cfg_path, url=plan["index_url"]))
+            for url in plan["extra_index_urls"]:
+                print("extra-index-url = {0}".format(url))
+        except Exception as e:
+            print(t("fail.write_msg", err=e))
+            return 1
+    return 0
+
+def pick_proxy_upstream(cfg_path, port):
+    """
+    代理上游：--upstream > 当前配置（若未指向代理自身）> 缓存排名第一 > 官方源
+    """
+    upstream = get_cli_option("--upstream")
+    if upstream:
+        return upstream
+    current = read_current_index_url(cfg_path)
+    u = urlparse(current)
+    if current and not (u.hostname in ("127.0.0.1", "localhost") and u.port == port):
+        return current
+    ranked = load_health_cache(cfg_path).ranking(get_registry().urls())
+    if ranked and ranked[0].get("last_ok"):
+        return ranked[0]["url"]
+    return DEFAULT_URL
+
+def pick_failover_upstreams(cfg_path):
+    """
+    故障切换的上游列表：--upstream=URL1,URL2,... 或注册表中的全部镜像（按缓存排名排序）
+    """
+    given = get_cli_option("--upstream")
+    if given:
+        return [u.strip() for u in given.split(",") if u.strip()]
+    urls = get_registry().urls()
+    ranked = [e["url"] for e in load_health_cache(cfg_path).ranking(urls)]
+    return ranked + [u for u in urls if normalize_url(u) not in [normalize_url(r) for r in ranked]]
+
+def run_serve_cli(apply=False):
+    """
+    --serve：启动本地缓存代理；带 --apply 时把 pip 指向该代理
+    可选 --port=3141 --upstream=URL --cache-dir=DIR --cache-size=MB
+    加 --metrics 时在同一端口提供 /metrics（Prometheus 文本格式）
+    加 --failover 时在多个镜像间按健康评分转发、对冲和熔断（--upstream 可用逗号分隔多个）
+    """
+    cfg_path = get_user_pip_config_path()
+    port = int(get_cli_option("--port", PROXY_PORT))
+    if "--failover" in sys.argv:
+        urls = pick_failover_upstreams(cfg_path)
+        upstream = FailoverUpstream(urls)
+        upstream_desc = ", ".join(urls)
+    else:
+        upstream = upstream_desc = pick_proxy_upstream(cfg_path, port)
+    cache_dir = get_cli_option("--cache-dir") or get_proxy_cache_dir()
+    budget = int(get_cli_option("--cache-size", PROXY_CACHE_BUDGET // 1024 ** 2)) * 1024 ** 2
+    try:
+        server = CachingIndexProxy((PROXY_HOST, port), upstream, ProxyCache(cache_dir, budget),
+                                   verbose="--verbose" in sys.argv)
+    except Exception as e:
+        print(t("serve.failed", err=e))
+        return 1
+    print(t("serve.started", url=server.index_url, upstream=upstream_desc, cache=cache_dir))
+    if apply:
+        try:
+            switch_index_url(cfg_path, server.index_url)
+            print(t("serve.applied", path=cfg_path))
+        except Exception as e:
+            print(t("fail.write_msg", err=e))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(t("serve.stopped"))
+        if server.failover:
+            print(t("failover.header"))
+            for row in server.failover.stats():
+                print("{0:<27} {1:>6} {2:>6} {3:>6} {4:>6}".format(
+                    mirror_display_name(row["url"]), row["won"], row["hedged"], row["tripped"], row["failures"]))
+    return 0
+
+def run_watch_cli():
+    """
+    --watch：守护模式，周期性轻量探测并在挑战者稳定更快时切换镜像
+      --interval=秒（默认 600，±20% 随机浮动）  --margin=百分比（默认 20）
+      --rounds=N（默认 3）  --samples=N（每轮每镜像探测次数，默认 3）
+      --json 每个决定输出一行 JSON
+    """
+    cfg_path = get_user_pip_config_path()
+    as_json = "--json" in sys.argv
+
+    def log(decision):
+        if as_json:
+            print(json.dumps(decision), flush=True)
+        else:
+            print(format_watch_decision(decision), flush=True)
+
+    watcher = MirrorWatcher(cfg_path,
+                            interval=float(get_cli_option("--interval", WATCH_INTERVAL)),
+                            margin=float(get_cli_option("--margin", WATCH_MARGIN * 100)) / 100,
+                            rounds=int(get_cli_option("--rounds", WATCH_ROUNDS)),
+                            samples=int(get_cli_option("--samples", WATCH_SAMPLES)),
+                            log=log)
+    current = read_current_index_url(cfg_path) or DEFAULT_URL
+    if not as_json:
+        print(t("watch.started", count=len(watcher.candidates(current)), interval=int(watcher.interval),
+                margin=int(round(watcher.margin * 100)), rounds=watcher.rounds, url=current), flush=True)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    if not as_json:
+        print(t("watch.stopped"))
+    return 0
+
+def run_auto_cli():
+    """
+    --auto：按当前网络选择镜像并写入配置（只切换 index-url）
+    已知网络直接使用缓存的胜出镜像；新网络先按 TCP 连接 RTT 预选，
+    再对前 --top=N（默认 3）个做完整测速。--refresh 忽略缓存重新选择
+    """
+    cfg_path = get_user_pip_config_path()
+    start = time.perf_counter()
+    report = auto_select_mirror(cfg_path, refresh="--refresh" in sys.argv,
+                                top=int(get_cli_option("--top", PRESELECT_TOP)))
+    if report["cached"]:
+        print(t("auto.cached", network=report["fingerprint"], name=mirror_display_name(report["url"])))
+    elif report["fleet"]:
+        print(t("auto.fleet", network=report["fingerprint"], name=mirror_display_name(report["url"]),
+                hosts=report["fleet"]["hosts"]))
+    else:
+        print(t("auto.new_network", network=report["fingerprint"]))
+        for r in report["preselect"]:
+            name = mirror_display_name(r["url"])
+            if r["ok"]:
+                print("{0:<27} {1:>6.1f} ms".format(name, r["rtt"] * 1000))
+            else:
+                print("{0:<27} {1}".format(name, t("bench.failed", err=r["error"])))
+    if not report["url"]:
+        print(t("bench.none"))
+        return 1
+    try:
+        switch_index_url(cfg_path, report["url"])
+        print(t("cli.saved", path=cfg_path, url=report["url"]))
+    except Exception as e:
+        print(t("fail.write_msg", err=e))
+        return 1
+    print(t("auto.elapsed", ms=int((time.perf_counter() - start) * 1000)))
+    return 0
+
+def run_prefetch_cli():
+    """
+    --prefetch：把 requirements/锁文件中每个项目的分发文件并行下载到本地 wheelhouse
+      --requirements=FILE 或 --packages=a,b==1.0  --dest=DIR（默认 ./wheelhouse）
+      --mirrors=K（默认 3，含已配置的索引）  --per-host=N（默认 4）  --json 输出 JSON
+    之后可离线安装：pip install --no-index --find-links=DIR -r FILE
+    """
+    cfg_path = get_user_pip_config_path()
+    req_path = get_cli_option("--requirements")
+    requirements = requirements_from_cli()
+    if not requirements:
+        print(t("fresh.no_packages"))
+        return 2
+    dest = get_cli_option("--dest", PREFETCH_DEST)
+    mirrors = prefetch_mirrors(cfg_path, int(get_cli_option("--mirrors", PREFETCH_MIRRORS)))
+    start = time.perf_counter()
+    report = prefetch(requirements, mirrors, dest, int(get_cli_option("--per-host", PREFETCH_PER_HOST)),
+                      parse_requirement_hashes(req_path) if req_path else None)
+    report["elapsed"] = round(time.perf_counter() - start, 3)
+    failed = [f for f in report["files"] if f["status"] == "failed"]
+    if "--json" in sys.argv:
+        print(json.dumps(report, indent=1))
+        return 1 if failed else 0
+    for f in report["files"]:
+        detail = mirror_display_name(f["mirror"]) if f["mirror"] else f["error"]
+        print("{0:<10} {1:<24} {2}  {3}".format(f["status"], f["project"], f["filename"] or "-", detail))
+    print()
+    for url, st in report["mirrors"].items():
+        if st["files"]:
+            print("{0:<27} {1:>4} {2:>8.2f} MB/s".format(
+                mirror_display_name(url), st["files"], st["bytes"] / max(st["seconds"], 1e-6) / 1e6))
+    counts = dict((k, sum(1 for f in report["files"] if f["status"] == k))
+                  for k in ("downloaded", "cached", "failed"))
+    print(t("prefetch.done", dest=dest, seconds=report["elapsed"], **counts))
+    if not failed and req_path:
+        print("pip install --no-index --find-links={0} -r {1}".format(dest, req_path))
+    return 1 if failed else 0
+
+def run_list_mirrors_cli():
+    """
+    --list-mirrors：列出注册表中的镜像（内置 + 注册表文件）
+      --region=R --tag=T 过滤  --probe 实时探测能力  --json 输出 JSON
+    """
+    registry = get_registry()
+    mirrors = registry.filter(get_cli_option("--region"), get_cli_option("--tag"))
+    rows = [m.to_dict() for m in mirrors]
+    if "--probe" in sys.argv and rows:
+        with ThreadPoolExecutor(max_workers=min(BENCH_MAX_WORKERS, len(rows))) as pool:
+            for row, caps in zip(rows, pool.map(lambda m: detect_capabilities(m.url), mirrors)):
+                row["capabilities"] = caps
+    if "--json" in sys.argv:
+        print(json.dumps({"registry": get_registry_path(), "errors": registry.errors, "mirrors": rows},
+                         indent=1, ensure_ascii=False))
+        return 0
+    print(t("registry.title", path=get_registry_path(), count=len(rows)))
+    for error in registry.errors:
+        print(t("registry.error", err=error))
+    print("-" * 60)
+    flag = {True: "+", False: "-", None: "?"}
+    for row in rows:
+        caps = " ".join("{0}{1}".format(flag[row["capabilities"][k]], k) for k in CAPABILITIES)
+        print("{0:<16} {1:<8} {2:<14} {3}  {4}".format(row["id"], row["region"], ",".join(row["tags"]),
+                                                      caps, row["url"]))
+    return 0
+
+def run_effective_cli():
+    """
+    --effective：按 pip 的优先级列出参与合并的配置文件与 PIP_* 环境变量，
+    以及最终生效的 [global] 设置和各自的来源  --json 输出 JSON
+    """
+    effective = read_effective_pip_config()
+    if "--json" in sys.argv:
+        print(json.dumps(effective, indent=1, ensure_ascii=False))
+        return 0
+    print(t("effective.title"))
+    for item in effective["files"]:
+        print("  {0} {1:<7} {2}".format("+" if item["loaded"] else "-", item["variant"], item["path"]))
+    print("-" * 60)
+    print(t("effective.values"))
+    if not effective["values"]:
+        print("  " + t("effective.none"))
+    for key in sorted(effective["values"]):
+        value = " ".join(effective["values"][key].split())
+        print("  {0} = {1}    [{2}]".format(key, value, effective["sources"][key]))
+    return 0
+
+def run_pip_cache_cli():
+    """
+    --pip-cache：pip 缓存目录的大小与命中率（按 http / wheels 分类）
+      --set=DIR        在用户配置中写入 cache-dir（如本地 SSD 或 tmpfs 路径）并创建该目录
+      --prune=MB       按最近使用时间淘汰旧条目，直到缓存不超过 MB
+      --workers=N      淘汰时并行删除的线程数
+      --scan-workers=N 并行扫描的线程数（默认 1，串行；缓存在网络盘上时调大）  --json 输出 JSON
+    """
+    cfg_path = get_user_pip_config_path()
+    as_json = "--json" in sys.argv
+    new_dir = get_cli_option("--set")
+    if new_dir:
+        new_dir = str(Path(new_dir).expanduser().resolve())
+        Path(new_dir).mkdir(parents=True, exist_ok=True)
+        write_pip_cache_dir(cfg_path, new_dir)
+        if not as_json:
+            print(t("pipcache.set", dir=new_dir, path=cfg_path))
+    root = effective_pip_cache_dir()
+    workers = int(get_cli_option("--workers", PIP_CACHE_WORKERS))
+    entries = pip_cache_entries(root, int(get_cli_option("--scan-workers", PIP_CACHE_SCAN_WORKERS)))
+    report = pip_cache_stats(root, entries)
+    prune = get_cli_option("--prune")
+    if prune is not None:
+        report["prune"] = prune_pip_cache(root, int(float(prune) * 1024 ** 2), workers, entries)
+    if as_json:
+        print(json.dumps(report, indent=1, ensure_ascii=False))
+        return 0
+    if not report["exists"]:
+        print(t("pipcache.missing", dir=root))
+        return 0
+    def rate(value):
+        return "-" if value is None else "{0:.0%}".format(value)
+    print(t("pipcache.summary", dir=root, mb=report["bytes"] / 1024.0 ** 2, files=report["files"],
+            rate=rate(report["hit_rate"])))
+    for kind, stat in sorted(report["kinds"].items()):
+        print(t("pipcache.kind", kind=kind, entries=stat["entries"], mb=stat["bytes"] / 1024.0 ** 2,
+                reused=stat["reused"], rate=rate(stat["hit_rate"])))
+    if "prune" in report:
+        pruned = report["prune"]
+        print(t("pipcache.pruned", entries=pruned["removed_entries"], mb=pruned["removed_bytes"] / 1024.0 ** 2,
+                before=pruned["before"] / 1024.0 ** 2, after=pruned["after"] / 1024.0 ** 2,
+                errors=pruned["errors"]))
+    return 0
+
+def run_fleet_cli():
+    """
+    --fleet：集群共享的测速结果（--fleet-store=PATH 或环境变量 PIP_MIRROR_FLEET_STORE）
+      --export         把健康缓存中未过期、且上次导出后有更新的测量导出到存储（--benchmark 会自动导出）
+      默认按站点汇总最近 --days=7 天的数据并给出推荐；--subnet=KEY 指定站点键，--all 列出全部站点
+      --fleet-site=NAME 显式指定本机所在站点（也可用环境变量 PIP_MIRROR_FLEET_SITE），否则按网段 + 网关推断
+      --apply          把本站点的推荐写入配置（只切换 index-url，不做任何探测）
+      --json           输出 JSON
+    """
+    path = get_fleet_store_path()
+    if not path:
+        print(t("fleet.no_store"))
+        return 2
+    cfg_path = get_user_pip_config_path()
+    if "--export" in sys.argv:
+        health = load_health_cache(cfg_path)
+        pending = health.unexported()
+        count = open_fleet_store(path).append(fleet_rows(pending))
+        health.mark_exported(e["url"] for e in pending)
+        try:
+            health.save()
+        except Exception:
+            pass
+        print(t("fleet.exported", count=count, path=path))
+        return 0
+    days = float(get_cli_option("--days", FLEET_WINDOW_DAYS))
+    host, subnet, network = fleet_location()
+    local = fleet_group({"subnet": get_cli_option("--subnet", subnet), "network": network})
+    summary = aggregate_fleet(open_fleet_store(path).rows(time.time() - days * 86400))
+    groups = sorted(summary) if "--all" in sys.argv else [local]
+    if "--json" in sys.argv:
+        print(json.dumps({"store": path, "local": local, "groups": {g: summary[g] for g in groups if g in summary}},
+                         indent=1))
+    else:
+        for group in groups:
+            if group not in summary:
+                print(t("fleet.none", group=group, days=int(days)))
+                continue
+            print(t("fleet.group", group=group, hosts=summary[group]["hosts"], samples=summary[group]["samples"]))
+            print(t("fleet.header"))
+            for i, s in enumerate(summary[group]["mirrors"]):
+                mark = "*" if i == 0 and _fleet_eligible(s) else " "
+                print("{0} {1:<27} {2:>6} {3:>5.0%} {4:>7} {5:>8}".format(
+                    mark, mirror_display_name(s["url"]), s["hosts"], s["ok_rate"],
+                    "{0:.0f}ms".format(s["median"] * 1000) if s["median"] is not None else "-",
+                    "{0:.0f}ms".format(s["trimmed_mean"] * 1000) if s["trimmed_mean"] is not None else "-"))
+            print()
+    if "--apply" in sys.argv:
+        group = summary.get(local)
+        if not group or not _fleet_eligible(group["mirrors"][0]):
+            print(t("bench.none"))
+            return 1
+        url = group["mirrors"][0]["url"]
+        try:
+            switch_index_url(cfg_path, url)
+            print(t("cli.saved", path=cfg_path, url=url))
+        except Exception as e:
+            print(t("fail.write_msg", err=e))
+            return 1
+    return 0
+
+def run_replay_cli():
+    """
+    --replay：回放一次 pip install 的请求序列，逐级提高并发，比较各镜像的延迟分位数、吞吐量与错误率
+      --trace=FILE           必填，pip install -v 的日志（- 为管道输入的标准输入），或 --save-trace 保存的 JSON
+      --save-trace=FILE      把解析出的请求序列保存为 JSON，便于重复使用
+      --concurrency=1,10,50  虚拟客户端数（每个客户端完整回放一遍序列）
+      --mirrors=URL1,URL2    只测这些镜像；默认注册表中的全部镜像，可用 --region / --tag 过滤
+      --file-bytes=N         分发文件只请求前 N 字节（Range），减轻对公共镜像的压力
+      --timeout=SEC          单个请求超时  --json 输出 JSON
+    """
+    path = get_cli_option("--trace")
+    if not path or (path == "-" and sys.stdin.isatty()):
+        print(t("replay.need_trace"))
+        return 2
+    trace = load_trace(path)
+    if not trace:
+        print(t("replay.no_trace"))
+        return 2
+    if get_cli_option("--save-trace"):
+        with open(get_cli_option("--save-trace"), "w", encoding="utf-8") as f:
+            json.dump({"requests": trace}, f, indent=1)
+    levels = [int(x) for x in get_cli_option("--concurrency", ",".join(map(str, REPLAY_CONCURRENCY))).split(",")
+              if x.strip()]
+    mirrors = [u for u in get_cli_option("--mirrors", "").split(",") if u.strip()]
+    if not mirrors:
+        mirrors = [m.url for m in get_registry().filter(get_cli_option("--region"), get_cli_option("--tag"))]
+    as_json = "--json" in sys.argv
+    index = sum(1 for r in trace if r["kind"] == "index")
+    if not as_json:
+        print(t("replay.title", count=len(trace), index=index, files=len(trace) - index,
+                levels=",".join(map(str, levels))))
+        print("-" * 60)
+
+    def show(url, result):
+        if result["concurrency"] == levels[0]:
+            name = mirror_display_name(url)
+            print(t("replay.mirror", name=name, url=url) if name != url else url)
+        print(format_load_row(result))
+
+    reports = replay_mirrors(trace, mirrors, levels, float(get_cli_option("--timeout", REPLAY_TIMEOUT)),
+                             int(get_cli_option("--file-bytes", 0)), on_result=None if as_json else show)
+    if as_json:
+        print(json.dumps({"trace": trace, "mirrors": reports}, indent=1))
+    else:
+        for report in reports:
+            if report["missing"]:
+                print(t("replay.missing", count=report["missing"]), "-", mirror_display_name(report["url"]))
+    return 0
+
+def run_batch_cli():
+    """
+    --batch：非交互地把同一镜像配置写入多个目标，输出 JSON 摘要
+      --url=URL               必填，index-url
+      --extra=URL1,URL2       可选，extra-index-url
+      --targets=A,B           配置文件路径或主目录（逗号分隔）
+      --targets-file=FILE     每行一个目标，FILE 为 - 时从标准输入读取
+      --layout=linux|macos|windows   解析主目录时使用的平台布局（默认当前平台）
+      --pip-cache-dir=DIR     同时写入 pip 的 cache-dir（如本地 SSD 或 tmpfs 路径）
+      --no-fsync              跳过 fsync，加快大批量写入
+    """
+    url = get_cli_option("--url", "")
+    if not is_valid_url(url):
+        print(json.dumps({"error": t("cli.invalid_url")}, ensure_ascii=False))
+        return 2
+    extras = [u for u in get_cli_option("--extra", "").split(",") if u.strip()]
+    targets = [x for x in get_cli_option("--targets", "").split(",") if x.strip()]
+    targets_file = get_cli_option("--targets-file")
+    if targets_file:
+        f = sys.stdin if targets_file == "-" else open(targets_file, "r", encoding="utf-8")
+        with f:
+            targets += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    layout = get_cli_option("--layout")
+    start = time.perf_counter()
+    paths = [resolve_batch_target(x, layout) for x in targets]
+    settings = {"index_url": url, "extra_index_urls": extras}
+    if get_cli_option("--pip-cache-dir"):
+        settings["cache_dir"] = get_cli_option("--pip-cache-dir")
+    summary = write_configs_parallel(paths, settings, fsync="--no-fsync" not in sys.argv)
+    summary["counts"] = {k: len(summary[k]) for k in ("changed", "unchanged", "failed")}
+    summary["elapsed"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(summary, indent=1, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+def run_freshness_cli(apply=False):
+    """
+    --freshness：检查各镜像相对参考索引的同步情况
+      --requirements=FILE 或 --packages=numpy,requests==2.31.0
+      --reference=URL（默认官方 PyPI）  --json 输出 JSON
+    结果写入健康缓存参与排名；带 --apply 时写入未落后镜像中评分最好的一个
+    """
+    cfg_path = get_user_pip_config_path()
+    requirements = requirements_from_cli()
+    if not requirements:
+        print(t("fresh.no_packages"))
+        return 2
+    reference = get_cli_option("--reference", DEFAULT_URL)
+    mirrors = benchmark_candidates(read_current_index_url(cfg_path))
+    reports = check_freshness(mirrors, requirements, reference)
+
+    health = load_health_cache(cfg_path)
+    for report in reports:
+        if report["checked"]:
+            health.record_freshness(report)
+    try:
+        health.save()
+    except Exception:
+        pass
+    if "--json" in sys.argv:
+        print(json.dumps(reports, indent=1))
+    else:
+        print(t("fresh.title", count=len(requirements), reference=reference))
+        print("-" * 60)
+        print(t("fresh.header"))
+        for report in reports:
+            print(format_freshness_row(report))
+    fresh = [e for e in health.ranking(mirrors + [reference])
+             if e.get("last_ok") and not health.is_behind(e)]
+    if fresh and apply:
+        try:
+            switch_index_url(cfg_path, fresh[0]["url"])
+            print(t("cli.saved", path=cfg_path, url=fresh[0]["url"]))
+        except Exception as e:
+            print(t("fail.write_msg", err=e))
+            return 1
+    return 0
+
+def requirements_from_cli():
+    """--requirements=FILE 或 --packages=a,b==1.0，返回 [(规范化项目名, 固定版本或 None)]"""
+    if get_cli_option("--requirements"):
+        return parse_requirements(get_cli_option("--requirements"))
+    requirements = []
+    for spec in get_cli_option("--packages", "").split(","):
+        m = _REQ_NAME_RE.match(spec)
+        if m:
+            requirements.append((canonical_project_name(m.group(1)), m.group(2)))
+    return requirements
+
+def get_cli_option(name, default=None):
+    """
+    读取 --name=value 或 --name value 形式的命令行参数
+    """
+    argv = sys.argv[1:]
+    for i, arg in enumerate(argv):
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1].strip()
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+    return default
+
+def setup_metrics():
+    """
+    --metrics               启用耗时指标（--serve 时在代理端口提供 /metrics）
+    --metrics-port=PORT     另起 /metrics 端点（GUI、--cli、--watch 等长时间运行的模式）
+    --metrics-json=FILE     退出时写出 JSON 快照（- 表示标准错误），用于单次运行
+    """
+    metrics_json = get_cli_option("--metrics-json")
+    metrics_port = get_cli_option("--metrics-port")
+    if not ("--metrics" in sys.argv or metrics_json or metrics_port):
+        return
+    enable_metrics()
+    if metrics_json:
+        atexit.register(write_metrics_json, metrics_json)
+    if metrics_port:
+        try:
+            server = serve_metrics(int(metrics_port))
+            print(t("metrics.serving", url="http://{0}:{1}/metrics".format(*server.server_address[:2])))
+        except Exception as e:
+            print(t("metrics.failed", err=e))
+
+# ================== 入口 ==================
+def main():
+    # 指标默认关闭；开启后各网络请求与配置读写按阶段计时
+    setup_metrics()
+
+    # --benchmark：测速所有镜像（--apply 写入最快的）
+    if "--benchmark" in sys.argv:
+        sys.exit(run_benchmark_cli(apply="--apply" in sys.argv))
+
+    # --freshness：检查镜像同步延迟（--apply 写入未落后的最快镜像）
+    if "--freshness" in sys.argv:
+        sys.exit(run_freshness_cli(apply="--apply" in sys.argv))
+
+    # --batch：批量写入多个配置文件（非交互，JSON 摘要）
+    if "--batch" in sys.argv:
+        sys.exit(run_batch_cli())
+
+    # --auto：按网络指纹选择镜像（已知网络直接使用缓存结果）
+    if "--auto" in sys.argv:
+        sys.exit(run_auto_cli())
+
+    # --list-mirrors：列出镜像注册表（--probe 探测能力）
+    if "--list-mirrors" in sys.argv:
+        sys.exit(run_list_mirrors_cli())
+
+    # --effective：显示 pip 实际生效的配置（各层文件 + PIP_* 环境变量）
+    if "--effective" in sys.argv:
+        sys.exit(run_effective_cli())
+
+    # --pip-cache：pip 缓存目录的统计、设置与按容量淘汰
+    if "--pip-cache" in sys.argv:
+        sys.exit(run_pip_cache_cli())
+
+    # --fleet：集群共享测速结果的导出、汇总与推荐
+    if "--fleet" in sys.argv:
+        sys.exit(run_fleet_cli())
+
+    # --replay：按 pip 日志回放请求序列，逐级提高并发比较各镜像
+    if "--replay" in sys.argv:
+        sys.exit(run_replay_cli())
+
+    # --prefetch：并行下载 requirements 中的分发文件到 wheelhouse
+    if "--prefetch" in sys.argv:
+        sys.exit(run_prefetch_cli())
+
+    # --watch：守护模式，镜像稳定更快时自动切换
+    if "--watch" in sys.argv:
+        sys.exit(run_watch_cli())
+
+    # --serve：本地缓存代理（--apply 让 pip 指向代理）
+    if "--serve" in sys.argv:
+        sys.exit(run_serve_cli(apply="--apply" in sys.argv))
+
+    # 命令行参数：--cli 强制命令行模式
     if "--cli" in sys.argv:
         run_cli()
         return
@@ -567,7 +5150,12 @@ def main():
     try:
         app = PipMirrorGUI()
         app.mainloop()
-    except tk.TclError:
+    except ImportError:
+        run_cli()
+    except Exception as e:
+        # 不能直接写 except tk.TclError：tkinter 尚未导入时 tk 为 None，会抛出 AttributeError
+        if tk is None or not isinstance(e, tk.TclError):
+            raise
         run_cli()
 
 if __name__ == "__main__":